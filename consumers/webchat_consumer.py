@@ -1,10 +1,14 @@
 """
 Lightweight WebChat WebSocket consumer.
 
-This consumer keeps a WebSocket connection per chat and periodically checks for
-new messages directly from the database. When it finds new messages it pushes
-them to the connected client, eliminating the need for the browser to issue
-HTTP polling requests every few seconds.
+This consumer keeps a WebSocket connection per chat and joins the
+``webchat_chat_<chat_id>`` group on the channel layer. Saved WebChat messages
+are published to that group after commit (see ``publish_message_to_chat``), so
+connected clients receive them without any per-socket database queries.
+
+When no channel layer is configured, the consumer can fall back to polling the
+database by setting ``UNICOM_WEBCHAT_POLLING_FALLBACK = True``. Otherwise the
+connection is refused and the browser client falls back to HTTP polling.
 
 Installation (only needed if you plan to enable websockets):
 
@@ -23,14 +27,26 @@ Minimal ASGI routing example:
 from __future__ import annotations
 
 import asyncio
+import json
+import logging
 from collections import deque
-from dataclasses import dataclass
+from datetime import timedelta
 from typing import Iterable, Optional, Tuple
 
+from django.conf import settings
+
+from unicom.services.webchat.serialize_message import (
+    MESSAGE_PAYLOAD_FIELDS,
+    SerializedMessage,
+    message_payload,
+    serialize_message_row,
+)
+
 try:
     from channels.generic.websocket import AsyncJsonWebsocketConsumer
     from channels.db import database_sync_to_async
     from channels.layers import get_channel_layer
+    from asgiref.sync import async_to_sync
 
     CHANNELS_AVAILABLE = True
 except ImportError:  # pragma: no cover - channels is optional
@@ -48,11 +64,7 @@ except ImportError:  # pragma: no cover - channels is optional
     def database_sync_to_async(func):  # type: ignore
         return func
 
-
-@dataclass
-class _SerializedMessage:
-    message_id: str
-    payload: dict
+logger = logging.getLogger(__name__)
 
 
 class WebChatConsumer(AsyncJsonWebsocketConsumer):
@@ -60,15 +72,15 @@ class WebChatConsumer(AsyncJsonWebsocketConsumer):
     Extremely small WebChat consumer that:
     - Accepts ``ws/unicom/webchat/<chat_id>/`` connections.
     - Verifies the authenticated/guest account can access the requested chat.
-    - Checks the database every five seconds without sending network traffic.
-    - Emits ``{"type": "new_message", "chat_id": ..., "message": {...}}`` only
-      when new messages exist.
-
-    The consumer does not depend on channel layers and therefore works with the
-    default in-memory Channels backend, keeping unicom's package easy to ship.
+    - Subscribes to the chat's channel layer group and forwards
+      ``webchat.new_message`` / ``webchat.message_updated`` events as
+      ``{"type": "new_message" | "message_updated", "chat_id": ..., "message": {...}}``
+      and streamed ``webchat.message_delta`` events as ``{"type": "message_delta", ...}``.
+    - Without a channel layer, polls the database only when
+      ``UNICOM_WEBCHAT_POLLING_FALLBACK`` is enabled; otherwise refuses the
+      connection (code 4503) so the client uses HTTP polling.
     """
 
-    poll_interval_seconds = 1
     warm_cache_limit = 100
 
     def __init__(self, *args, **kwargs):
@@ -82,7 +94,7 @@ class WebChatConsumer(AsyncJsonWebsocketConsumer):
         self.channel_id: Optional[int] = None
         self.channel = None
         self.account = None
-        self._polling_task: Optional[asyncio.Task] = None
+        self._polling = False
         self._recent_ids = deque(maxlen=self.warm_cache_limit)
         self._recent_id_set: set[str] = set()
 
@@ -93,13 +105,18 @@ class WebChatConsumer(AsyncJsonWebsocketConsumer):
 
     # ------------------------------------------------------------------ WS API
     async def connect(self):
-        """Validate access and start background polling."""
+        """Validate access and subscribe to pushed updates."""
         self.chat_id = self._extract_chat_id()
         self.channel_id = self._extract_channel_id()
         if not self.chat_id:
             await self.close(code=4400)  # bad request
             return
 
+        use_polling = self.channel_layer is None
+        if use_polling and not polling_fallback_enabled():
+            await self.close(code=4503)  # no channel layer to push through
+            return
+
         try:
             self.account = await self._get_account()
         except ValueError:
@@ -115,26 +132,40 @@ class WebChatConsumer(AsyncJsonWebsocketConsumer):
         group_name = self._group_name()
         if group_name and self.channel_layer:
             await self.channel_layer.group_add(group_name, self.channel_name)
-        await self._warm_seen_cache()
         await self.send_json({"type": "ready", "chat_id": self.chat_id})
 
-        # Start the periodic polling task.
-        self._polling_task = asyncio.create_task(self._poll_for_updates())
+        if use_polling:
+            chat_poll_registry.subscribe(self)
+            self._polling = True
 
     async def disconnect(self, code):
-        """Stop background polling gracefully."""
+        """Leave the chat group and the shared poller, if any."""
         group_name = self._group_name()
         if group_name and self.channel_layer:
             try:
                 await self.channel_layer.group_discard(group_name, self.channel_name)
             except Exception:
                 pass
-        if self._polling_task and not self._polling_task.done():
-            self._polling_task.cancel()
-            try:
-                await self._polling_task
-            except asyncio.CancelledError:
-                pass
+        if self._polling:
+            chat_poll_registry.unsubscribe(self)
+            self._polling = False
+
+    async def webchat_new_message(self, event):
+        """Receive a newly saved message via channel layer and forward to client."""
+        message_payload = event.get("message")
+        if not message_payload:
+            return
+        message_id = message_payload.get("id")
+        if message_id in self._recent_id_set:
+            return
+        self._remember_message_id(message_id)
+        await self.send_json(
+            {
+                "type": "new_message",
+                "chat_id": event.get("chat_id") or self.chat_id,
+                "message": message_payload,
+            }
+        )
 
     async def webchat_message_updated(self, event):
         """Receive a message update via channel layer and forward to client."""
@@ -150,6 +181,18 @@ class WebChatConsumer(AsyncJsonWebsocketConsumer):
             }
         )
 
+    async def webchat_message_delta(self, event):
+        """Forward a streamed text delta (see ``unicom.services.llm.streaming``)."""
+        await self.send_json(
+            {
+                "type": "message_delta",
+                "chat_id": event.get("chat_id") or self.chat_id,
+                "message_id": event["message_id"],
+                "offset": event["offset"],
+                "delta": event["delta"],
+            }
+        )
+
     async def receive_json(self, content, **kwargs):
         """
         No client commands are required for this consumer. Respond to optional
@@ -159,31 +202,15 @@ class WebChatConsumer(AsyncJsonWebsocketConsumer):
             await self.send_json({"type": "pong"})
 
     # -------------------------------------------------------------- Polling loop
-    async def _poll_for_updates(self):
-        """
-        Periodically check the database for new messages. Only messages that
-        have not been seen before are pushed to the client.
-        """
-        try:
-            while True:
-                await asyncio.sleep(self.poll_interval_seconds)
-                pending = await self._get_recent_messages()
-                fresh = self._filter_fresh_messages(pending)
-                if not fresh:
-                    continue
-
-                for item in fresh:
-                    await self.send_json(
-                        {
-                            "type": "new_message",
-                            "chat_id": self.chat_id,
-                            "message": item.payload,
-                        }
-                    )
-                    self._remember_message_id(item.message_id)
-        except asyncio.CancelledError:
-            # Task cancelled on disconnect – nothing else to do.
-            return
+    async def deliver_polled(self, items: Iterable[SerializedMessage]):
+        """Forward messages found by the shared chat poller, skipping seen ones."""
+        for item in self._filter_fresh_messages(items):
+            # Reuse the cached encoding rather than re-serializing per socket.
+            await self.send(
+                text_data='{"type": "new_message", "chat_id": %s, "message": %s}'
+                % (json.dumps(self.chat_id), item.encoded)
+            )
+            self._remember_message_id(item.message_id)
 
     # -------------------------------------------------------------- Cache utils
     def _extract_chat_id(self) -> Optional[str]:
@@ -200,18 +227,9 @@ class WebChatConsumer(AsyncJsonWebsocketConsumer):
         value = params.get("channel_id", [None])[0]
         return value
 
-    async def _warm_seen_cache(self):
-        """
-        Record the IDs of the most recent messages so the consumer does not
-        resend historical data immediately after connecting.
-        """
-        recent_ids = await self._get_recent_message_ids()
-        for message_id in recent_ids:
-            self._remember_message_id(message_id)
-
     def _filter_fresh_messages(
-        self, messages: Iterable[_SerializedMessage]
-    ) -> list[_SerializedMessage]:
+        self, messages: Iterable[SerializedMessage]
+    ) -> list[SerializedMessage]:
         """Return only messages that have not been delivered yet."""
         fresh = []
         for item in messages:
@@ -236,16 +254,10 @@ class WebChatConsumer(AsyncJsonWebsocketConsumer):
     # --------------------------------------------------------- DB interactions
     @database_sync_to_async
     def _get_account(self):
-        from django.apps import apps
         from unicom.services.webchat.get_or_create_account import get_or_create_account
+        from unicom.services.webchat.resolution_cache import get_webchat_channel
 
-        Channel = apps.get_model("unicom", "Channel")
-        qs = Channel.objects.filter(platform="WebChat", active=True)
-        if self.channel_id:
-            qs = qs.filter(id=self.channel_id)
-        channel = qs.first()
-        if not channel:
-            raise ValueError("No active WebChat channel found for WebChat platform.")
+        channel = get_webchat_channel(self.channel_id)
         self.channel = channel
 
         class ScopeRequest:
@@ -270,62 +282,153 @@ class WebChatConsumer(AsyncJsonWebsocketConsumer):
 
         return AccountChat.objects.filter(account=self.account, chat=chat).exists()
 
-    @database_sync_to_async
-    def _get_recent_message_ids(self) -> list[str]:
-        """
-        Fetch IDs for the most recent messages so the cache can be primed on
-        connection. IDs are returned in chronological order.
-        """
+
+class _ChatPoller:
+    """
+    Polls one chat for messages newer than a (timestamp, id) cursor and fans
+    them out to every subscribed consumer. The interval doubles while the chat
+    is quiet, up to ``UNICOM_WEBCHAT_POLL_MAX_INTERVAL`` seconds, and resets as
+    soon as something new arrives.
+
+    Timestamps are not commit order: a message can commit after a newer one
+    was already polled. Each poll therefore re-reads
+    ``UNICOM_WEBCHAT_POLL_OVERLAP_SECONDS`` (default 10) behind the cursor and
+    skips the ids it has already delivered from that window.
+    """
+
+    poll_interval_seconds = 1
+    poll_batch_limit = 100
+
+    def __init__(self, chat_id: str, channel):
+        self.chat_id = chat_id
+        self.channel = channel
+        self.subscribers: set = set()
+        self.cursor: Optional[Tuple] = None
+        self.seen: dict = {}  # id -> timestamp of delivered messages inside the overlap window
+        self.task: Optional[asyncio.Task] = None
+
+    async def run(self):
+        interval = self.poll_interval_seconds
+        max_interval = max(
+            interval, getattr(settings, "UNICOM_WEBCHAT_POLL_MAX_INTERVAL", 15)
+        )
+        try:
+            self.cursor = await self._get_latest_cursor()
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    pending = await self._get_messages_after_cursor()
+                except Exception:
+                    logger.exception("WebChat poll failed for chat %s", self.chat_id)
+                    pending = ()
+                if not pending:
+                    interval = min(interval * 2, max_interval)
+                    continue
+                interval = self.poll_interval_seconds
+                for consumer in list(self.subscribers):
+                    try:
+                        await consumer.deliver_polled(pending)
+                    except Exception:
+                        logger.exception("Failed to deliver polled messages for chat %s", self.chat_id)
+        except asyncio.CancelledError:
+            # Last subscriber left – nothing else to do.
+            return
+
+    def _chat_messages(self):
         from django.apps import apps
 
         Message = apps.get_model("unicom", "Message")
-        qs = (
-            Message.objects.filter(chat_id=self.chat_id, platform="WebChat", channel=self.channel)
-            .order_by("-timestamp")
-            .values_list("id", flat=True)[: self.warm_cache_limit]
+        return Message.objects.filter(
+            chat_id=self.chat_id, platform="WebChat", channel=self.channel
+        )
+
+    @staticmethod
+    def _overlap() -> timedelta:
+        return timedelta(seconds=getattr(settings, "UNICOM_WEBCHAT_POLL_OVERLAP_SECONDS", 10))
+
+    @database_sync_to_async
+    def _get_latest_cursor(self) -> Optional[Tuple]:
+        """Start polling after the newest existing message."""
+        latest = (
+            self._chat_messages()
+            .order_by("-timestamp", "-id")
+            .values_list("timestamp", "id")
+            .first()
         )
-        result = list(qs)
-        result.reverse()
-        return result
+        if latest is not None:
+            # Existing messages in the overlap window are not new either
+            self.seen = dict(
+                self._chat_messages()
+                .filter(timestamp__gte=latest[0] - self._overlap())
+                .values_list("id", "timestamp")
+            )
+        return latest
 
     @database_sync_to_async
-    def _get_recent_messages(self) -> Tuple[_SerializedMessage, ...]:
+    def _get_messages_after_cursor(self) -> Tuple[SerializedMessage, ...]:
         """
-        Retrieve a bounded window of recent messages (chronological order).
-        Returning a tuple keeps the result immutable for the async caller.
+        Fetch undelivered messages from the overlap window behind the cursor
+        onwards (chronological order) and advance it. Served by the
+        (chat, timestamp, id) index and only reads the columns needed for the
+        payload.
         """
-        from django.apps import apps
-
-        Message = apps.get_model("unicom", "Message")
-        messages = list(
-            Message.objects.filter(chat_id=self.chat_id, platform="WebChat", channel=self.channel)
-            .order_by("-timestamp")[: self.warm_cache_limit]
+        qs = self._chat_messages()
+        if self.cursor is not None:
+            qs = qs.filter(timestamp__gte=self.cursor[0] - self._overlap()).exclude(id__in=list(self.seen))
+        rows = list(
+            qs.order_by("timestamp", "id").values(*MESSAGE_PAYLOAD_FIELDS)[: self.poll_batch_limit]
         )
-        messages.reverse()
+        if rows:
+            newest = (rows[-1]["timestamp"], rows[-1]["id"])
+            self.cursor = max(self.cursor, newest) if self.cursor is not None else newest
+            self.seen.update((row["id"], row["timestamp"]) for row in rows)
+            since = self.cursor[0] - self._overlap()
+            self.seen = {pk: ts for pk, ts in self.seen.items() if ts >= since}
+        return tuple(serialize_message_row(row) for row in rows)
 
-        serialized = tuple(
-            _SerializedMessage(message_id=msg.id, payload=self._serialize_message(msg))
-            for msg in messages
-        )
-        return serialized
-
-    # ------------------------------------------------------------- Serialization
-    def _serialize_message(self, message) -> dict:
-        """Convert a Message model instance into the JSON payload expected by JS."""
-        return {
-            "id": message.id,
-            "text": message.text,
-            "html": message.html,
-            "is_outgoing": message.is_outgoing,
-            "sender_name": message.sender_name,
-            "timestamp": message.timestamp.isoformat(),
-            "media_type": message.media_type,
-            "media_url": message.media.url if message.media else None,
-            "reply_to_message_id": message.reply_to_message_id if message.reply_to_message else None,
-            "interactive_buttons": message.raw.get('interactive_buttons') if message.raw else None,
-            "progress_updates_for_user": (message.raw or {}).get('tool_call', {}).get('arguments', {}).get('progress_updates_for_user') if message.media_type == 'tool_call' else None,
-            "result_status": (message.raw or {}).get('tool_response', {}).get('result', {}).get('status') if message.media_type == 'tool_response' else None,
-        }
+
+class ChatPollRegistry:
+    """
+    Process-level registry running one poll task per chat for the polling
+    fallback, so database load scales with active chats rather than sockets.
+    Subscribers are reference counted; the task stops with the last one.
+    """
+
+    def __init__(self):
+        self._pollers: dict = {}
+
+    @staticmethod
+    def _key(consumer) -> Tuple:
+        return (consumer.channel.pk if consumer.channel else None, consumer.chat_id)
+
+    def subscribe(self, consumer) -> None:
+        key = self._key(consumer)
+        poller = self._pollers.get(key)
+        if poller is None:
+            poller = self._pollers[key] = _ChatPoller(consumer.chat_id, consumer.channel)
+            poller.task = asyncio.ensure_future(poller.run())
+        poller.subscribers.add(consumer)
+
+    def unsubscribe(self, consumer) -> None:
+        key = self._key(consumer)
+        poller = self._pollers.get(key)
+        if poller is None or consumer not in poller.subscribers:
+            return
+        poller.subscribers.discard(consumer)
+        if not poller.subscribers:
+            del self._pollers[key]
+            poller.task.cancel()
+
+    def subscriber_count(self, channel_id, chat_id: str) -> int:
+        poller = self._pollers.get((channel_id, chat_id))
+        return len(poller.subscribers) if poller else 0
+
+    @property
+    def active_chats(self) -> int:
+        return len(self._pollers)
+
+
+chat_poll_registry = ChatPollRegistry()
 
 
 def is_channels_available() -> bool:
@@ -333,6 +436,24 @@ def is_channels_available() -> bool:
     return CHANNELS_AVAILABLE
 
 
+def chat_push_available() -> bool:
+    """Whether events published to chat groups can reach WebSocket consumers."""
+    return CHANNELS_AVAILABLE and get_channel_layer() is not None
+
+
+def polling_fallback_enabled() -> bool:
+    """Whether consumers may poll the database when no channel layer exists."""
+    return bool(getattr(settings, "UNICOM_WEBCHAT_POLLING_FALLBACK", False))
+
+
+def _message_event(chat_id: str, message, created: bool) -> dict:
+    return {
+        "type": "webchat.new_message" if created else "webchat.message_updated",
+        "chat_id": chat_id,
+        "message": message_payload(message),
+    }
+
+
 async def broadcast_message_to_chat(chat_id: str, message) -> None:
     """Broadcast a message update to WebSocket clients subscribed to this chat."""
     if not CHANNELS_AVAILABLE:
@@ -340,27 +461,52 @@ async def broadcast_message_to_chat(chat_id: str, message) -> None:
     channel_layer = get_channel_layer()
     if channel_layer is None:
         return
-
-    payload = {
-        "id": message.id,
-        "text": message.text,
-        "html": message.html,
-        "is_outgoing": message.is_outgoing,
-        "sender_name": message.sender_name,
-        "timestamp": message.timestamp.isoformat(),
-        "media_type": message.media_type,
-        "media_url": message.media.url if message.media else None,
-        # Never dereference related objects in async context; use *_id fields only.
-        "reply_to_message_id": message.reply_to_message_id,
-        "interactive_buttons": message.raw.get("interactive_buttons") if message.raw else None,
-        "progress_updates_for_user": (message.raw or {}).get("tool_call", {}).get("arguments", {}).get("progress_updates_for_user") if message.media_type == "tool_call" else None,
-        "result_status": (message.raw or {}).get("tool_response", {}).get("result", {}).get("status") if message.media_type == "tool_response" else None,
-    }
     await channel_layer.group_send(
-        f"webchat_chat_{chat_id}",
-        {
-            "type": "webchat.message_updated",
-            "chat_id": chat_id,
-            "message": payload,
-        },
+        f"webchat_chat_{chat_id}", _message_event(chat_id, message, created=False)
     )
+
+
+def publish_message_to_chat(message, created: bool = False) -> None:
+    """
+    Publish a saved message to its chat group from synchronous code.
+
+    Called from the ``post_save`` signal after the transaction commits. Errors
+    are logged rather than raised so a channel layer outage never breaks saving.
+    """
+    if not CHANNELS_AVAILABLE:
+        return
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    chat_id = message.chat_id
+    try:
+        async_to_sync(channel_layer.group_send)(
+            f"webchat_chat_{chat_id}", _message_event(chat_id, message, created)
+        )
+    except Exception:
+        logger.exception("Failed to publish message %s to chat %s", message.id, chat_id)
+
+
+def publish_message_delta(chat_id: str, message_id: str, offset: int, delta: str) -> None:
+    """
+    Publish streamed text for a message: ``delta`` replaces the message text
+    from character ``offset`` on. Errors are logged, not raised.
+    """
+    if not CHANNELS_AVAILABLE:
+        return
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(
+            f"webchat_chat_{chat_id}",
+            {
+                "type": "webchat.message_delta",
+                "chat_id": chat_id,
+                "message_id": message_id,
+                "offset": offset,
+                "delta": delta,
+            },
+        )
+    except Exception:
+        logger.exception("Failed to publish delta for message %s to chat %s", message_id, chat_id)
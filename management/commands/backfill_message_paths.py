@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from unicom.services.message_tree import backfill_thread_paths
+
+
+class Command(BaseCommand):
+    help = 'Materialize Message.ancestor_ids and thread_depth for messages saved before those fields existed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chat', help='Only backfill messages of this chat id.')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows per bulk update.'
+        )
+
+    def handle(self, *args, **options):
+        updated = backfill_thread_paths(chat_id=options['chat'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Materialized thread paths for {updated} messages.'))
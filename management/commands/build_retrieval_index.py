@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from unicom.models import Channel
+from unicom.services.llm.retrieval import rebuild_channel_index, retrieval_enabled
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the retrieval index of stored messages (see UNICOM_RETRIEVAL_ENABLED).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--channel', type=int, action='append', help='Only rebuild this channel id (repeatable).')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Messages embedded per batch.')
+
+    def handle(self, *args, **options):
+        if not retrieval_enabled():
+            raise CommandError('Retrieval is disabled: set UNICOM_RETRIEVAL_ENABLED = True and install numpy.')
+        channel_ids = options['channel'] or list(Channel.objects.values_list('id', flat=True))
+        for channel_id in channel_ids:
+            indexed = rebuild_channel_index(channel_id, batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Channel {channel_id}: indexed {indexed} messages.'))
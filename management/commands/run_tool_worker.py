@@ -0,0 +1,50 @@
+import logging
+import signal
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+
+from unicom.services.llm.tool_worker import ToolWorker, get_tool_handlers
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        'Run registered tool handlers for pending ToolCalls. Calls are leased with SELECT ... FOR UPDATE '
+        'SKIP LOCKED, so several workers can run side by side.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Handler threads (default 8).')
+        parser.add_argument(
+            '--processes', type=int, default=0,
+            help='Run handlers in this many processes instead of threads (handlers must be importable).'
+        )
+        parser.add_argument('--tools', nargs='+', help='Only run these tools (default: all registered).')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds between polls when idle.')
+        parser.add_argument('--until-idle', action='store_true', help='Exit once no calls are running or claimable.')
+
+    def handle(self, *args, **options):
+        handlers = get_tool_handlers()
+        if options['tools']:
+            missing = set(options['tools']) - set(handlers)
+            if missing:
+                raise CommandError(f'No handler registered for: {", ".join(sorted(missing))}')
+        if not handlers:
+            raise CommandError('No tool handlers registered (see UNICOM_TOOL_HANDLERS).')
+
+        worker = ToolWorker(threads=options['threads'], processes=options['processes'], tools=options['tools'])
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        names = ', '.join(sorted(worker.handlers()))
+        self.stdout.write(self.style.SUCCESS(f'Tool worker {worker.worker_id} running: {names}'))
+        self.stdout.write(self.style.NOTICE('Press Ctrl+C to stop.'))
+        try:
+            worker.run(poll_interval=options['interval'], stop_event=stop, until_idle=options['until_idle'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Tool worker stopped by user.'))
+        finally:
+            # Unfinished calls keep their lease and are picked up again once it expires
+            worker.shutdown(wait=False)
+            self.stdout.write(self.style.SUCCESS(f'Tool worker shut down. {worker.stats}'))
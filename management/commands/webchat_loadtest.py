@@ -0,0 +1,77 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from unicom.services.webchat.loadtest import run_load_test
+
+
+class Command(BaseCommand):
+    help = (
+        'Simulate concurrent WebChat WebSocket clients against WebChatConsumer and report delivery '
+        'latency percentiles, CPU and queries per second. Requires Django Channels.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=100, help='Number of simulated sockets.')
+        parser.add_argument('--chats', type=int, default=10, help='Chats the clients are spread across.')
+        parser.add_argument('--rate', type=float, default=10.0, help='Injected messages per second.')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds to inject messages for.')
+        parser.add_argument(
+            '--mode',
+            choices=['push', 'poll'],
+            default='push',
+            help='push: channel layer delivery; poll: no layer, UNICOM_WEBCHAT_POLLING_FALLBACK pollers.'
+        )
+        parser.add_argument('--layer', choices=['memory', 'redis'], default='memory', help='Channel layer for push mode.')
+        parser.add_argument('--redis-url', help='Redis URL for --layer redis (default redis://127.0.0.1:6379/0).')
+        parser.add_argument('--keep-data', action='store_true', help='Keep the generated channel, chats and messages.')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON.')
+
+    def handle(self, *args, **options):
+        try:
+            import channels  # noqa: F401
+        except ImportError:
+            raise CommandError('Django Channels is required: pip install channels')
+        if options['layer'] == 'redis' and options['mode'] == 'push':
+            try:
+                import channels_redis  # noqa: F401
+            except ImportError:
+                raise CommandError('channels_redis is required for --layer redis: pip install channels-redis')
+        if options['clients'] < 1 or options['chats'] < 1 or options['rate'] <= 0:
+            raise CommandError('--clients, --chats and --rate must be positive.')
+
+        report = run_load_test(
+            clients=options['clients'],
+            chats=options['chats'],
+            rate=options['rate'],
+            duration=options['duration'],
+            mode=options['mode'],
+            layer=options['layer'],
+            redis_url=options['redis_url'],
+            keep_data=options['keep_data'],
+        ).as_dict()
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        latency = report['latency_ms']
+        qps = report['queries_per_second']
+        self.stdout.write(
+            f"mode={report['mode']} layer={report['layer']} clients={report['clients']} "
+            f"chats={report['chats']} duration={report['duration_s']}s"
+        )
+        self.stdout.write(
+            f"messages sent: {report['messages_sent']}  deliveries: {report['deliveries']}/"
+            f"{report['deliveries_expected']}  connect failures: {report['connect_failures']}"
+        )
+        self.stdout.write(
+            f"latency ms: p50={latency['p50']} p90={latency['p90']} p99={latency['p99']} "
+            f"max={latency['max']} mean={latency['mean']}"
+        )
+        self.stdout.write(f"cpu: {report['cpu_percent']}% of one core")
+        self.stdout.write(f"queries/s: injection={qps['injection']} delivery={qps['delivery']}")
+        if report['deliveries'] < report['deliveries_expected']:
+            self.stdout.write(self.style.WARNING('Some deliveries did not arrive before the drain deadline.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('All messages delivered.'))
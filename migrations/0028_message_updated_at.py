@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('unicom', '0027_message_chat_ts_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, help_text='Bumped on every save; versions cached payloads', null=True),
+        ),
+    ]
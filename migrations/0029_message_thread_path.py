@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:04
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('unicom', '0028_message_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='ancestor_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=500), blank=True, default=list, help_text='Materialized reply_to_message path, root-most first (nearest UNICOM_MESSAGE_PATH_MAX_DEPTH ancestors)', size=None),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='thread_depth',
+            field=models.PositiveIntegerField(blank=True, help_text='Number of reply_to_message hops to the thread root; null until materialized', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['ancestor_ids'], name='message_ancestor_ids_gin'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('unicom', '0029_message_thread_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, help_text='Bumped whenever the chat or one of its messages changes; drives WebChat ETags', null=True),
+        ),
+    ]
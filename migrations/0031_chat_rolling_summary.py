@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('unicom', '0030_chat_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='summary',
+            field=models.TextField(blank=True, default='', help_text='Running summary of the conversation up to the marker below'),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='summary_up_to_timestamp',
+            field=models.DateTimeField(blank=True, help_text='Timestamp of the last message covered by the summary', null=True),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='summary_up_to_message_id',
+            field=models.CharField(blank=True, default='', help_text='Id of the last message covered by the summary', max_length=500),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='summary_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='unsummarized_count',
+            field=models.PositiveIntegerField(default=0, help_text='Messages received after the summary marker'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('unicom', '0031_chat_rolling_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='toolcall',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0, help_text='Number of times a worker claimed this call'),
+        ),
+        migrations.AddField(
+            model_name='toolcall',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='toolcall',
+            name='leased_by',
+            field=models.CharField(blank=True, default='', help_text='Worker currently running this call', max_length=100),
+        ),
+    ]
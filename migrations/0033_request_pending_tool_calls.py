@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:44
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_pending_tool_calls(apps, schema_editor):
+    """Count each request's PENDING tool calls"""
+    Request = apps.get_model('unicom', 'Request')
+    ToolCall = apps.get_model('unicom', 'ToolCall')
+    pending = (
+        ToolCall.objects.filter(request=models.OuterRef('pk'), status='PENDING')
+        .order_by()
+        .values('request')
+        .annotate(n=models.Count('pk'))
+        .values('n')
+    )
+    Request.objects.filter(tool_calls__status='PENDING').distinct().update(
+        pending_tool_calls=Coalesce(models.Subquery(pending), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('unicom', '0032_tool_call_lease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='request',
+            name='pending_tool_calls',
+            field=models.PositiveIntegerField(default=0, help_text='Tool calls of this request still PENDING; the response that brings it to 0 creates the child request'),
+        ),
+        migrations.RunPython(
+            backfill_pending_tool_calls,
+            reverse_code=migrations.RunPython.noop,
+        ),
+    ]
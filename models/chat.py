@@ -25,6 +25,15 @@ class Chat(models.Model):
     last_message = models.ForeignKey('unicom.Message', null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
     last_outgoing_message = models.ForeignKey('unicom.Message', null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
     last_incoming_message = models.ForeignKey('unicom.Message', null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    updated_at = models.DateTimeField(auto_now=True, null=True, blank=True, help_text="Bumped whenever the chat or one of its messages changes; drives WebChat ETags")
+
+    # Rolling LLM summary (see unicom.services.llm.chat_summaries)
+    summary = models.TextField(blank=True, default='', help_text="Running summary of the conversation up to the marker below")
+    # Marker stored as values, not a FK, so deleting that message does not reset it
+    summary_up_to_timestamp = models.DateTimeField(null=True, blank=True, help_text="Timestamp of the last message covered by the summary")
+    summary_up_to_message_id = models.CharField(max_length=500, blank=True, default='', help_text="Id of the last message covered by the summary")
+    summary_updated_at = models.DateTimeField(null=True, blank=True)
+    unsummarized_count = models.PositiveIntegerField(default=0, help_text="Messages received after the summary marker")
     # accounts = models.ManyToManyField('unicom.Account', related_name="chats")
 
     def send_message(self, msg_dict: dict, user:User=None) -> Message:
@@ -133,5 +142,18 @@ class Chat(models.Model):
         
         return tuple(messages) if len(messages) > 1 else messages[0]
 
+    @property
+    def summary_marker(self):
+        """(timestamp, message id) of the last message covered by the summary, or None."""
+        if self.summary_up_to_timestamp is None:
+            return None
+        return (self.summary_up_to_timestamp, self.summary_up_to_message_id)
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields and 'updated_at' not in update_fields:
+            kwargs['update_fields'] = [*update_fields, 'updated_at']
+        super().save(*args, **kwargs)
+
     def __str__(self) -> str:
         return f"{self.platform}:{self.id} ({self.name})"
\ No newline at end of file
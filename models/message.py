@@ -1,9 +1,10 @@
 from __future__ import annotations
 from typing import TYPE_CHECKING
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from unicom.models.constants import channels
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.core.validators import validate_email
 import uuid
 import re
@@ -12,8 +13,6 @@ from bs4 import BeautifulSoup
 import base64
 from .fields import DedupFileField, only_delete_file_if_unused
 from unicom.services.get_public_origin import get_public_origin
-from openai import OpenAI
-from openai import OpenAIError
 from django.conf import settings
 from pydub import AudioSegment
 import io
@@ -22,12 +21,13 @@ if TYPE_CHECKING:
     from unicom.models import Channel
 
 def get_openai_client():
-    api_key = getattr(settings, 'OPENAI_API_KEY', None)
-    if not api_key:
-        raise OpenAIError(
-            "OPENAI_API_KEY is required only for LLM features such as Message.reply_using_llm()."
-        )
-    return OpenAI(api_key=api_key)
+    """
+    A process-wide OpenAI client with the SDK's default retries, for direct
+    use. LLM replies go through unicom.services.llm.dispatcher instead.
+    """
+    from openai import DEFAULT_MAX_RETRIES
+    from unicom.services.llm.dispatcher import get_client
+    return get_client(max_retries=DEFAULT_MAX_RETRIES)
 
 
 class Message(models.Model):
@@ -89,6 +89,16 @@ class Message(models.Model):
     media = models.FileField(upload_to='media/', blank=True, null=True)
     reply_to_message = models.ForeignKey(
         'self', on_delete=models.SET_NULL, null=True, blank=True, related_name='replies')
+    ancestor_ids = ArrayField(
+        base_field=models.CharField(max_length=500),
+        blank=True,
+        default=list,
+        help_text="Materialized reply_to_message path, root-most first (nearest UNICOM_MESSAGE_PATH_MAX_DEPTH ancestors)",
+    )
+    thread_depth = models.PositiveIntegerField(
+        null=True, blank=True,
+        help_text="Number of reply_to_message hops to the thread root; null until materialized"
+    )
     response_to_tool_call = models.ForeignKey(
         'unicom.ToolCall', on_delete=models.SET_NULL, null=True, blank=True, 
         related_name='response_messages',
@@ -98,6 +108,7 @@ class Message(models.Model):
     time_sent = models.DateTimeField(null=True, blank=True)
     time_delivered = models.DateTimeField(null=True, blank=True)
     time_seen = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, null=True, blank=True, help_text="Bumped on every save; versions cached payloads")
     sent = models.BooleanField(default=False)
     delivered = models.BooleanField(default=False)
     seen = models.BooleanField(default=False)
@@ -137,6 +148,47 @@ class Message(models.Model):
     )
     imap_uid = models.BigIntegerField(null=True, blank=True, db_index=True, help_text="IMAP UID for marking as seen")
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        extra_fields = ['updated_at']
+        moved = False
+        if self._thread_path_is_stale():
+            from unicom.services.message_tree import materialize_thread_path
+            old_path = (list(self.ancestor_ids or []), self.thread_depth)
+            self.ancestor_ids, self.thread_depth = materialize_thread_path(self.reply_to_message_id)
+            extra_fields += ['ancestor_ids', 'thread_depth']
+            # Re-parented: the replies below carry the old path
+            moved = not self._state.adding and old_path != (self.ancestor_ids, self.thread_depth)
+        if update_fields:
+            kwargs['update_fields'] = [*update_fields, *(f for f in extra_fields if f not in update_fields)]
+        if not moved:
+            super().save(*args, **kwargs)
+            return
+        from unicom.services.message_tree import rewrite_descendant_paths
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            rewrite_descendant_paths(self.id, self.ancestor_ids, self.thread_depth)
+
+    def _thread_path_is_stale(self):
+        if self.thread_depth is None:
+            return True
+        current_parent = self.ancestor_ids[-1] if self.ancestor_ids else None
+        return current_parent != self.reply_to_message_id
+
+    def get_ancestors(self):
+        """Materialized ancestors (within the path cap), in one indexed query."""
+        return Message.objects.filter(id__in=self.ancestor_ids)
+
+    def get_descendants(self):
+        """Replies to this message at any depth (within the path cap), via the GIN index."""
+        return Message.objects.filter(ancestor_ids__contains=[self.id])
+
+    def get_siblings(self):
+        """Other messages replying to the same parent, i.e. alternative branches."""
+        return Message.objects.filter(
+            chat_id=self.chat_id, reply_to_message_id=self.reply_to_message_id
+        ).exclude(pk=self.pk)
+
     def edit_original_message(self, msg_dict: dict) -> bool:
         """
         Edit the original message (for callback messages that want to update the button message).
@@ -200,9 +252,11 @@ class Message(models.Model):
         Returns the HTML content with inline images as base64 and Font Awesome icons converted to base64 PNG images.
         This is the most portable format as it doesn't require any external dependencies.
         """
+        if self.platform != 'Email':
+            return self.text
         from fa2svg.converter import to_inline_png_img
-        html = self.html_with_base64_images if self.platform == 'Email' else self.text
-        return to_inline_png_img(html) if self.platform == 'Email' else html
+        return self._cached_html_rendering(
+            'base64_icons', lambda images: to_inline_png_img(self.html_with_base64_images))
 
     @property
     def original_content_with_svg_icons(self):
@@ -210,9 +264,11 @@ class Message(models.Model):
         Returns the HTML content with inline images as base64 and Font Awesome icons converted to inline SVG.
         This preserves vector graphics quality but may increase the HTML size.
         """
+        if self.platform != 'Email':
+            return self.text
         from fa2svg.converter import revert_to_original_fa
-        html = self.html_with_base64_images if self.platform == 'Email' else self.text
-        return revert_to_original_fa(html) if self.platform == 'Email' else html
+        return self._cached_html_rendering(
+            'svg_icons', lambda images: revert_to_original_fa(self.html_with_base64_images))
 
     @property
     def original_content_with_cdn_icons(self):
@@ -220,52 +276,43 @@ class Message(models.Model):
         Returns the HTML content with inline images as base64 and Font Awesome icons using CDN.
         This is the lightest option but requires internet connection to load icons.
         """
-        html = self.html_with_base64_images if self.platform == 'Email' else self.text
-        if self.platform == 'Email' and html:
-            from bs4 import BeautifulSoup
-            soup = BeautifulSoup(html, 'html.parser')
-            # Add Font Awesome CDN if not already present
-            head = soup.find('head')
-            if not head:
-                head = soup.new_tag('head')
-                soup.insert(0, head)
-            if not soup.find('link', {'href': lambda x: x and 'font-awesome' in x}):
-                fa_link = soup.new_tag('link', rel='stylesheet', 
-                    href='https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.7.2/css/all.min.css')
-                head.append(fa_link)
-            return str(soup)
-        return html
+        if self.platform != 'Email':
+            return self.text
+        return self._cached_html_rendering('cdn_icons', self._render_with_cdn_icons)
+
+    def _render_with_cdn_icons(self, images):
+        html = self.html_with_base64_images
+        if not html:
+            return html
+        soup = BeautifulSoup(html, 'html.parser')
+        # Add Font Awesome CDN if not already present
+        head = soup.find('head')
+        if not head:
+            head = soup.new_tag('head')
+            soup.insert(0, head)
+        if not soup.find('link', {'href': lambda x: x and 'font-awesome' in x}):
+            fa_link = soup.new_tag('link', rel='stylesheet',
+                href='https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.7.2/css/all.min.css')
+            head.append(fa_link)
+        return str(soup)
 
     @property
     def html_with_base64_images(self):
         """
         Returns the HTML content with all inline image shortlinks replaced by their original base64 data, if available.
+        Renderings are memoized in unicom.services.html_render_cache.
         """
         if not self.html:
             return self.html
-        soup = BeautifulSoup(self.html, 'html.parser')
-        # Map shortlink src to base64 for all inline images
-        images = {img.get_short_id(): img for img in self.inline_images.all()}
-        for img_tag in soup.find_all('img'):
-            src = img_tag.get('src', '')
-            # Extract short id from src (e.g., /i/abc123 or full URL)
-            m = re.search(r'/i/([A-Za-z0-9]+)', src)
-            if m:
-                short_id = m.group(1)
-                image_obj = images.get(short_id)
-                if image_obj:
-                    # Read file and encode as base64
-                    data = image_obj.file.read()
-                    image_obj.file.seek(0)
-                    mime = 'image/png'  # Default
-                    if hasattr(image_obj.file, 'file') and hasattr(image_obj.file.file, 'content_type'):
-                        mime = image_obj.file.file.content_type
-                    elif image_obj.file.name:
-                        import mimetypes
-                        mime = mimetypes.guess_type(image_obj.file.name)[0] or 'image/png'
-                    b64 = base64.b64encode(data).decode('ascii')
-                    img_tag['src'] = f'data:{mime};base64,{b64}'
-        return str(soup)
+        from unicom.services.html_render_cache import inline_images_as_base64
+        return self._cached_html_rendering(
+            'base64_images', lambda images: inline_images_as_base64(self.html, images))
+
+    def _cached_html_rendering(self, variant, render):
+        if not self.html:
+            return self.html
+        from unicom.services.html_render_cache import get_or_render
+        return get_or_render(self, variant, self.html, self.inline_images, render)
 
     def debug_thread_chain(self, depth=10):
         """Debug method to see the thread chain"""
@@ -284,145 +331,178 @@ class Message(models.Model):
             cur = cur.reply_to_message
         return chain
 
-    def as_llm_chat(self, depth=129, mode="chat", system_instruction=None, multimodal=True):
+    def as_llm_message(self, multimodal=True):
         """
-        Returns a list of dicts for LLM chat APIs (OpenAI, Gemini, etc), each with 'role' and 'content'.
-        - depth: max number of messages to include
-        - mode: 'chat' (previous N in chat) or 'thread' (follow reply_to_message chain)
-        - system_instruction: if provided, prepends a system message
-        - multimodal: if True, includes media (image/audio) as content or URLs
+        This message as one LLM chat API message dict (see ``as_llm_chat``).
+        With ``multimodal``, images and audio are sent inline as base64.
         """
-        def msg_to_dict(msg):
-            # Determine role
-            if msg.is_outgoing is True:
-                role = "assistant"
-            elif msg.is_outgoing is False:
-                role = "user"
-            else:
-                role = "system"
-            # Determine content
-            content = None
-            if msg.media and multimodal and msg.media_type == "image":
-                # Prepare data URL for image
+        from unicom.services.llm.media_cache import media_payload
+
+        # Determine role
+        if self.is_outgoing is True:
+            role = "assistant"
+        elif self.is_outgoing is False:
+            role = "user"
+        else:
+            role = "system"
+        # Determine content
+        content = None
+        if self.media and multimodal and self.media_type == "image":
+            # Prepare data URL for image
+            b64 = None
+            mime = None
+            try:
+                import mimetypes
+                mime = mimetypes.guess_type(self.media.name)[0] or 'image/png'
+                b64 = media_payload(self.media, 'image', lambda data: data)
+            except Exception:
                 b64 = None
-                mime = None
+                mime = 'image/png'
+            data_url = f"data:{mime};base64,{b64}" if b64 else None
+            content_list = []
+            if data_url:
+                content_list.append({
+                    "type": "image_url",
+                    "image_url": {"url": data_url}
+                })
+            # If there is text/caption, add as separate dict
+            if self.text:
+                content_list.append({
+                    "type": "text",
+                    "text": self.text
+                })
+            content = content_list
+        elif self.media_type == "audio":
+            content_list = []
+            audio_processed = False
+            
+            # First check if we have an audio_id in raw field
+            if self.is_outgoing and self.raw and self.raw.get('audio_id'):
+                audio_id = self.raw['audio_id']
+                # For assistant messages, we include the audio_id as text since OpenAI doesn't accept audio references
+                # in assistant messages
+                content = self.text or ""
+                if content == "**Voice Message**":
+                    content = ""  # Don't include the default voice message text
+            # If no audio_id and we have media file, process it as before
+            elif self.media and multimodal:
+                # Convert audio to mp3 using pydub before base64 encoding
                 try:
-                    msg.media.open('rb')
-                    data = msg.media.read()
-                    msg.media.seek(0)
-                    import mimetypes, os
-                    mime = mimetypes.guess_type(msg.media.name)[0] or 'image/png'
-                    b64 = base64.b64encode(data).decode('ascii')
-                except Exception:
-                    b64 = None
-                    mime = 'image/png'
-                data_url = f"data:{mime};base64,{b64}" if b64 else None
-                content_list = []
-                if data_url:
-                    content_list.append({
-                        "type": "image_url",
-                        "image_url": {"url": data_url}
-                    })
-                # If there is text/caption, add as separate dict
-                if msg.text:
-                    content_list.append({
-                        "type": "text",
-                        "text": msg.text
-                    })
-                content = content_list
-            elif msg.media_type == "audio":
-                content_list = []
-                audio_processed = False
-                
-                # First check if we have an audio_id in raw field
-                if msg.is_outgoing and msg.raw and msg.raw.get('audio_id'):
-                    audio_id = msg.raw['audio_id']
-                    # For assistant messages, we include the audio_id as text since OpenAI doesn't accept audio references
-                    # in assistant messages
-                    content = msg.text or ""
-                    if content == "**Voice Message**":
-                        content = ""  # Don't include the default voice message text
-                # If no audio_id and we have media file, process it as before
-                elif msg.media and multimodal:
-                    # Convert audio to mp3 using pydub before base64 encoding
-                    try:
-                        msg.media.open('rb')
-                        data = msg.media.read()
-                        msg.media.seek(0)
-                        import os
-                        orig_ext = os.path.splitext(msg.media.name)[1][1:] or 'wav'
-                        
-                        # Handle oga extension for pydub
-                        format_ext = orig_ext
-                        if format_ext == 'oga':
-                            format_ext = 'ogg'
+                    orig_ext = os.path.splitext(self.media.name)[1][1:] or 'wav'
+                    
+                    # Handle oga extension for pydub
+                    format_ext = orig_ext
+                    if format_ext == 'oga':
+                        format_ext = 'ogg'
 
+                    def to_mp3(data):
                         audio = AudioSegment.from_file(io.BytesIO(data), format=format_ext)
                         mp3_io = io.BytesIO()
                         audio.export(mp3_io, format='mp3')
-                        mp3_data = mp3_io.getvalue()
-                        b64 = base64.b64encode(mp3_data).decode('ascii')
-                        content_list = []
-                        if msg.text and msg.text != "**Voice Message**":
-                            content_list.append({
-                                "type": "text",
-                                "text": msg.text
-                            })
+                        return mp3_io.getvalue()
+
+                    # Transcoded once per distinct file, see services/llm/media_cache.py
+                    b64 = media_payload(self.media, 'mp3', to_mp3)
+                    content_list = []
+                    if self.text and self.text != "**Voice Message**":
                         content_list.append({
-                            "type": "input_audio",
-                            "input_audio": {"data": b64, "format": "mp3"}
+                            "type": "text",
+                            "text": self.text
                         })
-                        content = content_list
-                        audio_processed = True
-                    except Exception as e:
-                        # Re-enable for debugging if needed
-                        # print(f"DEBUG: Could not process audio file for message {msg.id}. Error: {e}")
-                        content = msg.text or ""  # Fallback to text
-                else:
-                    content = msg.text or ""
-            elif msg.media_type == "html" and msg.html:
-                content = msg.html
-            elif msg.media_type == "tool_call":
-                # Tool call messages - format for LLM API
-                tool_call_data = msg.raw.get('tool_call', {})
-                # Convert arguments to JSON string if it's a dict
-                arguments = tool_call_data.get('arguments', {})
-                if isinstance(arguments, dict):
-                    import json
-                    arguments = json.dumps(arguments)
-                d = {
-                    "role": "assistant",  # Tool calls are always from assistant
-                    "content": None,      # Tool calls should have null content
-                    "tool_calls": [{
-                        "id": tool_call_data.get('id', f"call_{msg.id}"),
-                        "type": "function",
-                        "function": {
-                            "name": tool_call_data.get('name', ''),
-                            "arguments": arguments
-                        }
-                    }]
-                }
-                return d
-            elif msg.media_type == "tool_response":
-                # Tool response messages - format for LLM API
-                tool_response_data = msg.raw.get('tool_response', {})
-                d = {
-                    "role": "tool",
-                    "tool_call_id": tool_response_data.get('call_id', ''),
-                    "content": str(tool_response_data.get('result', msg.text or ''))
-                }
-                return d
+                    content_list.append({
+                        "type": "input_audio",
+                        "input_audio": {"data": b64, "format": "mp3"}
+                    })
+                    content = content_list
+                    audio_processed = True
+                except Exception as e:
+                    # Re-enable for debugging if needed
+                    # print(f"DEBUG: Could not process audio file for message {self.id}. Error: {e}")
+                    content = self.text or ""  # Fallback to text
             else:
-                content = msg.text or ""
-            d = {"role": role, "content": content}
+                content = self.text or ""
+        elif self.media_type == "html" and self.html:
+            content = self.html
+        elif self.media_type == "tool_call":
+            # Tool call messages - format for LLM API
+            tool_call_data = self.raw.get('tool_call', {})
+            # Convert arguments to JSON string if it's a dict
+            arguments = tool_call_data.get('arguments', {})
+            if isinstance(arguments, dict):
+                import json
+                arguments = json.dumps(arguments)
+            d = {
+                "role": "assistant",  # Tool calls are always from assistant
+                "content": None,      # Tool calls should have null content
+                "tool_calls": [{
+                    "id": tool_call_data.get('id', f"call_{self.id}"),
+                    "type": "function",
+                    "function": {
+                        "name": tool_call_data.get('name', ''),
+                        "arguments": arguments
+                    }
+                }]
+            }
+            return d
+        elif self.media_type == "tool_response":
+            # Tool response messages - format for LLM API
+            tool_response_data = self.raw.get('tool_response', {})
+            d = {
+                "role": "tool",
+                "tool_call_id": tool_response_data.get('call_id', ''),
+                "content": str(tool_response_data.get('result', self.text or ''))
+            }
             return d
+        else:
+            content = self.text or ""
+        d = {"role": role, "content": content}
+        return d
 
+    def as_llm_chat(self, depth=129, mode="chat", system_instruction=None, multimodal=True,
+                    token_budget=None, tokenizer=None, use_summary=False, retrieve=0):
+        """
+        Returns a list of dicts for LLM chat APIs (OpenAI, Gemini, etc), each with 'role' and 'content'.
+        - depth: max number of messages to include
+        - mode: 'chat' (previous N in chat) or 'thread' (follow reply_to_message chain)
+        - system_instruction: if provided, prepends a system message
+        - multimodal: if True, includes media (image/audio) as content or URLs
+        - token_budget: if set, additionally drop the oldest messages until the rest fit
+          in this many tokens, keeping tool calls with their responses
+          (see unicom.services.llm.context_builder)
+        - tokenizer: callable counting tokens in a string, used with token_budget
+        - use_summary: in chat mode, if the chat has a rolling summary (see
+          unicom.services.llm.chat_summaries), send it as a system message followed
+          only by the messages after the last summarized one
+        - retrieve: if set, add up to this many earlier messages from the sender's
+          chats that are similar to this one and not already included, as a system
+          message (see unicom.services.llm.retrieval; needs UNICOM_RETRIEVAL_ENABLED)
+        """
         messages = []
+        summary = None
+        retrieved = None
+
+        def retrieve_for(included):
+            from unicom.services.llm.retrieval import retrieval_message, retrieve_related
+            related = retrieve_related(self, retrieve, exclude_ids=[m.id for m in included])
+            return retrieval_message(related)["content"] if related else None
+
         if mode == "chat":
-            qs = self.chat.messages.order_by("timestamp")
-            idx = list(qs.values_list("id", flat=True)).index(self.id)
-            start = max(0, idx - depth + 1)
-            selected = list(qs[start:idx+1])
+            window = Message.objects.filter(chat_id=self.chat_id).filter(
+                models.Q(timestamp__lt=self.timestamp) | models.Q(timestamp=self.timestamp, id__lte=self.id)
+            )
+            if use_summary:
+                from unicom.models import Chat
+                chat = Chat.objects.get(pk=self.chat_id)
+                marker = chat.summary_marker
+                if chat.summary and marker and marker < (self.timestamp, self.id):
+                    summary = chat.summary
+                    window = window.filter(
+                        models.Q(timestamp__gt=marker[0]) | models.Q(timestamp=marker[0], id__gt=marker[1])
+                    )
+            # Keyset window: the `depth` messages up to and including this one,
+            # read backwards along the (chat, timestamp, id) index.
+            selected = list(window.order_by("-timestamp", "-id")[:depth])
+            selected.reverse()
             
             # Handle user interruption for tool response messages in chat mode
             if self.media_type == "tool_response":
@@ -443,18 +523,26 @@ class Message(models.Model):
                         # Found user interrupt - get conversation from that user message
                         return user_interrupt.as_llm_chat(depth=depth, mode=mode,
                                                         system_instruction=system_instruction,
-                                                        multimodal=multimodal)
+                                                        multimodal=multimodal,
+                                                        token_budget=token_budget,
+                                                        tokenizer=tokenizer,
+                                                        use_summary=use_summary,
+                                                        retrieve=retrieve)
             
+            if retrieve:
+                retrieved = retrieve_for(selected)
+            if token_budget is not None:
+                from unicom.services.llm.context_builder import fit_token_budget
+                selected = fit_token_budget(selected, token_budget, tokenizer, system_instruction, multimodal,
+                                            summary=summary, retrieved=retrieved)
             for m in selected:
-                messages.append(msg_to_dict(m))
+                messages.append(m.as_llm_message(multimodal))
         elif mode == "thread":
-            chain = []
-            cur = self
-            for _ in range(depth):
-                if not cur:
-                    break
-                chain.append(cur)
-                cur = cur.reply_to_message
+            from unicom.services.message_tree import thread_chain_ids
+            chain_ids = thread_chain_ids(self, depth)
+            by_id = Message.objects.in_bulk(chain_ids)
+            by_id[self.id] = self
+            chain = [by_id[i] for i in chain_ids if i in by_id]
             # Sort chronologically to preserve call/response order
             chain = sorted(chain, key=lambda m: m.timestamp)
             
@@ -512,10 +600,21 @@ class Message(models.Model):
                 except Exception:
                     pass
 
+            if retrieve:
+                retrieved = retrieve_for(chain)
+            if token_budget is not None:
+                from unicom.services.llm.context_builder import fit_token_budget
+                chain = fit_token_budget(chain, token_budget, tokenizer, system_instruction, multimodal,
+                                         retrieved=retrieved)
             for m in chain:
-                messages.append(msg_to_dict(m))
+                messages.append(m.as_llm_message(multimodal))
         else:
             raise ValueError(f"Unknown mode: {mode}")
+        if retrieved:
+            messages = [{"role": "system", "content": retrieved}] + messages
+        if summary:
+            from unicom.services.llm.context_builder import summary_message
+            messages = [summary_message(summary)] + messages
         if system_instruction:
             messages = [{"role": "system", "content": system_instruction}] + messages
         return messages
@@ -587,29 +686,59 @@ class Message(models.Model):
         
         return tuple(messages) if len(messages) > 1 else messages[0]
 
-    def reply_using_llm(self, model: str, depth=129, mode="chat", system_instruction=None, multimodal=True, user=None, voice="alloy", **kwargs):
+    def reply_using_llm(self, model: str, depth=129, mode="chat", system_instruction=None, multimodal=True, user=None, voice="alloy", stream=False, token_budget=None, use_summary=False, retrieve=0, **kwargs):
         """
         Wrapper: Calls as_llm_chat, OpenAI ChatCompletion API, and reply_with.
         - model: OpenAI model string
-        - depth, mode, system_instruction, multimodal: passed to as_llm_chat
+        - depth, mode, system_instruction, multimodal, token_budget, use_summary, retrieve: passed to as_llm_chat
         - user: Django user for reply_with
         - voice: voice name for audio response (default 'alloy')
+        - stream: for Telegram, and WebChat with a channel layer, create the reply
+          immediately and update it as tokens arrive
+          (see unicom.services.llm.streaming); ignored otherwise
         - kwargs: extra params for OpenAI API
         Returns: The Message object created by reply_with
+
+        Calls go through unicom.services.llm.dispatcher (shared client, concurrency
+        and token-per-minute limits, retries on rate limiting); streamed ones
+        through its stream_complete.
         """
-        # Prepare messages for LLM
-        messages = self.as_llm_chat(depth=depth, mode=mode, system_instruction=system_instruction, multimodal=multimodal)
+        from unicom.services.llm.dispatcher import complete
+        messages, openai_kwargs = self._llm_request(
+            depth, mode, system_instruction, multimodal, voice, token_budget, use_summary, retrieve, kwargs)
+        if stream and "modalities" not in openai_kwargs:
+            from unicom.services.llm.streaming import can_stream_to, stream_llm_reply
+            if can_stream_to(self):
+                return stream_llm_reply(self, model, messages, **openai_kwargs)
+        response = complete(model, messages, **openai_kwargs)
+        return self._reply_with_llm_response(response)
+
+    async def areply_using_llm(self, model: str, depth=129, mode="chat", system_instruction=None, multimodal=True, user=None, voice="alloy", token_budget=None, use_summary=False, retrieve=0, **kwargs):
+        """
+        Async reply_using_llm (without streaming): the completion is awaited
+        through unicom.services.llm.dispatcher.acomplete, so a burst of replies
+        queues on the dispatcher's limits instead of tying up threads.
+        """
+        from asgiref.sync import sync_to_async
+        from unicom.services.llm.dispatcher import acomplete
+        messages, openai_kwargs = await sync_to_async(self._llm_request)(
+            depth, mode, system_instruction, multimodal, voice, token_budget, use_summary, retrieve, kwargs)
+        response = await acomplete(model, messages, **openai_kwargs)
+        return await sync_to_async(self._reply_with_llm_response)(response)
+
+    def _llm_request(self, depth, mode, system_instruction, multimodal, voice, token_budget, use_summary, retrieve, kwargs):
+        """The chat messages and API params for reply_using_llm."""
+        messages = self.as_llm_chat(depth=depth, mode=mode, system_instruction=system_instruction, multimodal=multimodal,
+                                    token_budget=token_budget, use_summary=use_summary, retrieve=retrieve)
         # Determine if we need to request audio response
         openai_kwargs = dict(kwargs)
         if multimodal and self.media_type == "audio":
             openai_kwargs["modalities"] = ["text", "audio"]
             openai_kwargs["audio"] = {"voice": voice, "format": "opus"}
-        # Call OpenAI ChatCompletion API
-        response = get_openai_client().chat.completions.create(
-            model=model,
-            messages=messages,
-            **openai_kwargs
-        )
+        return messages, openai_kwargs
+
+    def _reply_with_llm_response(self, response):
+        """Reply to this message with the first choice of a chat completion."""
         # Get the LLM's reply (assume first choice)
         llm_msg = response.choices[0].message
         # Prepare reply dict
@@ -676,6 +805,12 @@ class Message(models.Model):
                 name='unicom_message_channel_imap_uid_unique',
             ),
         ]
+        indexes = [
+            # Incremental (timestamp, id) cursor reads per chat
+            models.Index(fields=['chat', 'timestamp', 'id'], name='message_chat_ts_id_idx'),
+            # Descendant lookups on the materialized thread path
+            GinIndex(fields=['ancestor_ids'], name='message_ancestor_ids_gin'),
+        ]
 
     def __str__(self) -> str:
         return f"{self.platform}:{self.chat.name}->{self.sender_name}: {self.text}"
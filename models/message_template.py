@@ -6,7 +6,6 @@ import base64
 from django.core.files.base import ContentFile
 from django.urls import reverse
 from unicom.services.get_public_origin import get_public_origin
-import openai
 from django.conf import settings
 from unicom.services.html_inline_images import html_base64_images_to_shortlinks
 from .fields import DedupFileField, only_delete_file_if_unused
@@ -67,29 +66,14 @@ class MessageTemplate(models.Model):
     def html_with_base64_images(self):
         """
         Returns the HTML content with all inline image shortlinks replaced by their original base64 data, if available.
+        Renderings are memoized in unicom.services.html_render_cache.
         """
         if not self.content:
             return self.content
-        soup = BeautifulSoup(self.content, 'html.parser')
-        images = {img.get_short_id(): img for img in getattr(self, 'inline_images', [])}
-        for img_tag in soup.find_all('img'):
-            src = img_tag.get('src', '')
-            m = re.search(r'/i/([A-Za-z0-9]+)', src)
-            if m:
-                short_id = m.group(1)
-                image_obj = images.get(short_id)
-                if image_obj:
-                    data = image_obj.file.read()
-                    image_obj.file.seek(0)
-                    mime = 'image/png'
-                    if hasattr(image_obj.file, 'file') and hasattr(image_obj.file.file, 'content_type'):
-                        mime = image_obj.file.file.content_type
-                    elif image_obj.file.name:
-                        import mimetypes
-                        mime = mimetypes.guess_type(image_obj.file.name)[0] or 'image/png'
-                    b64 = base64.b64encode(data).decode('ascii')
-                    img_tag['src'] = f'data:{mime};base64,{b64}'
-        return str(soup)
+        from unicom.services.html_render_cache import get_or_render, inline_images_as_base64
+        return get_or_render(
+            self, 'base64_images', self.content, self.inline_images,
+            lambda images: inline_images_as_base64(self.content, images))
 
     def save(self, *args, **kwargs):
         # First, save the template to ensure it has a PK
@@ -129,14 +113,17 @@ class MessageTemplate(models.Model):
                 # Save again to update content with shortlinks
                 super().save(update_fields=['content'])
 
-    def populate(self, html_prompt, custom_system_prompt=None, model="gpt-4o"):
+    def populate(self, html_prompt, custom_system_prompt=None, model="gpt-4o", cache=False):
         """
         Uses OpenAI GPT models to populate and customize the template content based on the given prompt.
         Returns the AI-generated content.
+        With cache=True the request is sent with temperature 0 and an identical earlier
+        result is reused (see unicom.services.llm.response_cache).
         """
+        from unicom.services.llm.dispatcher import complete
+
         if not settings.OPENAI_API_KEY:
             raise ValueError("OpenAI API key not configured in settings.")
-        openai.api_key = settings.OPENAI_API_KEY
         system_prompt = (
             "You are a template population function. Given a message template (HTML) and a user prompt, "
             "populate the template with relevant content, customizing it as per the user's instructions. "
@@ -153,12 +140,13 @@ class MessageTemplate(models.Model):
 {self.content}
 """
         try:
-            response = openai.chat.completions.create(
-                model=model,
-                messages=[
+            response = complete(
+                model,
+                [
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_content},
                 ],
+                **({"temperature": 0, "cache": True} if cache else {}),
             )
             return response.choices[0].message.content.strip()
         except Exception as e:
@@ -99,6 +99,10 @@ class Request(models.Model):
         default=0,
         help_text="Number of tool calls made from this request"
     )
+    pending_tool_calls = models.PositiveIntegerField(
+        default=0,
+        help_text="Tool calls of this request still PENDING; the response that brings it to 0 creates the child request"
+    )
     llm_calls_count = models.PositiveIntegerField(
         default=0,
         help_text="Number of LLM calls made for this request"
@@ -504,50 +508,65 @@ class Request(models.Model):
         
         Returns:
             List of ToolCall objects created
+
+        The tool call messages and ToolCall rows are each inserted with one
+        bulk_create (see unicom.services.llm.tool_calls.save_tool_calls).
         """
         import uuid
         from django.db import transaction
+        from unicom.services.llm.tool_calls import save_tool_calls
         from .tool_call import ToolCall
         
         if not tool_calls_data:
             return []
         
-        tool_calls = []
-        
+        calls = []
+        for call_data in tool_calls_data:
+            arguments = call_data.get('arguments', {}) or {}
+            calls.append({
+                'name': call_data['name'],
+                'arguments': arguments,
+                'logged_args': dict(arguments),
+                'id': call_data.get('id') or f"call_{uuid.uuid4().hex[:8]}",
+                'auto_params': call_data.pop('auto_params', []),
+            })
+
         with transaction.atomic():
-            for call_data in tool_calls_data:
-                tool_name = call_data['name']
-                arguments = call_data.get('arguments', {}) or {}
-                call_id = call_data.get('id') or f"call_{uuid.uuid4().hex[:8]}"
-                auto_params = call_data.pop('auto_params', [])
-                logged_args = dict(arguments)
-                
-                # Create tool call message for LLM context
-                tool_call_msg = self.message.log_tool_interaction(
-                    tool_call={"name": tool_name, "arguments": logged_args, "id": call_id}
-                )
-                
+            # Create the tool call messages for LLM context in one batch
+            tool_call_msgs = save_tool_calls(
+                self.message.chat,
+                [{"name": c['name'], "arguments": c['logged_args'], "id": c['id']} for c in calls],
+                reply_to_message=self.message,
+            )
+
+            tool_calls = []
+            for call, tool_call_msg in zip(calls, tool_call_msgs):
+                arguments = call['arguments']
                 # Capture progress update; strip only if auto-injected (not in original schema)
                 progress = arguments.get('progress_updates_for_user')
-                if 'progress_updates_for_user' in auto_params:
+                if 'progress_updates_for_user' in call['auto_params']:
                     arguments.pop('progress_updates_for_user', None)
 
-                tool_call = ToolCall.objects.create(
-                    call_id=call_id,
-                    tool_name=tool_name,
+                tool_calls.append(ToolCall(
+                    call_id=call['id'],
+                    tool_name=call['name'],
                     arguments=arguments,
                     progress_updates_for_user=progress,
                     request=self,
                     tool_call_message=tool_call_msg,  # Link to the tool call message
                     initial_user_message=self.message,  # Link to the original user message
                     status='PENDING'
-                )
-                
-                tool_calls.append(tool_call)
+                ))
+            ToolCall.objects.bulk_create(tool_calls)
             
-            # Update request status and count
+            # Update request status and counts; the pending counter is only
+            # changed in the database, under the row lock, by concurrent responses
             self.tool_call_count += len(tool_calls_data)
             self.status = 'PROCESSING'  # Reuse existing status
             self.save(update_fields=['tool_call_count', 'status'])
+            type(self).objects.filter(pk=self.pk).update(
+                pending_tool_calls=models.F('pending_tool_calls') + len(tool_calls)
+            )
+            self.refresh_from_db(fields=['pending_tool_calls'])
         
         return tool_calls
@@ -65,6 +65,12 @@ class ToolCall(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     started_at = models.DateTimeField(null=True, blank=True)
     completed_at = models.DateTimeField(null=True, blank=True)
+
+    # Worker lease (see unicom.services.llm.tool_worker); a PENDING call whose
+    # lease has expired can be claimed again
+    leased_by = models.CharField(max_length=100, blank=True, default='', help_text="Worker currently running this call")
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0, help_text="Number of times a worker claimed this call")
     
     class Meta:
         indexes = [
@@ -85,16 +91,39 @@ class ToolCall(models.Model):
         self.clean()
         super().save(*args, **kwargs)
     
+    def _lock_request(self):
+        """Lock and return this call's request; call inside a transaction, before locking the call."""
+        return self.request.__class__.objects.select_for_update().get(pk=self.request_id)
+
+    def _locked_status(self):
+        return type(self).objects.select_for_update().values_list('status', flat=True).get(pk=self.pk)
+
+    def _leave_pending(self, request):
+        """Decrement ``request``'s pending counter (held under its row lock) and refresh it."""
+        request.__class__.objects.filter(pk=request.pk, pending_tool_calls__gt=0).update(
+            pending_tool_calls=models.F('pending_tool_calls') - 1
+        )
+        request.refresh_from_db(fields=['pending_tool_calls'])
+
+    def _save_transition(self, update_fields):
+        """Save a status change, keeping the request's pending counter in step."""
+        with transaction.atomic():
+            request = self._lock_request()
+            previous = self._locked_status()
+            self.save(update_fields=update_fields)
+            if previous == 'PENDING' and self.status != 'PENDING':
+                self._leave_pending(request)
+
     def start_processing(self):
         """Mark tool call as in progress"""
         self.status = 'IN_PROGRESS'
         self.started_at = timezone.now()
-        self.save(update_fields=['status', 'started_at'])
+        self._save_transition(['status', 'started_at'])
     
     def mark_active(self):
         """Mark tool call as active for periodic responses"""
         self.status = 'ACTIVE'
-        self.save(update_fields=['status'])
+        self._save_transition(['status'])
     
     def mark_error(self, error_message=None):
         """Mark tool call as failed"""
@@ -103,13 +132,13 @@ class ToolCall(models.Model):
         self.completed_at = timezone.now()
         if error_message:
             self.error = error_message
-        self.save(update_fields=['status', 'completed_at', 'error', 'result_status'])
+        self._save_transition(['status', 'completed_at', 'error', 'result_status'])
     
     def interrupt(self):
         """Mark tool call as interrupted"""
         self.status = 'INTERRUPTED'
         self.completed_at = timezone.now()
-        self.save(update_fields=['status', 'completed_at'])
+        self._save_transition(['status', 'completed_at'])
     
     def respond(self, result, status: str = 'SUCCESS'):
         """
@@ -125,8 +154,12 @@ class ToolCall(models.Model):
         Behavior:
         - For PENDING status: Marks as COMPLETED, creates child request if final
         - For IN_PROGRESS status: Marks as COMPLETED, creates child request if final
-        - For ACTIVE status: Logs response but keeps ACTIVE, no child request
+        - For ACTIVE status: Logs response but keeps ACTIVE, never a child request
         - For other statuses: Raises ValueError
+
+        "Final" means no sibling call is still PENDING. The request's
+        pending_tool_calls counter is decremented under the request's row lock,
+        so when sibling responses race exactly one of them creates the child.
         """
         # Validate current status
         if self.status not in ['PENDING', 'IN_PROGRESS', 'ACTIVE']:
@@ -147,17 +180,23 @@ class ToolCall(models.Model):
 
         payload = format_payload(result, normalized_status)
         
-        # Create tool response message for LLM context - reply to the tool call message
-        tool_response_msg = self.tool_call_message.log_tool_interaction(
-            tool_response={
-                "call_id": self.call_id,
-                "result": payload,
-                "status": normalized_status
-            }
-        )
-        
-        # Handle response based on current status
         with transaction.atomic():
+            request = self._lock_request()
+            # Re-check under the lock: a concurrent respond may have completed this call
+            self.status = self._locked_status()
+            if self.status not in ['PENDING', 'IN_PROGRESS', 'ACTIVE']:
+                raise ValueError(f"Cannot respond to tool call with status: {self.status}")
+            was_pending = self.status == 'PENDING'
+
+            # Create tool response message for LLM context - reply to the tool call message
+            tool_response_msg = self.tool_call_message.log_tool_interaction(
+                tool_response={
+                    "call_id": self.call_id,
+                    "result": payload,
+                    "status": normalized_status
+                }
+            )
+
             # Only mark as completed if not ACTIVE (ACTIVE stays active for reusable buttons)
             if self.status != 'ACTIVE':
                 self.status = 'COMPLETED'
@@ -165,19 +204,22 @@ class ToolCall(models.Model):
                 self.result_status = normalized_status
                 self.save(update_fields=['status', 'completed_at', 'result_status'])
             else:
-                # Keep ACTIVE but still record the latest result_status
+                # Keep ACTIVE but still record the latest result_status. An ACTIVE
+                # call never triggers the fan-in, even when no sibling is PENDING;
+                # only a PENDING/IN_PROGRESS call completing can create the child.
                 self.result_status = normalized_status
                 self.save(update_fields=['result_status'])
-            
-            # Check if this is the final response (all PENDING tool calls now COMPLETED)
-            pending_calls = self.request.tool_calls.filter(status='PENDING').count()
-            
-            if pending_calls == 0:
+                return tool_response_msg, None
+
+            if was_pending:
+                self._leave_pending(request)
+
+            if request.pending_tool_calls == 0:
                 # This is the final response - create child request
                 # Use initial_request to get the root request for field propagation
-                initial_req = self.request.initial_request or self.request
+                initial_req = request.initial_request or request
                 
-                child_request = self.request.__class__.objects.create(
+                child_request = request.__class__.objects.create(
                     message=tool_response_msg,
                     # Propagate fields from initial request
                     account=initial_req.account,
@@ -187,13 +229,13 @@ class ToolCall(models.Model):
                     phone=initial_req.phone,
                     category=initial_req.category,  # Propagate category from initial request
                     # Set hierarchy fields
-                    parent_request=self.request,
+                    parent_request=request,
                     initial_request=initial_req,
                     display_text=f"Tool response: {str(result)[:100]}...",
                     status='PENDING',
                     metadata={
                         'created_from': 'tool_response',
-                        'parent_request_id': str(self.request.id),
+                        'parent_request_id': str(request.id),
                         'initial_request_id': str(initial_req.id),
                         'final_tool_call_id': self.call_id,
                         'tool_name': self.tool_name,
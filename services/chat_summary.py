@@ -11,9 +11,23 @@ def update_chat_summary(message):
     
     Additionally:
     - Automatically unarchives the chat if it receives a new message while archived
+    - Counts the message towards the chat's rolling LLM summary and schedules a
+      refresh when due (see unicom.services.llm.chat_summaries)
     """
-    chat = message.chat
-    
+    update_chat_summary_for_messages(message.chat, [message])
+
+
+def update_chat_summary_for_messages(chat, messages):
+    """
+    update_chat_summary for several new messages of ``chat`` (oldest first),
+    with a single lock and save of the chat row. Used by bulk inserts, which
+    bypass the post_save signal.
+    """
+    if not messages:
+        return
+    outgoing = [m for m in messages if m.is_outgoing]
+    incoming = [m for m in messages if m.is_outgoing is False]  # Explicitly check False to handle None case
+
     with transaction.atomic():
         # Lock the chat for update to prevent race conditions
         chat = type(chat).objects.select_for_update().get(pk=chat.pk)
@@ -22,21 +36,28 @@ def update_chat_summary(message):
         if chat.is_archived:
             chat.is_archived = False
         
-        # Update last message fields unconditionally since this is a new message
-        chat.last_message = message
-        if message.is_outgoing:
-            chat.last_outgoing_message = message
-        elif message.is_outgoing is False:  # Explicitly check False to handle None case
-            chat.last_incoming_message = message
+        # Update last message fields unconditionally since these are new messages
+        chat.last_message = messages[-1]
+        if outgoing:
+            chat.last_outgoing_message = outgoing[-1]
+        if incoming:
+            chat.last_incoming_message = incoming[-1]
             
         # Update first message fields only if they are null
-        if chat.first_message is None:
-            chat.first_message = message
+        if chat.first_message_id is None:
+            chat.first_message = messages[0]
             
-        if message.is_outgoing and chat.first_outgoing_message is None:
-            chat.first_outgoing_message = message
+        if outgoing and chat.first_outgoing_message_id is None:
+            chat.first_outgoing_message = outgoing[0]
             
-        if message.is_outgoing is False and chat.first_incoming_message is None:
-            chat.first_incoming_message = message
+        if incoming and chat.first_incoming_message_id is None:
+            chat.first_incoming_message = incoming[0]
+
+        # Count towards the next rolling LLM summary refresh
+        chat.unsummarized_count += len(messages)
             
-        chat.save() 
\ No newline at end of file
+        chat.save()
+
+        from unicom.services.llm.chat_summaries import needs_refresh, schedule_summary_refresh
+        if needs_refresh(chat):
+            schedule_summary_refresh(chat.pk)
@@ -0,0 +1,137 @@
+"""
+Memoization for HTML renderings that inline images as base64.
+
+``Message.html_with_base64_images``, the ``original_content_with_*`` variants
+and ``MessageTemplate.html_with_base64_images`` parse the HTML and read every
+inline image from storage. Renderings are cached per process, keyed by
+(model, pk, variant, HTML digest, inline image signature) so any change to the
+HTML or to the inline images produces a new key. Stale entries are dropped by
+the signal handlers in ``unicom.signals`` and by size-bounded LRU eviction
+(``UNICOM_HTML_RENDER_CACHE_MAX_BYTES``, default 64 MB).
+"""
+import base64
+import hashlib
+import mimetypes
+import re
+import threading
+from collections import OrderedDict
+
+from bs4 import BeautifulSoup
+from django.conf import settings
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class RenderCache:
+    """Thread-safe LRU of rendered strings bounded by total size."""
+
+    def __init__(self, max_bytes=None):
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._keys_by_owner = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def max_bytes(self):
+        if self._max_bytes is not None:
+            return self._max_bytes
+        return getattr(settings, 'UNICOM_HTML_RENDER_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)
+
+    @property
+    def size(self):
+        return self._size
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        cost = len(value)
+        if cost > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._discard(key)
+            self._entries[key] = value
+            self._keys_by_owner.setdefault(key[:2], set()).add(key)
+            self._size += cost
+            while self._size > self.max_bytes and self._entries:
+                self._discard(next(iter(self._entries)))
+
+    def evict_owner(self, label, pk):
+        """Drop every rendering of one object."""
+        with self._lock:
+            for key in list(self._keys_by_owner.get((label, pk), ())):
+                self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_owner.clear()
+            self._size = 0
+
+    def _discard(self, key):
+        value = self._entries.pop(key)
+        self._size -= len(value)
+        owner_keys = self._keys_by_owner.get(key[:2])
+        if owner_keys is not None:
+            owner_keys.discard(key)
+            if not owner_keys:
+                del self._keys_by_owner[key[:2]]
+
+
+render_cache = RenderCache()
+
+
+def get_or_render(owner, variant, html, inline_images, render):
+    """
+    Return the cached ``variant`` rendering of ``html`` for ``owner``.
+
+    ``inline_images`` is the owner's inline image manager; only (pk, hash, name)
+    is queried to build the key. On a miss ``render(images)`` is called with the
+    inline image objects and its result is stored.
+    """
+    if owner.pk is None:
+        # Unsaved objects cannot have inline images yet.
+        return render([])
+    signature = tuple(inline_images.order_by('pk').values_list('pk', 'hash', 'file'))
+    digest = hashlib.sha256(html.encode('utf-8')).hexdigest()
+    key = (owner._meta.label, owner.pk, variant, digest, signature)
+    rendered = render_cache.get(key)
+    if rendered is None:
+        rendered = render(list(inline_images.all()))
+        if rendered is not None:
+            render_cache.set(key, rendered)
+    return rendered
+
+
+def inline_images_as_base64(html, images, shortlink_pattern=r'/i/([A-Za-z0-9]+)'):
+    """Replace inline image shortlinks in ``html`` with base64 data URLs."""
+    soup = BeautifulSoup(html, 'html.parser')
+    images_by_short_id = {img.get_short_id(): img for img in images}
+    for img_tag in soup.find_all('img'):
+        src = img_tag.get('src', '')
+        m = re.search(shortlink_pattern, src)
+        if not m:
+            continue
+        image_obj = images_by_short_id.get(m.group(1))
+        if not image_obj:
+            continue
+        image_obj.file.open('rb')
+        try:
+            data = image_obj.file.read()
+        finally:
+            image_obj.file.close()
+        mime = mimetypes.guess_type(image_obj.file.name)[0] or 'image/png'
+        b64 = base64.b64encode(data).decode('ascii')
+        img_tag['src'] = f'data:{mime};base64,{b64}'
+    return str(soup)
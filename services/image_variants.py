@@ -0,0 +1,164 @@
+"""
+On-demand resized image variants.
+
+Inline images (``EmailInlineImage`` / ``MessageTemplateInlineImage``) and
+``Message.media`` images are stored at their original size. This module
+generates resized WebP or JPEG derivatives with Pillow and stores them in the
+default storage under ``image_variants/`` keyed by (source hash, width, format),
+so each variant is only ever rendered once.
+
+Requested widths are snapped to a small set of buckets
+(``UNICOM_IMAGE_VARIANT_WIDTHS``) so arbitrary ``?w=`` values cannot be used to
+fill the storage with derivatives.
+"""
+import hashlib
+import io
+import logging
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils.crypto import salted_hmac
+from django.urls import reverse
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - Pillow is optional
+    Image = None
+    ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VARIANT_WIDTHS = (64, 128, 256, 480, 768, 1024, 1600)
+VARIANT_PREFIX = 'image_variants'
+VARIANT_CONTENT_TYPES = {
+    'webp': 'image/webp',
+    'jpeg': 'image/jpeg',
+}
+
+
+def is_available() -> bool:
+    """Return True when Pillow is installed and variants can be generated."""
+    return Image is not None
+
+
+def get_variant_widths() -> tuple:
+    widths = getattr(settings, 'UNICOM_IMAGE_VARIANT_WIDTHS', DEFAULT_VARIANT_WIDTHS)
+    return tuple(sorted(int(w) for w in widths))
+
+
+def snap_width(width) -> int:
+    """Round a requested width up to the nearest configured bucket."""
+    widths = get_variant_widths()
+    try:
+        width = int(width)
+    except (TypeError, ValueError):
+        return widths[-1]
+    for bucket in widths:
+        if bucket >= width:
+            return bucket
+    return widths[-1]
+
+
+def choose_variant_format(accept_header: str) -> str:
+    """Serve WebP to clients that advertise it, JPEG to everyone else."""
+    if accept_header and 'image/webp' in accept_header:
+        return 'webp'
+    return 'jpeg'
+
+
+def media_token(file_name: str) -> str:
+    """
+    Short HMAC of a stored file name, keyed with SECRET_KEY. Message media
+    variants require it so that neither message ids nor guessed file names
+    can be used to enumerate media.
+    """
+    return salted_hmac('unicom.media_token', file_name, algorithm='sha256').hexdigest()[:16]
+
+
+def source_hash_for(file_field, content_hash=None) -> str:
+    """Content hash when the model tracks one, otherwise a hash of the stored name."""
+    if content_hash:
+        return content_hash
+    return hashlib.sha256(file_field.name.encode('utf-8')).hexdigest()
+
+
+def variant_name(source_hash: str, width: int, fmt: str) -> str:
+    ext = 'jpg' if fmt == 'jpeg' else fmt
+    return f"{VARIANT_PREFIX}/{source_hash[:2]}/{source_hash}_{width}.{ext}"
+
+
+def render_variant(data: bytes, width: int, fmt: str) -> bytes:
+    """Resize image bytes to ``width`` (never upscaling) and encode as ``fmt``."""
+    quality = getattr(settings, 'UNICOM_IMAGE_VARIANT_QUALITY', 80)
+    with Image.open(io.BytesIO(data)) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.width > width:
+            height = max(1, round(img.height * width / img.width))
+            img = img.resize((width, height), Image.LANCZOS)
+        if fmt == 'jpeg':
+            if img.mode in ('RGBA', 'LA', 'P'):
+                img = img.convert('RGBA')
+                background = Image.new('RGB', img.size, (255, 255, 255))
+                background.paste(img, mask=img.split()[-1])
+                img = background
+            elif img.mode != 'RGB':
+                img = img.convert('RGB')
+        elif img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA')
+        out = io.BytesIO()
+        img.save(out, format=fmt.upper(), quality=quality)
+        return out.getvalue()
+
+
+def get_or_create_variant(file_field, source_hash: str, width: int, fmt: str):
+    """
+    Return the storage name of the (source_hash, width, fmt) variant, rendering
+    and storing it first if needed. Returns None when the variant cannot be
+    produced (Pillow missing, file unreadable or not a raster image).
+    """
+    if not is_available() or not file_field:
+        return None
+    name = variant_name(source_hash, width, fmt)
+    if default_storage.exists(name):
+        return name
+    try:
+        file_field.open('rb')
+        try:
+            data = file_field.read()
+        finally:
+            file_field.close()
+        rendered = render_variant(data, width, fmt)
+    except Exception as e:
+        logger.warning("Could not render %spx variant of %s: %s", width, file_field.name, e)
+        return None
+    # Storage may pick a different name if another worker won the race; the
+    # content is identical, so either file is fine.
+    return default_storage.save(name, ContentFile(rendered))
+
+
+def inline_image_variant_url(image, width: int) -> str:
+    """Relative URL of a resized variant for an inline image object."""
+    from unicom.services.html_inline_images import base62_encode
+    path = reverse('inline_image', kwargs={'shortid': base62_encode(image.pk)})
+    return f"{path}?w={snap_width(width)}"
+
+
+def message_media_variant_url(message_id: str, media_name: str, width: int):
+    """
+    Relative URL of a resized variant of ``Message.media``. Works from plain
+    field values so it can be used with ``.values()`` rows and in async code.
+    """
+    if not media_name:
+        return None
+    path = reverse('message_media_variant', kwargs={'message_id': message_id})
+    return f"{path}?w={snap_width(width)}&t={media_token(media_name)}"
+
+
+
+def message_thumbnail_url(message_id: str, media_name: str, media_type: str, width=None):
+    """Thumbnail URL for image messages (``UNICOM_THUMBNAIL_WIDTH``, default 480px)."""
+    if media_type != 'image' or not media_name:
+        return None
+    width = width or getattr(settings, 'UNICOM_THUMBNAIL_WIDTH', 480)
+    return message_media_variant_url(message_id, media_name, width)
@@ -0,0 +1,181 @@
+"""
+Rolling conversation summaries stored on ``Chat``.
+
+``Chat.summary`` covers the conversation up to the marker
+(``summary_up_to_timestamp``, ``summary_up_to_message_id``), and
+``Chat.unsummarized_count`` counts the messages after it (incremented by
+``update_chat_summary`` on every new message). Once
+``UNICOM_CHAT_SUMMARY_KEEP_RECENT`` + ``UNICOM_CHAT_SUMMARY_EVERY`` messages
+(default 10 + 20) are unsummarized, a refresh is started after the
+transaction commits, in a background thread unless
+``UNICOM_CHAT_SUMMARY_ASYNC`` is False. The refresh folds everything but the
+newest ``KEEP_RECENT`` messages into the summary, in batches of
+``SUMMARY_BATCH_SIZE``.
+
+``as_llm_chat(use_summary=True)`` then sends the summary as a system message
+followed only by the messages after the marker.
+
+The summarizer is pluggable: ``UNICOM_CHAT_SUMMARIZER`` is a callable or its
+dotted path, called as ``summarizer(previous_summary, messages)`` with the
+old summary text ('' at first) and a chronological list of ``Message``
+objects, returning the new summary. ``openai_summarizer`` calls
+``UNICOM_CHAT_SUMMARY_MODEL`` through the LLM dispatcher. Summaries are
+disabled while no summarizer is configured.
+"""
+import logging
+import threading
+
+from django.apps import apps
+from django.conf import settings
+from django.db import close_old_connections, models, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_BATCH_SIZE = 200
+
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def get_summarizer():
+    summarizer = getattr(settings, 'UNICOM_CHAT_SUMMARIZER', None)
+    if isinstance(summarizer, str):
+        summarizer = import_string(summarizer)
+    return summarizer
+
+
+def summary_every():
+    return getattr(settings, 'UNICOM_CHAT_SUMMARY_EVERY', 20)
+
+
+def keep_recent():
+    return getattr(settings, 'UNICOM_CHAT_SUMMARY_KEEP_RECENT', 10)
+
+
+def _transcript_line(message):
+    if message.media_type == 'tool_call':
+        call = (message.raw or {}).get('tool_call', {})
+        return f"[tool call] {call.get('name', '')}({call.get('arguments', {})})"
+    if message.media_type == 'tool_response':
+        result = (message.raw or {}).get('tool_response', {}).get('result', message.text)
+        return f"[tool result] {result}"
+    speaker = 'Assistant' if message.is_outgoing else message.sender_name or 'User'
+    text = message.text or ''
+    if message.media_type in ('image', 'audio') and message.media:
+        text = f"[{message.media_type}] {text}"
+    return f"{speaker}: {text}"
+
+
+def openai_summarizer(previous_summary, messages):
+    """Summarize through the LLM dispatcher ``Message.reply_using_llm`` uses."""
+    from unicom.services.llm.dispatcher import complete
+
+    transcript = "\n".join(_transcript_line(m) for m in messages)
+    prompt = (
+        "Update the running summary of a conversation with the new messages below. "
+        "Keep names, facts, decisions, open questions and commitments; drop small talk. "
+        "Reply with the updated summary only.\n\n"
+        f"Current summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}"
+    )
+    response = complete(
+        getattr(settings, 'UNICOM_CHAT_SUMMARY_MODEL', 'gpt-4o-mini'),
+        [{"role": "user", "content": prompt}],
+    )
+    return (response.choices[0].message.content or '').strip()
+
+
+def needs_refresh(chat):
+    return (
+        get_summarizer() is not None
+        and summary_every() > 0
+        and chat.unsummarized_count >= keep_recent() + summary_every()
+    )
+
+
+def schedule_summary_refresh(chat_id):
+    """Refresh ``chat_id``'s summary once the current transaction commits."""
+    with _refreshing_lock:
+        if chat_id in _refreshing:
+            return
+        _refreshing.add(chat_id)
+
+    def run():
+        try:
+            refresh_chat_summary(chat_id)
+        except Exception:
+            logger.exception("Summary refresh failed for chat %s", chat_id)
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(chat_id)
+
+    def run_in_thread():
+        try:
+            run()
+        finally:
+            close_old_connections()
+
+    def start():
+        if getattr(settings, 'UNICOM_CHAT_SUMMARY_ASYNC', True):
+            threading.Thread(target=run_in_thread, daemon=True).start()
+        else:
+            run()
+
+    transaction.on_commit(start)
+
+
+def _after(marker):
+    timestamp, message_id = marker
+    return models.Q(timestamp__gt=timestamp) | models.Q(timestamp=timestamp, id__gt=message_id)
+
+
+def refresh_chat_summary(chat_id, summarizer=None):
+    """
+    Fold all but the newest ``keep_recent()`` messages after the marker into
+    the chat's summary. Returns the number of messages summarized.
+    """
+    Chat = apps.get_model('unicom', 'Chat')
+    Message = apps.get_model('unicom', 'Message')
+    summarizer = summarizer or get_summarizer()
+    if summarizer is None:
+        return 0
+
+    chat = Chat.objects.get(pk=chat_id)
+    marker, summary = chat.summary_marker, chat.summary
+    pending = Message.objects.filter(chat_id=chat_id)
+    if marker is not None:
+        pending = pending.filter(_after(marker))
+    rows = list(pending.order_by('timestamp', 'id').values_list('id', 'media_type', 'timestamp'))
+    split = len(rows) - keep_recent()
+    # Do not start the unsummarized tail with a tool response cut off from its call
+    while 0 < split < len(rows) and rows[split][1] == 'tool_response':
+        split += 1
+    ids = [pk for pk, _, _ in rows[:max(split, 0)]]
+    if not ids:
+        return 0
+
+    for start in range(0, len(ids), SUMMARY_BATCH_SIZE):
+        batch_ids = ids[start:start + SUMMARY_BATCH_SIZE]
+        by_id = Message.objects.in_bulk(batch_ids)
+        summary = summarizer(summary, [by_id[pk] for pk in batch_ids if pk in by_id])
+
+    # Only if no other refresh moved the marker meanwhile
+    updated = Chat.objects.filter(
+        pk=chat_id,
+        summary_up_to_timestamp=chat.summary_up_to_timestamp,
+        summary_up_to_message_id=chat.summary_up_to_message_id,
+    ).update(
+        summary=summary,
+        summary_up_to_timestamp=rows[len(ids) - 1][2],
+        summary_up_to_message_id=ids[-1],
+        summary_updated_at=timezone.now(),
+        unsummarized_count=models.Case(
+            models.When(unsummarized_count__gte=len(ids), then=models.F('unsummarized_count') - len(ids)),
+            default=0,
+        ),
+    )
+    if not updated:
+        logger.info("Chat %s summary changed during refresh; discarding", chat_id)
+        return 0
+    return len(ids)
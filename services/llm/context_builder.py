@@ -0,0 +1,274 @@
+"""
+Token-budgeted LLM context.
+
+``Message.as_llm_chat`` limits history by message count, so one pasted email
+or large tool response can overflow the model's context window while short
+chats leave most of it unused. ``build_llm_context`` instead packs the newest
+messages of the chat into a token budget:
+
+- each message's token cost is estimated from its text (plus a flat cost per
+  image or audio attachment, so media is never encoded just to be measured)
+  and cached per process, keyed by message id and ``updated_at``;
+- messages are taken newest first, in contiguous units, until the next unit
+  no longer fits. The message being answered is always included;
+- a tool response and the tool call it answers are one unit (along with
+  anything in between), so the API never sees an orphaned ``tool`` message;
+- when older turns were dropped, a ``summary`` can stand in for them as a
+  system message.
+
+``tokenizer`` is a callable returning the token count of a string. The
+default uses ``tiktoken`` when installed and otherwise estimates four
+characters per token. Cached costs are keyed by the tokenizer's ``cache_key``
+attribute or dotted name; lambdas and nested functions without a
+``cache_key`` are not cached.
+"""
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+from django.apps import apps
+from django.conf import settings
+from django.db.models import Q
+
+logger = logging.getLogger(__name__)
+
+# Per-message framing overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+# Flat estimates for inline media; a high-detail image is ~765 tokens on OpenAI models
+IMAGE_TOKENS = 765
+AUDIO_TOKENS = 1000
+SCAN_BATCH_SIZE = 100
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+
+def cost_cache_size():
+    return getattr(settings, 'UNICOM_LLM_TOKEN_COST_CACHE_SIZE', 50000)
+
+
+class _CostCache:
+    """Thread-safe LRU of message token costs."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            cost = self._entries.get(key)
+            if cost is not None:
+                self._entries.move_to_end(key)
+            return cost
+
+    def set(self, key, cost):
+        with self._lock:
+            self._entries[key] = cost
+            while len(self._entries) > cost_cache_size():
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+cost_cache = _CostCache()
+
+
+def estimate_tokens(text):
+    """Rough token count: about four characters per token."""
+    return (len(text) + 3) // 4
+
+
+def default_tokenizer(model=None):
+    """A ``tiktoken`` counter for ``model`` if available, else ``estimate_tokens``."""
+    try:
+        import tiktoken
+    except ImportError:
+        return estimate_tokens
+    try:
+        encoding = tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding('cl100k_base')
+    except KeyError:
+        encoding = tiktoken.get_encoding('cl100k_base')
+
+    def count_tokens(text):
+        return len(encoding.encode(text, disallowed_special=()))
+
+    count_tokens.cache_key = f'tiktoken:{encoding.name}'
+    return count_tokens
+
+
+def _tokenizer_key(tokenizer):
+    """
+    The tokenizer's ``cache_key``, else its dotted name. None for lambdas,
+    closures and callable objects, which share names (and whose ids are
+    reused), so their costs are not cached.
+    """
+    key = getattr(tokenizer, 'cache_key', None)
+    if key:
+        return key
+    name = getattr(tokenizer, '__qualname__', None)
+    if not name or '<' in name:
+        return None
+    return f'{tokenizer.__module__}.{name}'
+
+
+def _message_text(message):
+    """The text ``Message.as_llm_message`` would send, without media payloads."""
+    if message.media_type == 'tool_call':
+        call = (message.raw or {}).get('tool_call', {})
+        arguments = call.get('arguments', {})
+        if not isinstance(arguments, str):
+            arguments = json.dumps(arguments)
+        return f"{call.get('id', '')} {call.get('name', '')} {arguments}"
+    if message.media_type == 'tool_response':
+        response = (message.raw or {}).get('tool_response', {})
+        return f"{response.get('call_id', '')} {response.get('result', message.text or '')}"
+    if message.media_type == 'html' and message.html:
+        return message.html
+    return message.text or ''
+
+
+def message_token_cost(message, tokenizer=estimate_tokens, multimodal=True):
+    """Estimated prompt tokens for ``message``, computed once per message version."""
+    tokenizer_key = _tokenizer_key(tokenizer)
+    key = (message.pk, message.updated_at, tokenizer_key, multimodal)
+    cost = cost_cache.get(key) if tokenizer_key else None
+    if cost is None:
+        cost = MESSAGE_OVERHEAD_TOKENS + tokenizer(_message_text(message))
+        if multimodal and message.media:
+            if message.media_type == 'image':
+                cost += IMAGE_TOKENS
+            elif message.media_type == 'audio' and not (message.is_outgoing and (message.raw or {}).get('audio_id')):
+                cost += AUDIO_TOKENS
+        if tokenizer_key:
+            cost_cache.set(key, cost)
+    return cost
+
+
+def _response_call_id(message):
+    return (message.raw or {}).get('tool_response', {}).get('call_id')
+
+
+def _units(messages_newest_first):
+    """
+    Group messages (newest first) into contiguous units, yielded newest first.
+    A tool response opens a unit that only closes at its tool call.
+    """
+    unit, open_calls = [], set()
+    for message in messages_newest_first:
+        if message.media_type == 'tool_response':
+            call_id = _response_call_id(message)
+            if call_id:
+                open_calls.add(call_id)
+        elif message.media_type == 'tool_call':
+            open_calls.discard((message.raw or {}).get('tool_call', {}).get('id'))
+        unit.append(message)
+        if not open_calls:
+            yield unit
+            unit = []
+    # Responses whose call is out of reach are dropped rather than sent as orphans
+    unit = [m for m in unit if m.media_type != 'tool_response' or _response_call_id(m) not in open_calls]
+    if unit:
+        yield unit
+
+
+def pack_messages(messages_newest_first, budget, tokenizer=estimate_tokens, multimodal=True):
+    """
+    Take units from ``messages_newest_first`` while their cost fits ``budget``.
+
+    Returns ``(messages, tokens, truncated)``: the selected messages in
+    chronological order, their estimated cost and whether older messages were
+    left out. The first unit is always taken, even if it exceeds the budget.
+    """
+    selected, used, truncated = [], 0, False
+    for unit in _units(messages_newest_first):
+        cost = sum(message_token_cost(m, tokenizer, multimodal) for m in unit)
+        if selected and used + cost > budget:
+            truncated = True
+            break
+        if not selected and cost > budget:
+            logger.warning("Newest LLM context unit (%s tokens) exceeds the budget of %s", cost, budget)
+        selected.extend(unit)
+        used += cost
+    selected.reverse()
+    return selected, used, truncated
+
+
+def _history(message, max_messages=None):
+    """Messages of ``message``'s chat up to and including it, newest first, fetched in batches."""
+    Message = apps.get_model('unicom', 'Message')
+    up_to_cursor = Q(timestamp__lt=message.timestamp) | Q(timestamp=message.timestamp, id__lte=message.id)
+    seen = 0
+    while max_messages is None or seen < max_messages:
+        limit = SCAN_BATCH_SIZE if max_messages is None else min(SCAN_BATCH_SIZE, max_messages - seen)
+        batch = list(
+            Message.objects.filter(chat_id=message.chat_id).filter(up_to_cursor)
+            .order_by('-timestamp', '-id')[:limit]
+        )
+        yield from batch
+        seen += len(batch)
+        if len(batch) < limit:
+            return
+        last = batch[-1]
+        up_to_cursor = Q(timestamp__lt=last.timestamp) | Q(timestamp=last.timestamp, id__lt=last.id)
+
+
+def _system_cost(text, tokenizer):
+    return MESSAGE_OVERHEAD_TOKENS + tokenizer(text) if text else 0
+
+
+def summary_message(summary):
+    return {"role": "system", "content": SUMMARY_PREFIX + summary}
+
+
+def fit_token_budget(messages, budget, tokenizer=None, system_instruction=None, multimodal=True, summary=None,
+                     retrieved=None):
+    """
+    ``messages`` (chronological) minus the oldest units that do not fit
+    ``budget``, after charging the system instruction, summary and retrieved
+    snippets (the content of a system message), if any.
+    """
+    tokenizer = tokenizer or default_tokenizer()
+    budget -= _system_cost(system_instruction, tokenizer)
+    if summary:
+        budget -= _system_cost(summary_message(summary)["content"], tokenizer)
+    if retrieved:
+        budget -= _system_cost(retrieved, tokenizer)
+    selected, _, _ = pack_messages(reversed(messages), budget, tokenizer, multimodal)
+    return selected
+
+
+def build_llm_context(message, budget, tokenizer=None, system_instruction=None, multimodal=True,
+                      summary=None, max_messages=None):
+    """
+    LLM chat messages for ``message``'s chat that fit in ``budget`` tokens.
+
+    - tokenizer: callable counting the tokens of a string (default: see
+      ``default_tokenizer``)
+    - system_instruction: prepended as a system message; its cost counts
+      against the budget
+    - summary: text standing in for older turns that did not fit, added as a
+      system message (also within the budget) only when something was dropped
+    - max_messages: stop scanning history after this many messages
+    """
+    tokenizer = tokenizer or default_tokenizer()
+    remaining = budget - _system_cost(system_instruction, tokenizer)
+
+    # Pulled lazily: packing stops reading history once the budget is spent
+    selected, _, truncated = pack_messages(_history(message, max_messages), remaining, tokenizer, multimodal)
+
+    summary_dict = None
+    if truncated and summary:
+        summary_dict = summary_message(summary)
+        summary_cost = _system_cost(summary_dict["content"], tokenizer)
+        selected, _, _ = pack_messages(reversed(selected), remaining - summary_cost, tokenizer, multimodal)
+
+    messages = [m.as_llm_message(multimodal) for m in selected]
+    if summary_dict:
+        messages.insert(0, summary_dict)
+    if system_instruction:
+        messages.insert(0, {"role": "system", "content": system_instruction})
+    return messages
@@ -0,0 +1,396 @@
+"""
+Shared, rate-limited dispatch of LLM chat completions.
+
+``complete`` (blocking) and ``acomplete`` (async) send chat completion
+requests through one OpenAI client per process (per event loop for the async
+client), configured from ``OPENAI_API_KEY`` and ``OPENAI_BASE_URL``. Every
+request passes three limits, shared by both paths within a process:
+
+- ``UNICOM_LLM_MAX_CONCURRENCY`` (default 8) requests in flight overall;
+- ``UNICOM_LLM_MODEL_CONCURRENCY``, a ``{model: limit}`` dict, in flight per
+  model;
+- ``UNICOM_LLM_TOKENS_PER_MINUTE`` overall and ``UNICOM_LLM_MODEL_TOKENS_PER_MINUTE``
+  (``{model: tpm}``) as token buckets. Each request reserves its estimated
+  prompt tokens plus ``max_tokens`` (or ``DEFAULT_COMPLETION_TOKENS``) and is
+  delayed while a bucket is in deficit; the reservation is corrected with the
+  reported usage afterwards.
+
+``stream_complete`` streams a completion under the same limits; streamed
+replies (``reply_using_llm(stream=True)``) go through it.
+
+Rate-limited responses (HTTP 429) and transient failures (connection errors,
+timeouts, 408, 409 and 5xx) are retried up to ``UNICOM_LLM_MAX_RETRIES``
+times (default 5) with full-jitter exponential backoff, or after the
+``Retry-After`` delay when the provider sends one. The concurrency slot is
+released while waiting. The dispatcher's clients therefore have the SDK's own
+retries turned off; ``get_client(max_retries=...)`` builds one that keeps them
+for callers that use the client directly.
+
+Deterministic requests can be answered from a shared response cache instead,
+see ``unicom.services.llm.response_cache``.
+"""
+import asyncio
+import collections
+import json
+import logging
+import random
+import threading
+import time
+import weakref
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from openai import (
+    APIConnectionError, APIStatusError, AsyncOpenAI, InternalServerError, OpenAI, OpenAIError, RateLimitError,
+)
+
+from unicom.services.llm import response_cache
+from unicom.services.llm.context_builder import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COMPLETION_TOKENS = 1024
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+
+
+def _client_config():
+    api_key = getattr(settings, 'OPENAI_API_KEY', None)
+    if not api_key:
+        raise OpenAIError(
+            "OPENAI_API_KEY is required only for LLM features such as Message.reply_using_llm()."
+        )
+    return api_key, getattr(settings, 'OPENAI_BASE_URL', None)
+
+
+_client_lock = threading.Lock()
+_clients = {}
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_client(max_retries=0):
+    """
+    The process-wide ``OpenAI`` client (rebuilt if the settings change). The
+    dispatcher's own client has ``max_retries=0``: retries are ours, so they
+    count against the limits below.
+    """
+    config = _client_config()
+    with _client_lock:
+        cached = _clients.get(max_retries)
+        if cached is None or cached[0] != config:
+            api_key, base_url = config
+            cached = (config, OpenAI(api_key=api_key, base_url=base_url, max_retries=max_retries))
+            _clients[max_retries] = cached
+        return cached[1]
+
+
+def get_async_client():
+    """The ``AsyncOpenAI`` client of the running event loop."""
+    config = _client_config()
+    loop = asyncio.get_running_loop()
+    with _client_lock:
+        cached = _async_clients.get(loop)
+        if cached is None or cached[0] != config:
+            api_key, base_url = config
+            cached = (config, AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0))
+            _async_clients[loop] = cached
+        return cached[1]
+
+
+class _Slots:
+    """
+    Counting semaphore usable from threads and event loops alike, granting
+    slots in FIFO order.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_use = 0
+        self._lock = threading.Lock()
+        self._waiters = collections.deque()
+
+    def _try_acquire(self, waiter):
+        with self._lock:
+            if self.in_use < self.limit and not self._waiters:
+                self.in_use += 1
+                return True
+            self._waiters.append(waiter)
+            return False
+
+    def acquire(self):
+        event = threading.Event()
+        if not self._try_acquire(event.set):
+            event.wait()
+
+    async def aacquire(self):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def grant():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        if self._try_acquire(grant):
+            return
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._waiters.remove(grant)
+                    granted = False
+                except ValueError:
+                    granted = True
+            if granted:
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            if self._waiters:
+                # The slot passes straight to the next waiter
+                self._waiters.popleft()()
+            else:
+                self.in_use -= 1
+
+
+class _TokenBucket:
+    """Tokens-per-minute budget. Reservations may overdraw it; callers wait out the deficit."""
+
+    def __init__(self, tokens_per_minute):
+        self.tokens_per_minute = tokens_per_minute
+        self.available = float(tokens_per_minute)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        rate = self.tokens_per_minute / 60
+        self.available = min(float(self.tokens_per_minute), self.available + (now - self.updated) * rate)
+        self.updated = now
+
+    def reserve(self, tokens):
+        """Take ``tokens`` and return the seconds to wait before using them."""
+        with self._lock:
+            self._refill(time.monotonic())
+            wait = 0.0 if self.available >= 0 else -self.available * 60 / self.tokens_per_minute
+            self.available -= tokens
+            return wait
+
+    def adjust(self, tokens):
+        """Correct an earlier reservation by ``tokens`` (negative refunds)."""
+        with self._lock:
+            self.available -= tokens
+
+
+_limits_lock = threading.Lock()
+_slots = {}
+_buckets = {}
+
+
+def _limit_objects(registry, factory, key, limit):
+    if not limit:
+        return None
+    with _limits_lock:
+        current = registry.get(key)
+        if current is None or current[0] != limit:
+            current = (limit, factory(limit))
+            registry[key] = current
+        return current[1]
+
+
+def _slots_for(model):
+    per_model = getattr(settings, 'UNICOM_LLM_MODEL_CONCURRENCY', {}) or {}
+    return [s for s in (
+        _limit_objects(_slots, _Slots, None, getattr(settings, 'UNICOM_LLM_MAX_CONCURRENCY', 8)),
+        _limit_objects(_slots, _Slots, model, per_model.get(model)),
+    ) if s is not None]
+
+
+def _buckets_for(model):
+    per_model = getattr(settings, 'UNICOM_LLM_MODEL_TOKENS_PER_MINUTE', {}) or {}
+    return [b for b in (
+        _limit_objects(_buckets, _TokenBucket, None, getattr(settings, 'UNICOM_LLM_TOKENS_PER_MINUTE', None)),
+        _limit_objects(_buckets, _TokenBucket, model, per_model.get(model)),
+    ) if b is not None]
+
+
+def reset_limits():
+    """Forget all limiter state (used by tests)."""
+    with _limits_lock:
+        _slots.clear()
+        _buckets.clear()
+
+
+def estimate_request_tokens(messages, kwargs):
+    prompt = estimate_tokens(json.dumps(messages, default=str))
+    completion = kwargs.get('max_completion_tokens') or kwargs.get('max_tokens') or DEFAULT_COMPLETION_TOKENS
+    return prompt + completion
+
+
+def _reserve(buckets, tokens):
+    return max([bucket.reserve(tokens) for bucket in buckets], default=0.0)
+
+
+def _settle(buckets, reserved, response):
+    usage = getattr(response, 'usage', None)
+    used = getattr(usage, 'total_tokens', None)
+    if used is not None:
+        for bucket in buckets:
+            bucket.adjust(used - reserved)
+
+
+def _retryable(exc):
+    """Rate limits and transient failures, as the SDK's own retries would cover."""
+    if isinstance(exc, (RateLimitError, APIConnectionError, InternalServerError)):
+        return True
+    return isinstance(exc, APIStatusError) and exc.status_code in (408, 409)
+
+
+def _retry_delay(exc, attempt):
+    response = getattr(exc, 'response', None)
+    retry_after = response.headers.get('retry-after') if response is not None else None
+    try:
+        if retry_after is not None:
+            return float(retry_after)
+    except ValueError:
+        pass
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+def _release(slots):
+    for slot in reversed(slots):
+        slot.release()
+
+
+def max_retries():
+    return getattr(settings, 'UNICOM_LLM_MAX_RETRIES', 5)
+
+
+def complete(model, messages, cache=None, **kwargs):
+    """
+    Blocking chat completion through the shared client and limits. ``cache``
+    overrides ``UNICOM_LLM_RESPONSE_CACHE`` for this call
+    (see unicom.services.llm.response_cache).
+    """
+    key = None
+    if response_cache.cache_enabled(cache):
+        key, cached = response_cache.lookup(model, messages, kwargs)
+        if cached is not None:
+            return cached
+    response = _complete(model, messages, **kwargs)
+    if key:
+        response_cache.store(key, response)
+    return response
+
+
+def _complete(model, messages, **kwargs):
+    buckets = _buckets_for(model)
+    reserved = estimate_request_tokens(messages, kwargs)
+    time.sleep(_reserve(buckets, reserved))
+    attempt = 0
+    while True:
+        slots = _slots_for(model)
+        for slot in slots:
+            slot.acquire()
+        try:
+            response = get_client().chat.completions.create(model=model, messages=messages, **kwargs)
+        except OpenAIError as exc:
+            if not _retryable(exc) or attempt >= max_retries():
+                raise
+            delay, reason = _retry_delay(exc, attempt), type(exc).__name__
+        else:
+            _settle(buckets, reserved, response)
+            return response
+        finally:
+            for slot in reversed(slots):
+                slot.release()
+        logger.warning("LLM request failed (model %s, %s); retry %s in %.2fs", model, reason, attempt + 1, delay)
+        attempt += 1
+        time.sleep(delay)
+
+
+def stream_complete(model, messages, client=None, **kwargs):
+    """
+    Streamed chat completion under the same limits as ``complete``: a
+    generator of chunks. The concurrency slot is held until the stream is
+    exhausted or closed, tokens are reserved up front (and corrected when the
+    stream reports usage), and rate-limited requests are retried before the
+    first chunk. ``client`` overrides the shared client (it should not retry
+    on its own).
+    """
+    buckets = _buckets_for(model)
+    reserved = estimate_request_tokens(messages, kwargs)
+    time.sleep(_reserve(buckets, reserved))
+    attempt = 0
+    while True:
+        slots = _slots_for(model)
+        for slot in slots:
+            slot.acquire()
+        try:
+            stream = (client or get_client()).chat.completions.create(
+                model=model, messages=messages, stream=True, **kwargs)
+        except OpenAIError as exc:
+            _release(slots)
+            if not _retryable(exc) or attempt >= max_retries():
+                raise
+            delay, reason = _retry_delay(exc, attempt), type(exc).__name__
+        except BaseException:
+            _release(slots)
+            raise
+        else:
+            # The slots stay held while the stream is open
+            break
+        logger.warning("LLM request failed (model %s, %s); retry %s in %.2fs", model, reason, attempt + 1, delay)
+        attempt += 1
+        time.sleep(delay)
+
+    usage = None
+    try:
+        for chunk in stream:
+            usage = getattr(chunk, 'usage', None) or usage
+            yield chunk
+    finally:
+        _release(slots)
+        if usage is not None:
+            _settle(buckets, reserved, SimpleNamespace(usage=usage))
+
+
+async def acomplete(model, messages, cache=None, **kwargs):
+    """Async ``complete``."""
+    key = None
+    if response_cache.cache_enabled(cache):
+        key, cached = await sync_to_async(response_cache.lookup)(model, messages, kwargs)
+        if cached is not None:
+            return cached
+    response = await _acomplete(model, messages, **kwargs)
+    if key:
+        await sync_to_async(response_cache.store)(key, response)
+    return response
+
+
+async def _acomplete(model, messages, **kwargs):
+    buckets = _buckets_for(model)
+    reserved = estimate_request_tokens(messages, kwargs)
+    await asyncio.sleep(_reserve(buckets, reserved))
+    attempt = 0
+    while True:
+        slots = _slots_for(model)
+        acquired = []
+        try:
+            for slot in slots:
+                await slot.aacquire()
+                acquired.append(slot)
+            response = await get_async_client().chat.completions.create(model=model, messages=messages, **kwargs)
+        except OpenAIError as exc:
+            if not _retryable(exc) or attempt >= max_retries():
+                raise
+            delay, reason = _retry_delay(exc, attempt), type(exc).__name__
+        else:
+            _settle(buckets, reserved, response)
+            return response
+        finally:
+            for slot in reversed(acquired):
+                slot.release()
+        logger.warning("LLM request failed (model %s, %s); retry %s in %.2fs", model, reason, attempt + 1, delay)
+        attempt += 1
+        await asyncio.sleep(delay)
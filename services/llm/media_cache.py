@@ -0,0 +1,155 @@
+"""
+Disk cache of LLM-ready media payloads.
+
+``Message.as_llm_chat(multimodal=True)`` sends images and audio inline as
+base64, and audio is transcoded to MP3 first. Without a cache every turn
+re-reads and re-encodes (or re-transcodes) the whole conversation's media.
+
+Payloads are content-addressed: the key is the SHA-256 of the source file plus
+the target format, so identical files share one entry no matter which message
+they belong to. Entries live under ``UNICOM_LLM_MEDIA_CACHE_DIR`` (default
+``<tempdir>/unicom-llm-media``) as ``<hash[:2]>/<hash>.<format>.b64``, and
+the least recently used are deleted once the directory exceeds
+``UNICOM_LLM_MEDIA_CACHE_MAX_BYTES`` (default 512 MB). Set
+``UNICOM_LLM_MEDIA_CACHE_DIR = None`` to disable the cache.
+
+Stored media files are never rewritten in place, so the file-name to hash
+mapping is also memoized per process and a cache hit does not read storage.
+"""
+import base64
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+HASH_MEMO_SIZE = 10000
+
+_lock = threading.Lock()
+_hash_by_name = OrderedDict()
+_size = {'bytes': None}
+
+
+def cache_dir():
+    return getattr(
+        settings, 'UNICOM_LLM_MEDIA_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'unicom-llm-media')
+    )
+
+
+def max_bytes():
+    return getattr(settings, 'UNICOM_LLM_MEDIA_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+
+
+def _file_bytes(field_file):
+    field_file.open('rb')
+    try:
+        return field_file.read()
+    finally:
+        field_file.seek(0)
+
+
+def _entry_path(root, digest, target_format):
+    return os.path.join(root, digest[:2], f'{digest}.{target_format}.b64')
+
+
+def _entries(root):
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.endswith('.b64'):
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_atime
+
+
+def _evict(root):
+    """Delete least recently used entries until the cache fits ``max_bytes()``."""
+    entries = sorted(_entries(root), key=lambda entry: entry[2])
+    total = sum(size for _, size, _ in entries)
+    limit = max_bytes()
+    for path, size, _ in entries:
+        if total <= limit:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except FileNotFoundError:
+            pass
+    return total
+
+
+def _store(root, path, payload):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='ascii') as f:
+        f.write(payload)
+    os.replace(tmp, path)
+    with _lock:
+        if _size['bytes'] is None:
+            _size['bytes'] = sum(size for _, size, _ in _entries(root))
+        else:
+            _size['bytes'] += len(payload)
+        if _size['bytes'] > max_bytes():
+            _size['bytes'] = _evict(root)
+
+
+def media_payload(field_file, target_format, convert):
+    """
+    Base64 text of ``convert(source_bytes)`` for a stored media file.
+
+    ``target_format`` names the conversion (e.g. ``'mp3'``, ``'image'``) and is
+    part of the cache key; ``convert`` returns the bytes to encode. Errors
+    from ``convert`` propagate and nothing is cached.
+    """
+    root = cache_dir()
+    name = field_file.name
+    data = None
+    with _lock:
+        digest = _hash_by_name.get(name)
+        if digest is not None:
+            _hash_by_name.move_to_end(name)
+    if digest is None:
+        data = _file_bytes(field_file)
+        digest = hashlib.sha256(data).hexdigest()
+        with _lock:
+            _hash_by_name[name] = digest
+            while len(_hash_by_name) > HASH_MEMO_SIZE:
+                _hash_by_name.popitem(last=False)
+
+    path = _entry_path(root, digest, target_format) if root else None
+    if path:
+        try:
+            with open(path, encoding='ascii') as f:
+                payload = f.read()
+            os.utime(path)  # refresh LRU position
+            return payload
+        except FileNotFoundError:
+            pass
+
+    if data is None:
+        data = _file_bytes(field_file)
+    payload = base64.b64encode(convert(data)).decode('ascii')
+    if path:
+        try:
+            _store(root, path, payload)
+        except OSError:
+            logger.exception("Could not write LLM media cache entry %s", path)
+    return payload
+
+
+def clear_media_cache():
+    """Forget memoized hashes and delete every cached payload."""
+    with _lock:
+        _hash_by_name.clear()
+        _size['bytes'] = None
+    root = cache_dir()
+    if root and os.path.isdir(root):
+        shutil.rmtree(root, ignore_errors=True)
@@ -0,0 +1,133 @@
+"""
+Opt-in cache of deterministic chat completion responses.
+
+Category probes, title generation, template population and requests retried
+after a crash often send exactly the same prompt again. When enabled
+(``UNICOM_LLM_RESPONSE_CACHE = True``, or ``cache=True`` on a dispatcher
+call), ``complete``/``acomplete`` answer a repeated request from the Django
+cache named by ``UNICOM_LLM_RESPONSE_CACHE_ALIAS`` (default ``'default'``), so
+the entries are shared by every process using that cache.
+
+- Only deterministic requests are cached: ``temperature`` or ``top_p``
+  explicitly 0, a single choice, no audio output.
+- The key is a SHA-256 of the model, messages, tools and every sampling
+  parameter; transport options (timeouts, extra headers) are ignored.
+- Entries expire after ``UNICOM_LLM_RESPONSE_CACHE_TTL`` seconds (default one
+  day); responses larger than ``UNICOM_LLM_RESPONSE_CACHE_MAX_ENTRY_BYTES``
+  (default 256 KB) are not stored. The total size is bounded by the cache
+  backend (e.g. ``MAX_ENTRIES``, Redis ``maxmemory``).
+
+Hits, misses, stores and uncacheable requests are counted in the same cache,
+see ``get_response_cache_stats``.
+"""
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'unicom:llm:response:'
+STATS_KEY = 'unicom:llm:response_cache:{event}'
+STATS_EVENTS = ('hit', 'miss', 'store', 'uncacheable')
+# Request options that do not change the completion
+TRANSPORT_PARAMS = {'timeout', 'extra_headers', 'extra_query', 'extra_body', 'user', 'metadata', 'store'}
+
+
+def get_cache():
+    return caches[getattr(settings, 'UNICOM_LLM_RESPONSE_CACHE_ALIAS', 'default')]
+
+
+def cache_enabled(cache=None):
+    if cache is not None:
+        return bool(cache)
+    return getattr(settings, 'UNICOM_LLM_RESPONSE_CACHE', False)
+
+
+def cache_ttl():
+    return getattr(settings, 'UNICOM_LLM_RESPONSE_CACHE_TTL', 24 * 60 * 60)
+
+
+def max_entry_bytes():
+    return getattr(settings, 'UNICOM_LLM_RESPONSE_CACHE_MAX_ENTRY_BYTES', 256 * 1024)
+
+
+def is_deterministic(params):
+    if params.get('stream') or params.get('n', 1) != 1 or 'audio' in (params.get('modalities') or ()):
+        return False
+    return params.get('temperature') == 0 or params.get('top_p') == 0
+
+
+def cache_key(model, messages, params):
+    request = {
+        'model': model,
+        'messages': messages,
+        **{name: value for name, value in params.items() if name not in TRANSPORT_PARAMS},
+    }
+    canonical = json.dumps(request, sort_keys=True, separators=(',', ':'), default=str)
+    return KEY_PREFIX + hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def count(event):
+    key = STATS_KEY.format(event=event)
+    try:
+        if not get_cache().add(key, 1, timeout=None):
+            get_cache().incr(key)
+    except Exception:
+        pass
+
+
+def get_response_cache_stats():
+    """Event counts and ``hit_rate`` (hits over cacheable lookups, or None)."""
+    stats = get_cache().get_many([STATS_KEY.format(event=event) for event in STATS_EVENTS])
+    counts = {event: stats.get(STATS_KEY.format(event=event), 0) for event in STATS_EVENTS}
+    lookups = counts['hit'] + counts['miss']
+    counts['hit_rate'] = round(counts['hit'] / lookups, 4) if lookups else None
+    return counts
+
+
+def reset_response_cache_stats():
+    get_cache().delete_many([STATS_KEY.format(event=event) for event in STATS_EVENTS])
+
+
+def _decode(data):
+    from openai.types.chat import ChatCompletion
+    return ChatCompletion.model_validate(data)
+
+
+def _encode(response):
+    data = response.model_dump(mode='json')
+    if len(json.dumps(data)) > max_entry_bytes():
+        return None
+    return data
+
+
+def lookup(model, messages, params):
+    """
+    ``(key, cached_response)`` for a request; ``key`` is None when the request
+    is not cacheable and ``cached_response`` None on a miss.
+    """
+    if not is_deterministic(params):
+        count('uncacheable')
+        return None, None
+    key = cache_key(model, messages, params)
+    try:
+        data = get_cache().get(key)
+    except Exception:
+        logger.exception("LLM response cache lookup failed")
+        data = None
+    count('hit' if data is not None else 'miss')
+    return key, _decode(data) if data is not None else None
+
+
+def store(key, response):
+    data = _encode(response)
+    if data is None:
+        return
+    try:
+        get_cache().set(key, data, timeout=cache_ttl())
+        count('store')
+    except Exception:
+        logger.exception("LLM response cache store failed")
@@ -0,0 +1,415 @@
+"""
+Local semantic retrieval over message history.
+
+``as_llm_chat(retrieve=k)`` only sees the last ``depth`` messages of one chat,
+but a returning customer's relevant history is often older, or in another of
+their chats. With ``UNICOM_RETRIEVAL_ENABLED = True`` the text of every saved
+text/HTML message is embedded and added to a per-channel index; ``retrieve=k``
+then adds the ``k`` most similar earlier messages from the chats of the
+message's sender as a system message.
+
+Everything runs offline. The encoder is pluggable: ``UNICOM_RETRIEVAL_ENCODER``
+is a callable or its dotted path, called with a list of strings and returning
+an ``(n, dimensions)`` array of embeddings. The default, ``hashing_encoder``, is
+a signed feature-hashing bag of words and word bigrams
+(``UNICOM_RETRIEVAL_DIMENSIONS``, default 512) that needs no model; a local
+sentence-embedding model can be plugged in the same way. Give an encoder a
+``cache_key`` attribute to tell its vectors apart from other encoders';
+lambdas, nested functions and callable objects must have one.
+
+Each channel's index lives under ``UNICOM_RETRIEVAL_DIR`` (default
+``<tempdir>/unicom-retrieval``) as append-only ``.npz`` segments of float16
+vectors plus message ids, chat ids and timestamps. New messages are indexed
+after their transaction commits (in a background thread unless
+``UNICOM_RETRIEVAL_ASYNC`` is False) by writing a new segment, so indexing
+never rewrites the index. Once a channel has ``UNICOM_RETRIEVAL_MAX_SEGMENTS``
+segments (default 32) they are merged into one. Each process keeps the loaded
+vectors in memory and reads only segments it has not seen yet; search is one
+matrix-vector product over the channel. A re-indexed message (e.g. after an
+edit) is found by its newest vector only.
+
+Retrieval requires NumPy; without it the index is disabled. Use the
+``build_retrieval_index`` command to index existing messages.
+"""
+import glob
+import logging
+import os
+import queue
+import re
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+
+from django.apps import apps
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils.module_loading import import_string
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+logger = logging.getLogger(__name__)
+
+INDEXED_MEDIA_TYPES = ('text', 'html')
+MAX_TEXT_CHARS = 4000
+SNIPPET_CHARS = 500
+RETRIEVAL_PREFIX = "Relevant messages from earlier conversations with this user:\n"
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def retrieval_enabled():
+    return np is not None and getattr(settings, 'UNICOM_RETRIEVAL_ENABLED', False)
+
+
+def index_dir():
+    return getattr(settings, 'UNICOM_RETRIEVAL_DIR', os.path.join(tempfile.gettempdir(), 'unicom-retrieval'))
+
+
+def dimensions():
+    return getattr(settings, 'UNICOM_RETRIEVAL_DIMENSIONS', 512)
+
+
+def max_segments():
+    return getattr(settings, 'UNICOM_RETRIEVAL_MAX_SEGMENTS', 32)
+
+
+def hashing_encoder(texts):
+    """L2-normalized signed feature hashing of words and word bigrams."""
+    size = dimensions()
+    vectors = np.zeros((len(texts), size), dtype=np.float32)
+    for row, text in enumerate(texts):
+        words = _WORD.findall((text or '').lower())
+        for feature in words + [f'{a} {b}' for a, b in zip(words, words[1:])]:
+            # crc32 rather than hash(): stable across processes
+            digest = zlib.crc32(feature.encode('utf-8'))
+            vectors[row, digest % size] += 1.0 if digest & 0x80000000 else -1.0
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def get_encoder():
+    encoder = getattr(settings, 'UNICOM_RETRIEVAL_ENCODER', None) or hashing_encoder
+    if isinstance(encoder, str):
+        encoder = import_string(encoder)
+    return encoder
+
+
+def _encoder_key(encoder):
+    if encoder is hashing_encoder:
+        return f'hashing:{dimensions()}'
+    key = getattr(encoder, 'cache_key', None)
+    if key:
+        return key
+    name = getattr(encoder, '__qualname__', None)
+    if not name or '<' in name:
+        # Lambdas, closures and callable objects share names, and the key is
+        # stored on disk, so it cannot fall back to the object's identity.
+        raise ValueError(f"Retrieval encoder {encoder!r} needs a cache_key attribute")
+    return f'{encoder.__module__}.{name}'
+
+
+def _encode(encoder, texts):
+    vectors = np.asarray(encoder(texts), dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _write_segment(path, vectors, ids, chat_ids, timestamps, key):
+    tmp = f'{path}.{uuid.uuid4().hex[:8]}.tmp'
+    with open(tmp, 'wb') as f:
+        np.savez(
+            f, vectors=vectors.astype(np.float16), ids=np.asarray(ids, dtype=str),
+            chat_ids=np.asarray(chat_ids, dtype=str), timestamps=np.asarray(timestamps, dtype=np.float64),
+            key=np.asarray(key),
+        )
+    os.replace(tmp, path)
+
+
+class ChannelIndex:
+    """One channel's segments, loaded into memory; see the module docstring."""
+
+    def __init__(self, root, key):
+        self.root = root
+        self.key = key
+        self.loaded = []
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.ids = np.zeros(0, dtype=str)
+        self.chat_ids = np.zeros(0, dtype=str)
+        self.timestamps = np.zeros(0, dtype=np.float64)
+        self.lock = threading.Lock()
+
+    def segment_paths(self):
+        return sorted(glob.glob(os.path.join(self.root, '*.npz')))
+
+    def refresh(self):
+        """Load segments written since the last call (by any process)."""
+        with self.lock:
+            for _ in range(3):
+                paths = self.segment_paths()
+                if paths == self.loaded:
+                    return
+                try:
+                    self._load(paths)
+                    return
+                except FileNotFoundError:
+                    # Merged by a concurrent compaction: reload from scratch
+                    self.loaded = []
+
+    def _load(self, paths):
+        incremental = bool(self.loaded) and set(self.loaded) <= set(paths)
+        parts = [(self.vectors, self.ids, self.chat_ids, self.timestamps)] if incremental and len(self.ids) else []
+        for path in paths:
+            if incremental and path in self.loaded:
+                continue
+            with np.load(path, allow_pickle=False) as data:
+                if str(data['key']) != self.key:
+                    continue
+                parts.append((data['vectors'].astype(np.float32), data['ids'], data['chat_ids'], data['timestamps']))
+        if parts:
+            vectors, ids, chat_ids, timestamps = (np.concatenate(column) for column in zip(*parts))
+            # The newest vector of a message wins
+            _, last = np.unique(ids[::-1], return_index=True)
+            keep = np.sort(len(ids) - 1 - last)
+            self.vectors, self.ids = vectors[keep], ids[keep]
+            self.chat_ids, self.timestamps = chat_ids[keep], timestamps[keep]
+        else:
+            self.vectors = np.zeros((0, 0), dtype=np.float32)
+            self.ids, self.chat_ids = np.zeros(0, dtype=str), np.zeros(0, dtype=str)
+            self.timestamps = np.zeros(0, dtype=np.float64)
+        self.loaded = paths
+
+    def add(self, vectors, ids, chat_ids, timestamps):
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, f'{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.npz')
+        _write_segment(path, vectors, ids, chat_ids, timestamps, self.key)
+        if len(self.segment_paths()) > max_segments():
+            self.compact()
+        self.refresh()
+
+    def compact(self):
+        """Merge all segments into one."""
+        self.refresh()
+        with self.lock:
+            merged = [path for path in self.loaded if os.path.exists(path)]
+            if len(merged) < 2:
+                return
+            target = merged[-1][:-len('.npz')] + '-m.npz'
+            _write_segment(target, self.vectors, self.ids, self.chat_ids, self.timestamps, self.key)
+            for path in merged:
+                if path != target:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+            self.loaded = [target]
+
+    def search(self, vector, k, chat_ids=None, exclude_ids=(), before=None, min_score=0.0):
+        """``[(message_id, score)]`` of the ``k`` nearest rows passing the filters, best first."""
+        with self.lock:
+            vectors, ids, rows_chats, timestamps = self.vectors, self.ids, self.chat_ids, self.timestamps
+        if not len(ids) or vectors.shape[1] != vector.shape[0]:
+            return []
+        mask = np.ones(len(ids), dtype=bool)
+        if chat_ids is not None:
+            mask &= np.isin(rows_chats, np.asarray(list(chat_ids), dtype=str))
+        if exclude_ids:
+            mask &= ~np.isin(ids, np.asarray(list(exclude_ids), dtype=str))
+        if before is not None:
+            mask &= timestamps < before
+        candidates = np.flatnonzero(mask)
+        if not len(candidates):
+            return []
+        if len(candidates) > len(ids) // 4:
+            # Cheaper than copying most of the rows out first
+            scores = (vectors @ vector)[candidates]
+        else:
+            scores = vectors[candidates] @ vector
+        if len(candidates) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(str(ids[candidates[i]]), float(scores[i])) for i in top if scores[i] > min_score]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(channel_id, encoder=None):
+    key = _encoder_key(encoder or get_encoder())
+    root = os.path.join(index_dir(), f'channel_{channel_id}')
+    with _indexes_lock:
+        index = _indexes.get((root, key))
+        if index is None:
+            index = _indexes[(root, key)] = ChannelIndex(root, key)
+    return index
+
+
+def clear_loaded_indexes():
+    """Forget the in-memory indexes (the segments on disk are kept)."""
+    with _indexes_lock:
+        _indexes.clear()
+
+
+def is_indexable(message):
+    return message.media_type in INDEXED_MEDIA_TYPES and bool((message.text or '').strip())
+
+
+def index_messages(messages, encoder=None):
+    """Embed ``messages`` (those with text) and add them to their channels' indexes."""
+    if np is None:
+        return 0
+    encoder = encoder or get_encoder()
+    by_channel = {}
+    for message in messages:
+        if is_indexable(message):
+            by_channel.setdefault(message.channel_id, []).append(message)
+    for channel_id, batch in by_channel.items():
+        vectors = _encode(encoder, [m.text[:MAX_TEXT_CHARS] for m in batch])
+        get_index(channel_id, encoder).add(
+            vectors, [m.id for m in batch], [m.chat_id for m in batch], [m.timestamp.timestamp() for m in batch]
+        )
+    return sum(len(batch) for batch in by_channel.values())
+
+
+def rebuild_channel_index(channel_id, batch_size=1000, encoder=None):
+    """Index every stored message of a channel from scratch. Returns the number indexed."""
+    Message = apps.get_model('unicom', 'Message')
+    encoder = encoder or get_encoder()
+    index = get_index(channel_id, encoder)
+    for path in index.segment_paths():
+        os.remove(path)
+    index.refresh()
+
+    rows = (
+        Message.objects.filter(channel_id=channel_id, media_type__in=INDEXED_MEDIA_TYPES)
+        .exclude(text__isnull=True).exclude(text='')
+        .only('id', 'channel_id', 'chat_id', 'text', 'timestamp', 'media_type')
+        .order_by('timestamp', 'id')
+    )
+    indexed = 0
+    last = None
+    while True:
+        batch = rows
+        if last is not None:
+            batch = batch.filter(timestamp__gte=last.timestamp).exclude(timestamp=last.timestamp, id__lte=last.id)
+        batch = list(batch[:batch_size])
+        if not batch:
+            break
+        indexed += index_messages(batch, encoder)
+        last = batch[-1]
+    index.compact()
+    return indexed
+
+
+_queue = queue.Queue()
+_worker = {'thread': None}
+_worker_lock = threading.Lock()
+
+
+def _drain():
+    try:
+        while True:
+            try:
+                batch = [_queue.get(timeout=1.0)]
+            except queue.Empty:
+                return
+            while True:
+                try:
+                    batch.append(_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                index_messages(batch)
+            except Exception:
+                logger.exception("Indexing %s messages for retrieval failed", len(batch))
+    finally:
+        with _worker_lock:
+            _worker['thread'] = None
+        close_old_connections()
+        # A message queued while the worker was exiting
+        if not _queue.empty():
+            _start_worker()
+
+
+def _start_worker():
+    with _worker_lock:
+        if _worker['thread'] is None:
+            _worker['thread'] = threading.Thread(target=_drain, daemon=True, name='unicom-retrieval')
+            _worker['thread'].start()
+
+
+def schedule_indexing(message):
+    """Index ``message`` once the current transaction commits."""
+    if not retrieval_enabled() or not is_indexable(message):
+        return
+
+    def enqueue():
+        if getattr(settings, 'UNICOM_RETRIEVAL_ASYNC', True):
+            _queue.put(message)
+            _start_worker()
+        else:
+            try:
+                index_messages([message])
+            except Exception:
+                logger.exception("Indexing message %s for retrieval failed", message.id)
+
+    transaction.on_commit(enqueue)
+
+
+def customer_chat_ids(message):
+    """
+    Chats whose history may be retrieved for ``message``: those of its
+    (non-bot) sender, or for outgoing messages those of the chat's non-bot
+    participants. Bot and channel accounts take part in every chat they reply
+    in, so they never widen the search; without a customer, only
+    ``message``'s own chat is searched.
+    """
+    Account = apps.get_model('unicom', 'Account')
+    AccountChat = apps.get_model('unicom', 'AccountChat')
+    if message.is_outgoing or not message.sender_id:
+        customers = AccountChat.objects.filter(chat_id=message.chat_id, account__is_bot=False).values('account_id')
+    else:
+        customers = Account.objects.filter(pk=message.sender_id, is_bot=False).values('pk')
+    chat_ids = set(AccountChat.objects.filter(account_id__in=customers).values_list('chat_id', flat=True))
+    chat_ids.add(message.chat_id)
+    return chat_ids
+
+
+def retrieve_related(message, k=5, exclude_ids=(), min_score=None):
+    """
+    Up to ``k`` earlier messages most similar to ``message``, from the chats
+    returned by ``customer_chat_ids``, best match first.
+    """
+    if not retrieval_enabled() or k <= 0 or not is_indexable(message):
+        return []
+    Message = apps.get_model('unicom', 'Message')
+    chat_ids = customer_chat_ids(message)
+
+    encoder = get_encoder()
+    index = get_index(message.channel_id, encoder)
+    index.refresh()
+    min_score = getattr(settings, 'UNICOM_RETRIEVAL_MIN_SCORE', 0.2) if min_score is None else min_score
+    hits = index.search(
+        _encode(encoder, [message.text[:MAX_TEXT_CHARS]])[0], k,
+        chat_ids=chat_ids, exclude_ids={message.id, *exclude_ids}, before=message.timestamp.timestamp(),
+        min_score=min_score,
+    )
+    by_id = Message.objects.in_bulk([message_id for message_id, _ in hits])
+    return [by_id[message_id] for message_id, _ in hits if message_id in by_id]
+
+
+def retrieval_message(messages):
+    """System message quoting retrieved ``messages`` (oldest first)."""
+    lines = []
+    for m in sorted(messages, key=lambda m: m.timestamp):
+        speaker = 'Assistant' if m.is_outgoing else m.sender_name or 'User'
+        text = m.text if len(m.text) <= SNIPPET_CHARS else m.text[:SNIPPET_CHARS - 3] + '...'
+        lines.append(f"[{m.timestamp:%Y-%m-%d}] {speaker}: {text}")
+    return {"role": "system", "content": RETRIEVAL_PREFIX + "\n".join(lines)}
@@ -0,0 +1,199 @@
+"""
+Streaming LLM replies.
+
+``Message.reply_using_llm(..., stream=True)`` creates the outgoing reply up
+front (with placeholder text), requests a streamed completion and updates the
+reply as tokens arrive:
+
+- WebChat: text deltas are pushed to the chat's channel layer group as
+  ``webchat.message_delta`` events, coalesced to at most one push every
+  ``UNICOM_LLM_STREAM_PUSH_INTERVAL`` seconds (default 0.05). The partial text
+  is written to the row at most every ``UNICOM_LLM_STREAM_SAVE_INTERVAL``
+  seconds (default 2; a plain UPDATE that sends no signals), so a reload
+  mid-stream shows progress.
+- Telegram: the placeholder is edited in place with the text so far, at most
+  once every ``UNICOM_TELEGRAM_STREAM_EDIT_INTERVAL`` seconds (default 1, to
+  stay within Telegram's edit rate limits). Intermediate edits are plain text;
+  the final edit applies Markdown, retries with ``escape_markdown`` and finally
+  falls back to plain text.
+
+Either way the final text is saved once through ``Message.save``. The request
+goes through ``dispatcher.stream_complete`` and so shares the dispatcher's
+limits and rate-limit retries. If the stream fails before any text arrived,
+the placeholder is replaced with ``UNICOM_LLM_STREAM_ERROR_TEXT``. Timing is
+recorded in ``reply.raw['llm_stream']``: ``ttft_ms`` (time to first token,
+measured from the API call), ``duration_ms``, ``chunks`` and ``model``.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from unicom.services.llm.dispatcher import stream_complete
+from unicom.services.telegram.edit_telegram_message import edit_telegram_message
+from unicom.services.telegram.escape_markdown import escape_markdown
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_TEXT = '…'
+TELEGRAM_MAX_LENGTH = 4096
+TELEGRAM_CROP_FOOTER = "\n\n… Message Cropped"
+
+
+def push_interval():
+    return getattr(settings, 'UNICOM_LLM_STREAM_PUSH_INTERVAL', 0.05)
+
+
+def save_interval():
+    return getattr(settings, 'UNICOM_LLM_STREAM_SAVE_INTERVAL', 2.0)
+
+
+def telegram_edit_interval():
+    return getattr(settings, 'UNICOM_TELEGRAM_STREAM_EDIT_INTERVAL', 1.0)
+
+
+def stream_error_text():
+    return getattr(settings, 'UNICOM_LLM_STREAM_ERROR_TEXT', "Sorry, I couldn't generate a reply. Please try again.")
+
+
+def can_stream_to(message):
+    """
+    Telegram replies can always be streamed; WebChat needs a channel layer to
+    push deltas through.
+    """
+    if message.platform == 'Telegram':
+        return True
+    if message.platform != 'WebChat':
+        return False
+    from unicom.consumers.webchat_consumer import chat_push_available
+    return chat_push_available()
+
+
+class _WebChatSink:
+    """Pushes deltas to the chat group and periodically saves partial text."""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.pushed = 0
+        self.last_push = self.last_save = time.monotonic()
+
+    def _push(self, text):
+        from unicom.consumers.webchat_consumer import publish_message_delta
+        if self.pushed < len(text):
+            publish_message_delta(self.reply.chat_id, self.reply.id, self.pushed, text[self.pushed:])
+            self.pushed = len(text)
+
+    def update(self, text):
+        now = time.monotonic()
+        if now - self.last_push >= push_interval():
+            self._push(text)
+            self.last_push = now
+        if now - self.last_save >= save_interval():
+            type(self.reply).objects.filter(pk=self.reply.pk).update(text=text, updated_at=timezone.now())
+            self.last_save = now
+
+    def finish(self, text):
+        self._push(text)
+
+
+class _TelegramSink:
+    """Edits the placeholder message in place, coalescing edits per interval."""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.sent = PLACEHOLDER_TEXT
+        self.last_edit = time.monotonic()
+
+    def _edit(self, text, parse_mode=None):
+        return edit_telegram_message(self.reply.channel, self.reply, {'text': text, 'parse_mode': parse_mode})
+
+    @staticmethod
+    def _fit(text):
+        if len(text) <= TELEGRAM_MAX_LENGTH:
+            return text
+        return text[:TELEGRAM_MAX_LENGTH - len(TELEGRAM_CROP_FOOTER)] + TELEGRAM_CROP_FOOTER
+
+    def update(self, text):
+        now = time.monotonic()
+        if now - self.last_edit < telegram_edit_interval():
+            return
+        text = self._fit(text)
+        if text != self.sent and self._edit(text):
+            self.sent = text
+        self.last_edit = now
+
+    def finish(self, text):
+        if not text:
+            return
+        for candidate, parse_mode in (
+            (text, 'Markdown'),
+            (escape_markdown(text), 'Markdown'),
+            (text, None),
+        ):
+            candidate = self._fit(candidate)
+            if parse_mode is None and candidate == self.sent:
+                return
+            if self._edit(candidate, parse_mode):
+                return
+        logger.warning("Final streamed edit failed for Telegram message %s", self.reply.id)
+
+
+def _chunk_text(chunk):
+    choices = getattr(chunk, 'choices', None) or []
+    if not choices:
+        return ''
+    delta = getattr(choices[0], 'delta', None)
+    return getattr(delta, 'content', None) or ''
+
+
+def _elapsed_ms(since):
+    return round((time.monotonic() - since) * 1000, 1)
+
+
+def stream_llm_reply(message, model, messages, client=None, **create_kwargs):
+    """
+    Reply to ``message`` with a streamed chat completion and return the reply.
+
+    The completion is requested through ``dispatcher.stream_complete`` (so it
+    shares the dispatcher's concurrency slots, token budget and 429 retries),
+    with ``client`` (an OpenAI-compatible client; default the shared one) and
+    ``create_kwargs``. If the stream fails, the text received so far is saved
+    with the error recorded in ``raw['llm_stream']['error']`` and the exception
+    is re-raised. If it fails before any text arrived, the placeholder is
+    replaced with ``UNICOM_LLM_STREAM_ERROR_TEXT`` instead.
+    """
+    reply = message.reply_with({'type': 'text', 'text': PLACEHOLDER_TEXT})
+    sink = _TelegramSink(reply) if reply.platform == 'Telegram' else _WebChatSink(reply)
+    stats = {'model': model, 'ttft_ms': None, 'duration_ms': None, 'chunks': 0}
+    text = ''
+
+    started = time.monotonic()
+    try:
+        stream = stream_complete(model, messages, client=client, **create_kwargs)
+        for chunk in stream:
+            piece = _chunk_text(chunk)
+            if not piece:
+                continue
+            if stats['ttft_ms'] is None:
+                stats['ttft_ms'] = _elapsed_ms(started)
+            stats['chunks'] += 1
+            text += piece
+            sink.update(text)
+    except Exception as exc:
+        stats['error'] = str(exc)
+        if not text:
+            # Do not leave the placeholder (or an empty message) behind
+            text = stream_error_text()
+        raise
+    finally:
+        sink.finish(text)
+        stats['duration_ms'] = _elapsed_ms(started)
+        reply.text = text
+        reply.raw = {**(reply.raw or {}), 'llm_stream': stats}
+        reply.save(update_fields=['text', 'raw'])
+        logger.info(
+            "Streamed reply %s: ttft=%sms duration=%sms chunks=%s",
+            reply.id, stats['ttft_ms'], stats['duration_ms'], stats['chunks'],
+        )
+    return reply
@@ -7,7 +7,7 @@ and can be included in LLM conversation history for context.
 """
 
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 from django.utils import timezone
 from django.contrib.auth.models import User
 from unicom.models import Message, Chat, Account
@@ -71,6 +71,84 @@ def save_tool_call(chat, tool_name, tool_args, user=None, call_id=None, reply_to
     return message
 
 
+def save_tool_calls(chat, tool_calls, user=None, reply_to_message=None):
+    """
+    Save several LLM tool calls at once; the bulk form of save_tool_call.
+    
+    System accounts are resolved in one query and the messages inserted with
+    a single bulk_create. Since that bypasses Message.save and the post_save
+    signals, their effects are applied here once for the whole batch: the
+    materialized thread path, the chat summary fields, Chat.updated_at and
+    the WebChat push/long-poll notifications.
+    
+    Args:
+        chat: Chat instance where the tool calls occurred
+        tool_calls: List of dicts with "name", "arguments" and optionally "id"
+        user: Django user making the tool calls (optional)
+        reply_to_message: Message the tool calls are replying to (for thread mode)
+    
+    Returns:
+        List of Message instances, in the order of ``tool_calls``
+    """
+    from django.db import transaction
+    from unicom.services.chat_summary import update_chat_summary_for_messages
+    from unicom.services.message_tree import materialize_thread_path
+
+    if not tool_calls:
+        return []
+
+    accounts = _get_system_accounts(chat.channel, {call['name'] for call in tool_calls})
+    reply_to_id = reply_to_message.pk if reply_to_message else None
+    ancestor_ids, thread_depth = materialize_thread_path(reply_to_id)
+    now = timezone.now()
+
+    messages = []
+    for position, call in enumerate(tool_calls):
+        call_id = call.get('id') or f"call_{uuid.uuid4().hex[:8]}"
+        tool_args = call.get('arguments', {})
+        if isinstance(tool_args, str):
+            try:
+                tool_args = json.loads(tool_args)
+            except json.JSONDecodeError:
+                tool_args = {"arguments": tool_args}
+        messages.append(Message(
+            id=f"tool_call_{chat.id}_{call_id}",
+            channel=chat.channel,
+            platform=chat.platform,
+            sender=accounts[call['name']],
+            user=user,
+            chat=chat,
+            is_outgoing=None,  # System message
+            sender_name="System",
+            text=f"Tool call: {call['name']}",
+            reply_to_message=reply_to_message,
+            # Distinct timestamps keep the calls in order in (timestamp, id) history queries
+            timestamp=now + timedelta(microseconds=position),
+            raw={"tool_call": {"id": call_id, "name": call['name'], "arguments": tool_args}},
+            media_type='tool_call',
+            ancestor_ids=ancestor_ids,
+            thread_depth=thread_depth,
+        ))
+
+    with transaction.atomic():
+        Message.objects.bulk_create(messages)
+        # Also bumps Chat.updated_at (auto_now)
+        update_chat_summary_for_messages(chat, messages)
+
+    if chat.platform == 'WebChat':
+        from unicom.consumers.webchat_consumer import publish_message_to_chat
+        from unicom.services.webchat.notifier import notify_chat
+
+        def notify():
+            for message in messages:
+                publish_message_to_chat(message, True)
+            notify_chat(chat.id)
+
+        transaction.on_commit(notify)
+
+    return messages
+
+
 def save_tool_response(chat, call_id, result, tool_name, user=None, reply_to_message=None):
     """
     Save an LLM tool call response as an invisible message.
@@ -196,3 +274,18 @@ def _get_system_account(channel, tool_name):
     )
     
     return account
+
+
+def _get_system_accounts(channel, tool_names):
+    """
+    Bulk _get_system_account: ``{tool_name: Account}`` for ``tool_names``,
+    creating the missing accounts.
+    """
+    ids = {f"tool_{name}_{channel.id}": name for name in tool_names}
+    accounts = {
+        ids[account.id]: account
+        for account in Account.objects.filter(channel=channel, id__in=list(ids))
+    }
+    for name in set(tool_names) - set(accounts):
+        accounts[name] = _get_system_account(channel, name)
+    return accounts
@@ -0,0 +1,107 @@
+"""
+Run the tool calls of one LLM turn concurrently and fan their results back in.
+
+``run_tool_calls(request, tool_calls_data)`` submits the calls with
+``Request.submit_tool_calls`` and runs the registered handler of each one
+(see ``unicom.services.llm.tool_worker``) in a thread pool, responding to every
+call as soon as its handler returns. The turn therefore takes as long as its
+slowest call rather than the sum of all of them.
+
+Fan-in relies on ``Request.pending_tool_calls``: each response decrements it
+under the request's row lock, and the response that brings it to 0 creates the
+child request, so it is created exactly once however the responses interleave
+(with other threads, ``run_tool_worker`` or a handler responding itself).
+
+The calls being run are leased to this coordinator so workers leave them
+alone. Calls without a handler are left PENDING for a worker or for the
+application to answer. Handler exceptions and timeouts are sent to the LLM as
+ERROR responses, and a handler returning None defers its call (marked
+IN_PROGRESS), as in the worker.
+"""
+import logging
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.db import models
+from django.utils import timezone
+
+from unicom.services.llm.tool_worker import _run_in_thread, default_timeout, get_tool_handlers
+
+logger = logging.getLogger(__name__)
+
+
+def _release(tool_call):
+    type(tool_call).objects.filter(pk=tool_call.pk).update(lease_expires_at=None, leased_by='')
+
+
+def _respond(tool_call, result, status='SUCCESS'):
+    """Respond unless someone (e.g. the handler itself) already has; returns the child request, if any."""
+    try:
+        _, child = tool_call.respond(result, status)
+    except ValueError:
+        return None
+    finally:
+        _release(tool_call)
+    return child
+
+
+def run_tool_calls(request, tool_calls_data, max_workers=None, timeout=None):
+    """
+    Submit ``tool_calls_data`` on ``request`` and run their handlers in
+    parallel. ``timeout`` overrides the handlers' own timeouts. Returns the
+    child request if one of these responses was the final one, otherwise None
+    (calls still outstanding, or a handler responded itself).
+    """
+    tool_calls = request.submit_tool_calls(tool_calls_data)
+    handlers = get_tool_handlers()
+    runnable = [call for call in tool_calls if call.tool_name in handlers]
+    if not runnable:
+        return None
+
+    timeouts = {call.pk: timeout or handlers[call.tool_name].timeout or default_timeout() for call in runnable}
+    lease_id = f'fanout:{uuid.uuid4().hex[:12]}'
+    type(runnable[0]).objects.filter(pk__in=[call.pk for call in runnable]).update(
+        leased_by=lease_id,
+        lease_expires_at=timezone.now() + timedelta(seconds=max(timeouts.values())),
+        started_at=timezone.now(),
+        attempts=models.F('attempts') + 1,
+    )
+
+    child = None
+    executor = ThreadPoolExecutor(max_workers=max_workers or len(runnable), thread_name_prefix='unicom-fanout')
+    try:
+        started = time.monotonic()
+        futures = {
+            executor.submit(_run_in_thread, handlers[call.tool_name].func, call): call for call in runnable
+        }
+        pending = set(futures)
+        while pending:
+            elapsed = time.monotonic() - started
+            remaining = min(timeouts[futures[f].pk] for f in pending) - elapsed
+            done, pending = wait(pending, timeout=max(remaining, 0), return_when=FIRST_COMPLETED)
+            elapsed = time.monotonic() - started
+            for future in [f for f in pending if timeouts[futures[f].pk] <= elapsed]:
+                pending.discard(future)
+                call = futures[future]
+                child = _respond(call, {'error': f'Tool {call.tool_name} timed out after {timeouts[call.pk]}s'}, 'ERROR') or child
+            for future in done:
+                call = futures[future]
+                try:
+                    result = future.result()
+                except Exception as exc:
+                    logger.exception("Tool handler %s failed for call %s", call.tool_name, call.call_id)
+                    child = _respond(call, {'error': str(exc) or type(exc).__name__}, 'ERROR') or child
+                    continue
+                if result is None:
+                    call.refresh_from_db(fields=['status'])
+                    if call.status == 'PENDING':
+                        call.start_processing()
+                    _release(call)
+                else:
+                    child = _respond(call, result) or child
+    finally:
+        # Timed-out handlers cannot be stopped; do not wait for them
+        executor.shutdown(wait=False, cancel_futures=True)
+    return child
@@ -0,0 +1,315 @@
+"""
+Worker runtime for ``ToolCall`` rows.
+
+Tool handlers are registered by name, either with ``register_tool_handler``
+or in settings::
+
+    UNICOM_TOOL_HANDLERS = {
+        'search': 'myapp.tools.search',
+        'render_report': {'handler': 'myapp.tools.render_report', 'concurrency': 2, 'timeout': 600},
+    }
+
+A handler is called with the ``ToolCall`` and returns its result, which the
+worker passes to ``ToolCall.respond``. A handler may also call ``respond``
+itself, or return None to defer the response (the call is then marked
+IN_PROGRESS and left to whoever responds later). Exceptions and timeouts are
+reported to the LLM as an ERROR response.
+
+``ToolWorker`` (run by the ``run_tool_worker`` command) claims PENDING calls
+for its registered tools with ``SELECT ... FOR UPDATE SKIP LOCKED``, so any
+number of workers share the queue without blocking each other. Claimed calls
+stay PENDING with a lease (``leased_by``, ``lease_expires_at``) that the worker
+renews while the handler runs; if the worker dies, the call becomes claimable
+again once the lease expires. Calls claimed ``UNICOM_TOOL_WORKER_MAX_ATTEMPTS``
+times (default 3) without finishing are answered with an error instead.
+
+Handlers run in a thread pool, or with ``processes`` in a process pool (the
+handler must then be importable and the ``ToolCall`` is pickled). Each tool
+runs at most ``concurrency`` calls at once per worker (default: the pool
+size). After ``timeout`` seconds (default ``UNICOM_TOOL_HANDLER_TIMEOUT``,
+300), counted from when the handler starts, the call is answered with an
+error and the handler's eventual result is discarded. A timed-out thread
+cannot be killed, so it keeps its pool slot until it returns; a timed-out
+process is terminated, with the pool replaced by a fresh one once its other
+calls finish.
+"""
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import close_old_connections, models, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ToolHandler:
+    name: str
+    func: callable
+    concurrency: int = None
+    timeout: float = None
+
+
+_registry = {}
+
+
+def register_tool_handler(name, func=None, concurrency=None, timeout=None):
+    """Register ``func`` for tool ``name``; usable as a decorator."""
+    def register(func):
+        _registry[name] = ToolHandler(name, func, concurrency, timeout)
+        return func
+    return register(func) if func is not None else register
+
+
+def unregister_tool_handler(name):
+    _registry.pop(name, None)
+
+
+def get_tool_handlers():
+    """Registered handlers, with ``UNICOM_TOOL_HANDLERS`` entries taking precedence."""
+    handlers = dict(_registry)
+    for name, spec in (getattr(settings, 'UNICOM_TOOL_HANDLERS', {}) or {}).items():
+        if not isinstance(spec, dict):
+            spec = {'handler': spec}
+        func = spec['handler']
+        handlers[name] = ToolHandler(
+            name,
+            import_string(func) if isinstance(func, str) else func,
+            spec.get('concurrency'),
+            spec.get('timeout'),
+        )
+    return handlers
+
+
+def lease_seconds():
+    return getattr(settings, 'UNICOM_TOOL_WORKER_LEASE_SECONDS', 60)
+
+
+def max_attempts():
+    return getattr(settings, 'UNICOM_TOOL_WORKER_MAX_ATTEMPTS', 3)
+
+
+def default_timeout():
+    return getattr(settings, 'UNICOM_TOOL_HANDLER_TIMEOUT', 300)
+
+
+def _run_in_thread(func, tool_call):
+    try:
+        return func(tool_call)
+    finally:
+        close_old_connections()
+
+
+def _init_process():
+    import django
+    django.setup()
+
+
+@dataclass
+class _Running:
+    tool_call: object
+    handler: ToolHandler
+    future: object
+    executor: object
+    deadline: float = None  # set once the handler starts
+
+
+class ToolWorker:
+    """Claims and runs tool calls; see the module docstring."""
+
+    def __init__(self, threads=8, processes=0, tools=None, worker_id=None):
+        self.worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}'
+        self.pool_size = processes or threads
+        self.processes = bool(processes)
+        self.executor = self._make_executor()
+        self.tools = tools
+        self.running = {}
+        # Timed-out handlers still occupying a pool worker, and process pools
+        # waiting to be terminated because one of their handlers hung
+        self.abandoned = []
+        self.retired = []
+        self.last_renewal = time.monotonic()
+        self.stats = {'claimed': 0, 'completed': 0, 'deferred': 0, 'failed': 0, 'timed_out': 0}
+
+    def _make_executor(self):
+        if self.processes:
+            return ProcessPoolExecutor(
+                max_workers=self.pool_size, mp_context=multiprocessing.get_context('spawn'), initializer=_init_process
+            )
+        return ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix='unicom-tool')
+
+    def handlers(self):
+        handlers = get_tool_handlers()
+        if self.tools is not None:
+            handlers = {name: h for name, h in handlers.items() if name in self.tools}
+        return handlers
+
+    def _capacity(self, handler):
+        self.abandoned = [r for r in self.abandoned if not r.future.done()]
+        occupied = [*self.running.values(), *self.abandoned]
+        busy = sum(1 for r in occupied if r.handler.name == handler.name)
+        free_total = self.pool_size - len(occupied)
+        return max(0, min(free_total, (handler.concurrency or self.pool_size) - busy))
+
+    def claim(self, tool_name, limit):
+        """Lease up to ``limit`` claimable PENDING calls of ``tool_name``."""
+        ToolCall = apps.get_model('unicom', 'ToolCall')
+        now = timezone.now()
+        with transaction.atomic():
+            ids = list(
+                ToolCall.objects.select_for_update(skip_locked=True)
+                .filter(status='PENDING', tool_name=tool_name)
+                .filter(models.Q(lease_expires_at__isnull=True) | models.Q(lease_expires_at__lt=now))
+                .order_by('created_at')
+                .values_list('id', flat=True)[:limit]
+            )
+            if ids:
+                ToolCall.objects.filter(id__in=ids).update(
+                    leased_by=self.worker_id,
+                    lease_expires_at=now + timedelta(seconds=lease_seconds()),
+                    started_at=now,
+                    attempts=models.F('attempts') + 1,
+                )
+        if not ids:
+            return []
+        return list(ToolCall.objects.filter(id__in=ids).select_related('request', 'tool_call_message').order_by('created_at'))
+
+    def _submit(self, tool_call, handler):
+        if tool_call.attempts > max_attempts():
+            self._respond(tool_call, {'error': f'Tool call abandoned after {tool_call.attempts - 1} attempts'}, 'ERROR')
+            self.stats['failed'] += 1
+            return
+        if self.processes:
+            future = self.executor.submit(handler.func, tool_call)
+        else:
+            future = self.executor.submit(_run_in_thread, handler.func, tool_call)
+        self.running[tool_call.pk] = _Running(tool_call, handler, future, self.executor)
+
+    def _abandon(self, entry):
+        """Keep a timed-out handler counted against the pool until it really stops."""
+        self.abandoned.append(entry)
+        if self.processes and entry.executor is self.executor:
+            # Send new calls to a fresh pool; the old one is terminated by
+            # _reap_pools once its other calls are done
+            self.retired.append(self.executor)
+            self.executor = self._make_executor()
+
+    def _reap_pools(self):
+        for executor in list(self.retired):
+            if any(r.executor is executor for r in self.running.values()):
+                continue
+            self.retired.remove(executor)
+            _terminate(executor)
+            self.abandoned = [r for r in self.abandoned if r.executor is not executor]
+
+    def _still_ours(self, tool_call):
+        ToolCall = apps.get_model('unicom', 'ToolCall')
+        current = ToolCall.objects.filter(pk=tool_call.pk).values('status', 'leased_by').first()
+        if not current or current['status'] != 'PENDING' or current['leased_by'] != self.worker_id:
+            return None
+        tool_call.refresh_from_db()
+        return tool_call
+
+    def _respond(self, tool_call, result, status='SUCCESS'):
+        tool_call.respond(result, status)
+        type(tool_call).objects.filter(pk=tool_call.pk).update(lease_expires_at=None, leased_by='')
+
+    def _finish(self, entry):
+        """Record the outcome of a finished (or timed out) handler."""
+        tool_call = self._still_ours(entry.tool_call)
+        if tool_call is None:
+            # Responded by the handler itself, or the lease was lost
+            self.stats['completed'] += 1
+            return
+        if not entry.future.done():
+            self._respond(tool_call, {'error': f'Tool {entry.handler.name} timed out after {entry.handler.timeout or default_timeout()}s'}, 'ERROR')
+            self.stats['timed_out'] += 1
+            return
+        try:
+            result = entry.future.result()
+        except Exception as exc:
+            logger.exception("Tool handler %s failed for call %s", entry.handler.name, tool_call.call_id)
+            self._respond(tool_call, {'error': str(exc) or type(exc).__name__}, 'ERROR')
+            self.stats['failed'] += 1
+            return
+        if result is None:
+            tool_call.start_processing()
+            type(tool_call).objects.filter(pk=tool_call.pk).update(lease_expires_at=None, leased_by='')
+            self.stats['deferred'] += 1
+        else:
+            self._respond(tool_call, result)
+            self.stats['completed'] += 1
+
+    def _renew_leases(self):
+        ToolCall = apps.get_model('unicom', 'ToolCall')
+        if self.running and time.monotonic() - self.last_renewal >= lease_seconds() / 3:
+            ToolCall.objects.filter(pk__in=list(self.running), leased_by=self.worker_id, status='PENDING').update(
+                lease_expires_at=timezone.now() + timedelta(seconds=lease_seconds())
+            )
+            self.last_renewal = time.monotonic()
+
+    def run_once(self):
+        """Collect finished handlers, renew leases and claim new calls. Returns the number claimed."""
+        now = time.monotonic()
+        for pk, entry in list(self.running.items()):
+            if entry.deadline is None and entry.future.running():
+                entry.deadline = now + (entry.handler.timeout or default_timeout())
+            if entry.future.done() or (entry.deadline is not None and now >= entry.deadline):
+                del self.running[pk]
+                if not entry.future.done():
+                    self._abandon(entry)
+                try:
+                    self._finish(entry)
+                except Exception:
+                    logger.exception("Could not record the result of tool call %s", entry.tool_call.call_id)
+        self._reap_pools()
+        self._renew_leases()
+
+        claimed = 0
+        for handler in self.handlers().values():
+            capacity = self._capacity(handler)
+            if not capacity:
+                continue
+            for tool_call in self.claim(handler.name, capacity):
+                claimed += 1
+                self._submit(tool_call, handler)
+        self.stats['claimed'] += claimed
+        return claimed
+
+    def run(self, poll_interval=1.0, stop_event=None, until_idle=False):
+        """
+        Process calls until ``stop_event`` is set (or, with ``until_idle``,
+        until nothing is running or claimable).
+        """
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            claimed = self.run_once()
+            if until_idle and not claimed and not self.running:
+                break
+            if not claimed:
+                # Poll quickly while handlers are running so results are recorded promptly
+                stop_event.wait(min(poll_interval, 0.05) if self.running else poll_interval)
+
+    def shutdown(self, wait=True):
+        for executor in self.retired:
+            _terminate(executor)
+        self.retired = []
+        self.executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def _terminate(executor):
+    """Stop a process pool without waiting for hung handlers."""
+    for process in list((getattr(executor, '_processes', None) or {}).values()):
+        process.terminate()
+    executor.shutdown(wait=False, cancel_futures=True)
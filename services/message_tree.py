@@ -0,0 +1,193 @@
+"""
+Conversation tree queries over ``Message.reply_to_message``.
+
+Editing and branching in WebChat (and threaded LLM context) need the chain of
+ancestors of a message. Walking ``reply_to_message`` in Python costs one query
+per hop. Saved messages carry a materialized path (``Message.ancestor_ids``,
+root-most first, capped to the nearest ``UNICOM_MESSAGE_PATH_MAX_DEPTH``
+ancestors) and ``thread_depth``; rows that predate those fields, or chains
+deeper than the cap, fall back to a single recursive CTE.
+"""
+from django.apps import apps
+from django.conf import settings
+from django.db import connection
+
+# Cycle guard for walks that must reach the thread root.
+UNBOUNDED_DEPTH = 1_000_000
+
+
+def path_max_depth():
+    return getattr(settings, 'UNICOM_MESSAGE_PATH_MAX_DEPTH', 256)
+
+
+def ancestor_depths(message_ids, max_depth):
+    """
+    Return ``{message_id: depth}`` for the given messages and their ancestors.
+
+    Each start message has depth 0, its parent depth 1 and so on, following
+    ``reply_to_message`` for at most ``max_depth`` messages per chain (so
+    ``max_depth=1`` returns only the start messages). When chains overlap the
+    smallest depth wins.
+    """
+    message_ids = list(message_ids)
+    if not message_ids or max_depth < 1:
+        return {}
+    Message = apps.get_model('unicom', 'Message')
+    table = connection.ops.quote_name(Message._meta.db_table)
+    sql = f"""
+        WITH RECURSIVE chain(id, parent_id, depth) AS (
+            SELECT id, reply_to_message_id, 0
+            FROM {table}
+            WHERE id = ANY(%s)
+          UNION
+            SELECT m.id, m.reply_to_message_id, chain.depth + 1
+            FROM {table} m
+            JOIN chain ON m.id = chain.parent_id
+            WHERE chain.depth + 1 < %s
+        )
+        SELECT id, MIN(depth) FROM chain GROUP BY id
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [message_ids, max_depth])
+        return dict(cursor.fetchall())
+
+
+def ancestor_chain(message_id, max_depth):
+    """Ids of ``message_id`` and its ancestors, nearest first."""
+    depths = ancestor_depths([message_id], max_depth)
+    return sorted(depths, key=depths.get)
+
+
+def materialize_thread_path(parent_id):
+    """Return ``(ancestor_ids, thread_depth)`` for a message replying to ``parent_id``."""
+    if not parent_id:
+        return [], 0
+    Message = apps.get_model('unicom', 'Message')
+    parent = Message.objects.filter(pk=parent_id).values_list('ancestor_ids', 'thread_depth').first()
+    if parent is None:
+        return [], 0
+    path, depth = parent
+    if depth is None:
+        chain = ancestor_chain(parent_id, UNBOUNDED_DEPTH)
+        return list(reversed(chain))[-path_max_depth():], len(chain)
+    return (list(path) + [parent_id])[-path_max_depth():], depth + 1
+
+
+def rewrite_descendant_paths(message_id, path, depth):
+    """
+    After ``message_id`` moved to ``(path, depth)``, rewrite the materialized
+    path and depth of every reply below it in one UPDATE. Each descendant keeps
+    the part of its path after ``message_id`` and gets the new prefix, capped
+    like any other path. Descendants whose capped path no longer reaches
+    ``message_id`` keep their path (still correct) but not their depth.
+    Returns the number of rows updated.
+    """
+    Message = apps.get_model('unicom', 'Message')
+    table = connection.ops.quote_name(Message._meta.db_table)
+    sql = f"""
+        UPDATE {table} AS m
+        SET ancestor_ids = moved.path[GREATEST(cardinality(moved.path) - %(cap)s + 1, 1):],
+            thread_depth = %(depth)s + cardinality(m.ancestor_ids) - array_position(m.ancestor_ids, %(id)s) + 1
+        FROM (
+            SELECT id, %(prefix)s::varchar[] || ancestor_ids[array_position(ancestor_ids, %(id)s) + 1:] AS path
+            FROM {table}
+            WHERE ancestor_ids @> ARRAY[%(id)s]::varchar[]
+        ) AS moved
+        WHERE m.id = moved.id
+    """
+    params = {'id': message_id, 'prefix': list(path) + [message_id], 'depth': depth, 'cap': path_max_depth()}
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+
+def materialized_chain_ids(message, max_depth):
+    """
+    Ids of ``message`` and up to ``max_depth - 1`` ancestors, nearest first,
+    read from the materialized path. None when the path does not cover them.
+    """
+    if message.thread_depth is None:
+        return None
+    wanted = max_depth - 1
+    path = message.ancestor_ids or []
+    if len(path) < min(wanted, message.thread_depth):
+        return None
+    return [message.id] + path[::-1][:wanted]
+
+
+def thread_chain_ids(message, max_depth):
+    """Like ``ancestor_chain`` but served from the materialized path when possible."""
+    ids = materialized_chain_ids(message, max_depth)
+    if ids is None:
+        ids = ancestor_chain(message.id, max_depth) or [message.id]
+    return ids
+
+
+def branch_context_ids(messages, max_depth):
+    """Ids of ``messages`` plus up to ``max_depth - 1`` ancestors of each."""
+    context = set()
+    unresolved = []
+    for message in messages:
+        ids = materialized_chain_ids(message, max_depth)
+        if ids is None:
+            unresolved.append(message.id)
+        else:
+            context.update(ids)
+    if unresolved:
+        context.update(ancestor_depths(unresolved, max_depth))
+    return context
+
+
+def backfill_thread_paths(chat_id=None, batch_size=1000):
+    """
+    Materialize ``ancestor_ids``/``thread_depth`` for messages that lack them.
+    Works one chat at a time in memory. Returns the number of rows updated.
+    """
+    Message = apps.get_model('unicom', 'Message')
+    pending = Message.objects.filter(thread_depth__isnull=True)
+    if chat_id is not None:
+        pending = pending.filter(chat_id=chat_id)
+    chat_ids = list(pending.order_by().values_list('chat_id', flat=True).distinct())
+    cap = path_max_depth()
+    updated = 0
+    for current_chat in chat_ids:
+        rows = {
+            pk: (parent_id, path, depth)
+            for pk, parent_id, path, depth in Message.objects.filter(chat_id=current_chat)
+            .values_list('id', 'reply_to_message_id', 'ancestor_ids', 'thread_depth')
+        }
+        resolved = {
+            pk: (list(path), depth) for pk, (_, path, depth) in rows.items() if depth is not None
+        }
+
+        def resolve(pk):
+            stack, seen = [], set()
+            while pk not in resolved:
+                if pk not in rows:
+                    # Parent outside this chat: ask the database.
+                    chain = ancestor_chain(pk, UNBOUNDED_DEPTH)
+                    resolved[pk] = (list(reversed(chain[1:]))[-cap:], max(len(chain) - 1, 0))
+                    break
+                parent_id = rows[pk][0]
+                if parent_id is None or parent_id in seen or parent_id == pk:
+                    resolved[pk] = ([], 0)
+                    break
+                stack.append(pk)
+                seen.add(pk)
+                pk = parent_id
+            while stack:
+                child = stack.pop()
+                parent_id = rows[child][0]
+                parent_path, parent_depth = resolved[parent_id]
+                resolved[child] = ((parent_path + [parent_id])[-cap:], parent_depth + 1)
+
+        batch = []
+        for pk, (_, _, depth) in rows.items():
+            if depth is not None:
+                continue
+            resolve(pk)
+            path, thread_depth = resolved[pk]
+            batch.append(Message(pk=pk, ancestor_ids=path, thread_depth=thread_depth))
+        Message.objects.bulk_update(batch, ['ancestor_ids', 'thread_depth'], batch_size=batch_size)
+        updated += len(batch)
+    return updated
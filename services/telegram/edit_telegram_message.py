@@ -17,6 +17,7 @@ def edit_telegram_message(channel: Channel, message: Message, params: dict) -> b
         message: The message to edit
         params: Dictionary with new content:
             - text: New message text
+            - parse_mode: Parse mode for the text (default 'Markdown'; None sends plain text)
             - reply_markup: New inline keyboard buttons
 
     Returns:
@@ -42,7 +43,9 @@ def edit_telegram_message(channel: Channel, message: Message, params: dict) -> b
     # Add new content
     if 'text' in params:
         edit_params['text'] = params['text']
-        edit_params['parse_mode'] = params.get('parse_mode', 'Markdown')
+        parse_mode = params.get('parse_mode', 'Markdown')
+        if parse_mode:
+            edit_params['parse_mode'] = parse_mode
 
     # Add new buttons if provided
     if 'reply_markup' in params:
@@ -0,0 +1,74 @@
+"""
+Conditional GET support for the WebChat history and chat list APIs.
+
+The widget refreshes both endpoints every few seconds. Each endpoint derives a
+cheap version token (chat/account ``updated_at`` values plus the query string
+and account) and answers a matching ``If-None-Match`` with 304 before running
+its full query. Counts of 304 vs 200 responses are kept in the Django cache,
+see ``get_conditional_stats``.
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.http import HttpResponseNotModified
+from django.utils.http import http_date
+
+STATS_KEY = 'unicom:webchat:conditional:{endpoint}:{status}'
+
+
+def compute_etag(*parts):
+    digest = hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+def _matches(request, etag):
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    candidates = {tag.strip().removeprefix('W/') for tag in header.split(',')}
+    return etag in candidates or '*' in candidates
+
+
+def _count(endpoint, status):
+    key = STATS_KEY.format(endpoint=endpoint, status=status)
+    try:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+    except Exception:
+        pass
+
+
+def apply_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    # Always revalidate; the data is per-account.
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def not_modified_response(request, endpoint, etag, last_modified=None):
+    """Return a 304 response when ``If-None-Match`` matches, else None."""
+    if not _matches(request, etag):
+        return None
+    _count(endpoint, 304)
+    return apply_validators(HttpResponseNotModified(), etag, last_modified)
+
+
+def finalize_response(endpoint, response, etag, last_modified=None):
+    """Attach validators to a full (200) response and count it."""
+    if response.status_code == 200:
+        _count(endpoint, 200)
+        apply_validators(response, etag, last_modified)
+    return response
+
+
+def get_conditional_stats():
+    """``{endpoint: {'304': n, '200': n}}`` for the WebChat conditional endpoints."""
+    stats = {}
+    for endpoint in ('messages', 'chats'):
+        stats[endpoint] = {
+            str(status): cache.get(STATS_KEY.format(endpoint=endpoint, status=status), 0)
+            for status in (304, 200)
+        }
+    return stats
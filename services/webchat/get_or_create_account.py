@@ -4,6 +4,8 @@ Handles account creation and retrieval for both authenticated and guest users.
 """
 from django.apps import apps
 
+from unicom.services.webchat.resolution_cache import get_cached_account, remember_account
+
 
 def get_or_create_account(channel, request):
     """
@@ -23,6 +25,9 @@ def get_or_create_account(channel, request):
 
     Returns:
         Account instance
+
+    Resolved accounts are cached briefly per request and per process, see
+    ``unicom.services.webchat.resolution_cache``.
     """
     Account = apps.get_model('unicom', 'Account')
     Member = apps.get_model('unicom', 'Member')
@@ -32,6 +37,9 @@ def get_or_create_account(channel, request):
     if user.is_authenticated:
         # Authenticated user
         account_id = f"webchat_user_{user.id}"
+        account = get_cached_account(request, account_id)
+        if account is not None:
+            return account
         name = user.get_full_name() or user.username
 
         account, created = Account.objects.get_or_create(
@@ -45,7 +53,7 @@ def get_or_create_account(channel, request):
         )
 
         # Link to Member model if exists and not already linked
-        if not account.member:
+        if not account.member_id:
             try:
                 # Try to find member by user's email
                 member = Member.objects.filter(email=user.email).first()
@@ -63,6 +71,7 @@ def get_or_create_account(channel, request):
             except Exception as e:
                 print(f"Warning: Could not link account to member: {e}")
 
+        remember_account(request, account)
         return account
 
     else:
@@ -73,6 +82,9 @@ def get_or_create_account(channel, request):
 
         session_key = request.session.session_key
         account_id = f"webchat_guest_{session_key}"
+        account = get_cached_account(request, account_id)
+        if account is not None:
+            return account
 
         account, created = Account.objects.get_or_create(
             id=account_id,
@@ -84,4 +96,5 @@ def get_or_create_account(channel, request):
             }
         )
 
+        remember_account(request, account)
         return account
@@ -0,0 +1,298 @@
+"""
+WebChat WebSocket load test.
+
+Connects simulated clients to ``WebChatConsumer`` through an in-process ASGI
+communicator (no network or ASGI server involved), injects
+messages into their chats at a fixed rate, and measures:
+
+- delivery latency (message save to receipt by each subscribed client);
+- CPU time of the process relative to wall time;
+- database queries per second, split into message injection and everything
+  else (account checks, polling, ...), counted with ``connection.execute_wrapper``.
+
+``mode='push'`` uses a channel layer (in-memory or Redis) so messages are
+pushed from ``post_save``; ``mode='poll'`` runs without a channel layer and
+with ``UNICOM_WEBCHAT_POLLING_FALLBACK`` so consumers share per-chat pollers.
+Used by the ``webchat_loadtest`` management command.
+
+The run creates a temporary WebChat channel, user and chats, and deletes them
+afterwards unless ``keep_data`` is set. Requires Django Channels.
+"""
+import asyncio
+import contextvars
+import itertools
+import json
+import statistics
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+
+from asgiref.testing import ApplicationCommunicator
+from django.apps import apps
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+_injecting = contextvars.ContextVar('unicom_loadtest_injecting', default=False)
+
+
+@dataclass
+class LoadTestReport:
+    mode: str
+    layer: str
+    clients: int
+    chats: int
+    duration: float
+    messages_sent: int = 0
+    deliveries_expected: int = 0
+    latencies_ms: list = field(default_factory=list)
+    cpu_seconds: float = 0.0
+    injection_queries: int = 0
+    delivery_queries: int = 0
+    connect_failures: int = 0
+
+    @property
+    def deliveries(self):
+        return len(self.latencies_ms)
+
+    def percentile(self, pct):
+        if not self.latencies_ms:
+            return None
+        ordered = sorted(self.latencies_ms)
+        index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+    def as_dict(self):
+        return {
+            'mode': self.mode,
+            'layer': self.layer,
+            'clients': self.clients,
+            'chats': self.chats,
+            'duration_s': round(self.duration, 2),
+            'messages_sent': self.messages_sent,
+            'deliveries': self.deliveries,
+            'deliveries_expected': self.deliveries_expected,
+            'connect_failures': self.connect_failures,
+            'latency_ms': {
+                'p50': self.percentile(50),
+                'p90': self.percentile(90),
+                'p99': self.percentile(99),
+                'max': max(self.latencies_ms) if self.latencies_ms else None,
+                'mean': round(statistics.fmean(self.latencies_ms), 2) if self.latencies_ms else None,
+            },
+            'cpu_percent': round(100 * self.cpu_seconds / self.duration, 1) if self.duration else None,
+            'queries_per_second': {
+                'injection': round(self.injection_queries / self.duration, 1) if self.duration else None,
+                'delivery': round(self.delivery_queries / self.duration, 1) if self.duration else None,
+            },
+        }
+
+
+class _QueryCounter:
+    """``execute_wrapper`` hook counting queries, split by injection vs. the rest."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.injection = 0
+        self.delivery = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            if _injecting.get():
+                self.injection += 1
+            else:
+                self.delivery += 1
+        return execute(sql, params, many, context)
+
+
+class _SocketClient(ApplicationCommunicator):
+    """
+    In-process WebChat socket. Same as ``channels.testing.WebsocketCommunicator``,
+    which cannot be imported without daphne installed.
+    """
+
+    def __init__(self, application, chat_id, channel_id, user):
+        super().__init__(application, {
+            'type': 'websocket',
+            'path': f'/ws/unicom/webchat/{chat_id}/',
+            'query_string': f'channel_id={channel_id}'.encode(),
+            'headers': [],
+            'subprotocols': [],
+            'user': user,
+            'url_route': {'kwargs': {'chat_id': chat_id}},
+        })
+
+    async def connect(self, timeout=10):
+        await self.send_input({'type': 'websocket.connect'})
+        response = await self.receive_output(timeout)
+        return response['type'] == 'websocket.accept'
+
+    async def receive_json(self, timeout=10):
+        """Next JSON frame, or None once the socket was closed."""
+        response = await self.receive_output(timeout)
+        if response['type'] != 'websocket.send':
+            return None
+        return json.loads(response['text'])
+
+    async def disconnect(self):
+        await self.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await self.wait(1)
+
+
+def channel_layers_for(layer, redis_url=None):
+    if layer == 'memory':
+        return {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+    if layer == 'redis':
+        return {
+            'default': {
+                'BACKEND': 'channels_redis.core.RedisChannelLayer',
+                'CONFIG': {'hosts': [redis_url or 'redis://127.0.0.1:6379/0']},
+            }
+        }
+    raise ValueError(f"Unknown channel layer {layer!r}")
+
+
+def create_fixtures(chats):
+    """Create a throwaway WebChat channel, user, account and ``chats`` chats."""
+    from django.contrib.auth import get_user_model
+    from unicom.services.webchat.get_or_create_account import get_or_create_account
+
+    Channel = apps.get_model('unicom', 'Channel')
+    Chat = apps.get_model('unicom', 'Chat')
+    AccountChat = apps.get_model('unicom', 'AccountChat')
+
+    run_id = uuid.uuid4().hex[:8]
+    channel = Channel.objects.create(name=f'WebChat load test {run_id}', platform='WebChat', config={}, active=True)
+    user = get_user_model().objects.create_user(f'webchat_loadtest_{run_id}')
+
+    class _Request:
+        pass
+
+    request = _Request()
+    request.user = user
+    account = get_or_create_account(channel, request)
+    chat_objects = Chat.objects.bulk_create([
+        Chat(id=f'loadtest_{run_id}_{i}', channel=channel, platform='WebChat', name=f'Load test {i}')
+        for i in range(chats)
+    ])
+    AccountChat.objects.bulk_create([AccountChat(account=account, chat=chat) for chat in chat_objects])
+    return channel, user, account, [chat.id for chat in chat_objects]
+
+
+def delete_fixtures(channel, user):
+    channel.delete()
+    user.delete()
+
+
+async def _run(channel, user, account, chat_ids, clients, rate, duration, report, counter):
+    from channels.db import database_sync_to_async
+    from unicom.consumers.webchat_consumer import WebChatConsumer
+
+    Message = apps.get_model('unicom', 'Message')
+    application = WebChatConsumer.as_asgi()
+    sent_at = {}
+    subscribers = {chat_id: 0 for chat_id in chat_ids}
+
+    @database_sync_to_async
+    def install_counter():
+        if counter not in connection.execute_wrappers:
+            connection.execute_wrappers.append(counter)
+
+    @database_sync_to_async
+    def inject(chat_id):
+        message_id = f'loadtest_{uuid.uuid4().hex}'
+        sent_at[message_id] = time.perf_counter()
+        Message.objects.create(
+            id=message_id, channel=channel, platform='WebChat', chat_id=chat_id, sender=account,
+            sender_name=account.name, is_outgoing=True, text='load test', timestamp=timezone.now(),
+            raw={'load_test': True},
+        )
+
+    async def connect(chat_id):
+        client = _SocketClient(application, chat_id, channel.pk, user)
+        if not await client.connect() or await client.receive_json() is None:  # "ready"
+            report.connect_failures += 1
+            return None
+        subscribers[chat_id] += 1
+        return client
+
+    async def listen(client):
+        while True:
+            data = await client.receive_json(timeout=3600)
+            if data is None:
+                return
+            if data.get('type') == 'new_message':
+                started = sent_at.get(data['message']['id'])
+                if started is not None:
+                    report.latencies_ms.append(round((time.perf_counter() - started) * 1000, 2))
+
+    await install_counter()
+    clients_connected = [
+        c for c in await asyncio.gather(
+            *(connect(chat_ids[i % len(chat_ids)]) for i in range(clients))
+        ) if c is not None
+    ]
+    listeners = [asyncio.ensure_future(listen(c)) for c in clients_connected]
+
+    # Reset after connecting so the numbers cover steady state only.
+    counter.injection = counter.delivery = 0
+    cpu_started, wall_started = time.process_time(), time.perf_counter()
+    chat_cycle = itertools.cycle(chat_ids)
+    interval = 1 / rate
+    next_send = wall_started
+    while time.perf_counter() - wall_started < duration:
+        chat_id = next(chat_cycle)
+        token = _injecting.set(True)
+        try:
+            await inject(chat_id)
+        finally:
+            _injecting.reset(token)
+        report.messages_sent += 1
+        report.deliveries_expected += subscribers[chat_id]
+        next_send += interval
+        await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+
+    # Let in-flight deliveries land (polling may lag by its backoff interval).
+    drain_deadline = time.perf_counter() + 20
+    while report.deliveries < report.deliveries_expected and time.perf_counter() < drain_deadline:
+        await asyncio.sleep(0.05)
+
+    report.duration = time.perf_counter() - wall_started
+    report.cpu_seconds = time.process_time() - cpu_started
+    report.injection_queries, report.delivery_queries = counter.injection, counter.delivery
+
+    for task in listeners:
+        task.cancel()
+    await asyncio.gather(*listeners, return_exceptions=True)
+    for client in clients_connected:
+        await client.disconnect()
+
+    @database_sync_to_async
+    def remove_counter():
+        if counter in connection.execute_wrappers:
+            connection.execute_wrappers.remove(counter)
+
+    await remove_counter()
+
+
+def run_load_test(clients=100, chats=10, rate=10.0, duration=10.0, mode='push', layer='memory',
+                  redis_url=None, keep_data=False):
+    """Run one load test and return a ``LoadTestReport``."""
+    if mode not in ('push', 'poll'):
+        raise ValueError("mode must be 'push' or 'poll'")
+    if mode == 'push':
+        overrides = {'CHANNEL_LAYERS': channel_layers_for(layer, redis_url)}
+    else:
+        layer = 'none'
+        overrides = {'CHANNEL_LAYERS': {}, 'UNICOM_WEBCHAT_POLLING_FALLBACK': True}
+
+    report = LoadTestReport(mode=mode, layer=layer, clients=clients, chats=chats, duration=duration)
+    channel, user, account, chat_ids = create_fixtures(chats)
+    try:
+        with override_settings(**overrides):
+            asyncio.run(_run(channel, user, account, chat_ids, clients, rate, duration, report, _QueryCounter()))
+    finally:
+        if not keep_data:
+            delete_fixtures(channel, user)
+    return report
@@ -0,0 +1,167 @@
+"""
+Wake-ups for WebChat long-poll requests.
+
+``webchat/wait/`` parks a request on a per-chat waiter instead of re-querying
+the database in a loop. Committed WebChat messages call ``notify_chat``, which
+wakes waiters in this process and, on Postgres, sends ``pg_notify`` on the
+``unicom_webchat`` channel. A daemon thread per process LISTENs on that channel
+so requests served by other workers wake as well. Set
+``UNICOM_WEBCHAT_PG_NOTIFY = False`` to stay process-local (single worker, or
+when the database is behind a pooler that does not support LISTEN).
+
+Waiters are asyncio futures bound to the loop that created them and are woken
+with ``call_soon_threadsafe``, so notifications can come from any thread. This
+works under ASGI and under threaded WSGI, where each async view call runs its
+own event loop.
+"""
+import asyncio
+import logging
+import select
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = 'unicom_webchat'
+LISTENER_RETRY_SECONDS = 5
+
+
+def pg_notify_enabled():
+    return getattr(settings, 'UNICOM_WEBCHAT_PG_NOTIFY', connection.vendor == 'postgresql')
+
+
+class ChatWaiter:
+    """One parked request waiting for activity in ``chat_id``."""
+
+    __slots__ = ('chat_id', 'loop', 'future')
+
+    def __init__(self, chat_id, loop):
+        self.chat_id = chat_id
+        self.loop = loop
+        self.future = loop.create_future()
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+    def wake(self):
+        try:
+            self.loop.call_soon_threadsafe(self._resolve)
+        except RuntimeError:
+            # The request's loop already finished.
+            pass
+
+    async def wait(self, timeout):
+        """True when woken, False when ``timeout`` seconds pass first."""
+        try:
+            await asyncio.wait_for(asyncio.shield(self.future), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class ChatNotifier:
+    """Process-wide registry of long-poll waiters keyed by chat id."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = {}
+        self._listener = None
+
+    def subscribe(self, chat_id, loop=None):
+        """
+        Register a waiter for ``chat_id``. Subscribe *before* checking for new
+        messages so a message committed in between still wakes the waiter.
+        """
+        waiter = ChatWaiter(chat_id, loop or asyncio.get_running_loop())
+        with self._lock:
+            self._waiters.setdefault(chat_id, set()).add(waiter)
+        if pg_notify_enabled():
+            self._ensure_listener()
+        return waiter
+
+    def unsubscribe(self, waiter):
+        with self._lock:
+            waiters = self._waiters.get(waiter.chat_id)
+            if waiters is not None:
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._waiters[waiter.chat_id]
+
+    def notify_local(self, chat_id):
+        """Wake every waiter for ``chat_id`` in this process."""
+        with self._lock:
+            waiters = self._waiters.pop(chat_id, ())
+        for waiter in waiters:
+            waiter.wake()
+        return len(waiters)
+
+    def waiter_count(self, chat_id=None):
+        with self._lock:
+            if chat_id is not None:
+                return len(self._waiters.get(chat_id, ()))
+            return sum(len(waiters) for waiters in self._waiters.values())
+
+    def _ensure_listener(self):
+        with self._lock:
+            if self._listener is not None and self._listener.is_alive():
+                return
+            self._listener = _PgListener(self)
+            self._listener.start()
+
+
+class _PgListener(threading.Thread):
+    """LISTENs on ``NOTIFY_CHANNEL`` over a dedicated connection and relays to the notifier."""
+
+    def __init__(self, notifier):
+        super().__init__(name='unicom-webchat-listener', daemon=True)
+        self.notifier = notifier
+
+    def run(self):
+        while True:
+            try:
+                self._listen()
+            except Exception:
+                logger.exception("WebChat LISTEN connection failed; retrying in %ss", LISTENER_RETRY_SECONDS)
+                time.sleep(LISTENER_RETRY_SECONDS)
+
+    def _listen(self):
+        db = connections.create_connection(DEFAULT_DB_ALIAS)
+        try:
+            db.ensure_connection()
+            raw = db.connection
+            with raw.cursor() as cursor:
+                cursor.execute(f'LISTEN {NOTIFY_CHANNEL}')
+            if callable(getattr(raw, 'notifies', None)):
+                # psycopg 3
+                while True:
+                    for notify in raw.notifies(timeout=30):
+                        self.notifier.notify_local(notify.payload)
+            else:
+                # psycopg2
+                while True:
+                    if select.select([raw], [], [], 30) == ([], [], []):
+                        continue
+                    raw.poll()
+                    while raw.notifies:
+                        self.notifier.notify_local(raw.notifies.pop(0).payload)
+        finally:
+            db.close()
+
+
+chat_notifier = ChatNotifier()
+
+
+def notify_chat(chat_id):
+    """Wake long-poll requests for ``chat_id`` here and, via pg_notify, in other workers."""
+    chat_notifier.notify_local(chat_id)
+    if not pg_notify_enabled():
+        return
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [NOTIFY_CHANNEL, str(chat_id)])
+    except Exception:
+        logger.exception("Failed to send WebChat pg_notify for chat %s", chat_id)
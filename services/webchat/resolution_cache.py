@@ -0,0 +1,119 @@
+"""
+Short-lived caches for WebChat channel and account resolution.
+
+Every WebChat API call resolves the active channel and the caller's Account
+(plus its Member link) before doing any real work. Resolved instances are kept
+per process for ``UNICOM_WEBCHAT_RESOLUTION_CACHE_TTL`` seconds (default 30;
+0 disables caching) and memoized on the request, so repeated calls within one
+request or session skip the lookups entirely.
+
+Account, Member and Channel saves/deletes evict the affected entries in this
+process (see ``signals.py``), so blocking an account takes effect immediately
+here and within the TTL in other workers. Callers get a copy of the cached
+instance and may modify it freely.
+"""
+import copy
+import threading
+import time
+
+from django.apps import apps
+from django.conf import settings
+
+REQUEST_MEMO_ATTR = '_unicom_webchat_accounts'
+
+
+def cache_ttl():
+    return getattr(settings, 'UNICOM_WEBCHAT_RESOLUTION_CACHE_TTL', 30)
+
+
+class TTLCache:
+    """Thread-safe dict whose entries expire ``cache_ttl()`` seconds after being set."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key, value):
+        ttl = cache_ttl()
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+
+    def evict(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+channel_cache = TTLCache()
+account_cache = TTLCache()
+
+
+def get_webchat_channel(channel_id=None):
+    """
+    The requested active WebChat channel (if ``channel_id`` is given) or the
+    first active one. Raises ValueError when there is none.
+    """
+    key = str(channel_id) if channel_id else None
+    channel = channel_cache.get(key)
+    if channel is None:
+        Channel = apps.get_model('unicom', 'Channel')
+        qs = Channel.objects.filter(platform='WebChat', active=True)
+        if channel_id:
+            qs = qs.filter(id=channel_id)
+        channel = qs.first()
+        if not channel:
+            raise ValueError("No active WebChat channel found")
+        channel_cache.set(key, channel)
+    return copy.copy(channel)
+
+
+def get_cached_account(request, account_id):
+    """The resolved Account for ``account_id`` from the request memo or process cache."""
+    memo = getattr(request, REQUEST_MEMO_ATTR, None)
+    if memo and account_id in memo:
+        return memo[account_id]
+    account = account_cache.get(account_id)
+    if account is None:
+        return None
+    account = copy.copy(account)
+    remember_account(request, account, shared=False)
+    return account
+
+
+def remember_account(request, account, shared=True):
+    """Memoize ``account`` on the request and, if ``shared``, in the process cache."""
+    memo = getattr(request, REQUEST_MEMO_ATTR, None)
+    if memo is None:
+        memo = {}
+        setattr(request, REQUEST_MEMO_ATTR, memo)
+    memo[account.pk] = account
+    if shared:
+        account_cache.set(account.pk, copy.copy(account))
+
+
+def evict_account(account_id):
+    account_cache.evict(account_id)
+
+
+def clear_resolution_caches():
+    channel_cache.clear()
+    account_cache.clear()
@@ -0,0 +1,136 @@
+"""
+Shared WebChat message serialization.
+
+Used by the REST API, the WebSocket consumer and channel layer broadcasts so
+the three always emit the same payload. Serialization only reads concrete
+columns and ``*_id`` fields, so it never triggers related-object queries, and
+works on model instances as well as ``.values(*MESSAGE_PAYLOAD_FIELDS)`` rows.
+
+Payloads are cached per process by (message id, updated_at) together with
+their encoded JSON, so history loads and broadcasts reuse the same bytes.
+Size is bounded by ``UNICOM_WEBCHAT_PAYLOAD_CACHE_SIZE`` (default 5000 entries).
+"""
+import json
+import threading
+from collections import OrderedDict
+
+from django.apps import apps
+from django.conf import settings
+from django.http import HttpResponse
+
+from unicom.services.image_variants import message_thumbnail_url
+
+MESSAGE_PAYLOAD_FIELDS = (
+    'id',
+    'text',
+    'html',
+    'is_outgoing',
+    'sender_name',
+    'timestamp',
+    'updated_at',
+    'media_type',
+    'media',
+    'reply_to_message_id',
+    'raw',
+)
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+class SerializedMessage:
+    """A message payload and its JSON encoding."""
+
+    __slots__ = ('message_id', 'payload', '_encoded')
+
+    def __init__(self, message_id, payload):
+        self.message_id = message_id
+        self.payload = payload
+        self._encoded = None
+
+    @property
+    def encoded(self):
+        if self._encoded is None:
+            self._encoded = json.dumps(self.payload, separators=(',', ':'))
+        return self._encoded
+
+
+def _max_entries():
+    return getattr(settings, 'UNICOM_WEBCHAT_PAYLOAD_CACHE_SIZE', 5000)
+
+
+def _media_url(media_name):
+    if not media_name:
+        return None
+    Message = apps.get_model('unicom', 'Message')
+    return Message._meta.get_field('media').storage.url(media_name)
+
+
+def _build_payload(row):
+    raw = row['raw'] or {}
+    media_type = row['media_type']
+    media_name = row['media'] or None
+    return {
+        'id': row['id'],
+        'text': row['text'],
+        'html': row['html'],
+        'is_outgoing': row['is_outgoing'],
+        'sender_name': row['sender_name'],
+        'timestamp': row['timestamp'].isoformat(),
+        'media_type': media_type,
+        'media_url': _media_url(media_name),
+        'thumbnail_url': message_thumbnail_url(row['id'], media_name, media_type),
+        'reply_to_message_id': row['reply_to_message_id'],
+        'interactive_buttons': raw.get('interactive_buttons'),
+        'progress_updates_for_user': raw.get('tool_call', {}).get('arguments', {}).get('progress_updates_for_user') if media_type == 'tool_call' else None,
+        'result_status': raw.get('tool_response', {}).get('result', {}).get('status') if media_type == 'tool_response' else None,
+    }
+
+
+def _row_from_instance(message):
+    row = {field: getattr(message, field) for field in MESSAGE_PAYLOAD_FIELDS if field != 'media'}
+    row['media'] = message.media.name if message.media else None
+    return row
+
+
+def serialize_message_row(row):
+    """Return the cached ``SerializedMessage`` for a ``.values()`` row."""
+    key = (row['id'], row['updated_at'])
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            _cache.move_to_end(key)
+            return entry
+    entry = SerializedMessage(row['id'], _build_payload(row))
+    with _lock:
+        _cache[key] = entry
+        while len(_cache) > _max_entries():
+            _cache.popitem(last=False)
+    return entry
+
+
+def serialize_message(message):
+    """Return the cached ``SerializedMessage`` for a Message instance."""
+    return serialize_message_row(_row_from_instance(message))
+
+
+def message_payload(message):
+    """JSON-ready dict for a Message instance."""
+    return serialize_message(message).payload
+
+
+def clear_payload_cache():
+    with _lock:
+        _cache.clear()
+
+
+def messages_json_response(data, messages, key='messages'):
+    """
+    JsonResponse equivalent that splices pre-encoded message payloads into
+    ``data[key]`` instead of re-encoding them.
+    """
+    head = json.dumps({k: v for k, v in data.items() if k != key})
+    items = ','.join(entry.encoded for entry in messages)
+    separator = ', ' if head != '{}' else ''
+    body = '{"%s": [%s]%s%s' % (key, items, separator, head[1:])
+    return HttpResponse(body, content_type='application/json')
@@ -1,4 +1,7 @@
-from unicom.models import Message, AccountChat, Channel, Request
+from unicom.models import Message, Account, AccountChat, Channel, Chat, Member, Request, EmailInlineImage
+from unicom.models.message_template import MessageTemplate, MessageTemplateInlineImage
+from unicom.services.html_render_cache import render_cache
+from unicom.services.webchat.resolution_cache import account_cache, channel_cache, evict_account
 from django.dispatch import Signal
 from django.db import transaction
 from django.db.models.signals import post_save, pre_save, post_delete
@@ -31,6 +34,26 @@ def channel_pre_save(sender, instance, **kwargs):
             instance._old_config = None
 
 
+@receiver(post_save, sender=Channel)
+@receiver(post_delete, sender=Channel)
+def evict_cached_webchat_channels(sender, instance, **kwargs):
+    """Activation, config or default-channel changes invalidate cached WebChat channel lookups."""
+    channel_cache.clear()
+
+
+@receiver(post_save, sender=Account)
+@receiver(post_delete, sender=Account)
+def evict_cached_webchat_account(sender, instance, **kwargs):
+    """Drop the cached resolution so blocking or relinking an account applies immediately."""
+    evict_account(instance.pk)
+
+
+@receiver(post_delete, sender=Member)
+def evict_cached_webchat_accounts_for_member(sender, instance, **kwargs):
+    # Deleting a member nulls Account.member via a bulk update, which sends no Account signals.
+    account_cache.clear()
+
+
 @receiver(post_save, sender=Channel)
 def run_channel_after_insert(sender, instance, created, **kwargs):
     # Check if created or config changed
@@ -149,3 +172,62 @@ def mark_email_seen_on_request_completed(sender, instance, **kwargs):
     except Exception as e:
         logger = logging.getLogger(__name__)
         logger.warning(f"Failed to mark email as seen for Message ID/UID {uid} on channel {channel.pk}: {e}")
+
+
+
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+@receiver(post_save, sender=MessageTemplate)
+@receiver(post_delete, sender=MessageTemplate)
+def evict_html_renderings(sender, instance, **kwargs):
+    """Drop cached base64 HTML renderings when the owning object changes."""
+    render_cache.evict_owner(sender._meta.label, instance.pk)
+
+
+@receiver(post_save, sender=EmailInlineImage)
+@receiver(post_delete, sender=EmailInlineImage)
+@receiver(post_save, sender=MessageTemplateInlineImage)
+@receiver(post_delete, sender=MessageTemplateInlineImage)
+def evict_html_renderings_for_inline_image(sender, instance, **kwargs):
+    """Inline image changes invalidate the renderings of their message or template."""
+    if sender is EmailInlineImage:
+        render_cache.evict_owner(Message._meta.label, instance.email_message_id)
+    else:
+        render_cache.evict_owner(MessageTemplate._meta.label, instance.template_id)
+
+
+@receiver(post_save, sender=Message)
+def publish_webchat_message(sender, instance, created, **kwargs):
+    """Push saved WebChat messages to subscribed WebSocket consumers once committed."""
+    if instance.platform != 'WebChat':
+        return
+    from unicom.consumers.webchat_consumer import publish_message_to_chat
+    transaction.on_commit(lambda: publish_message_to_chat(instance, created))
+
+
+@receiver(post_save, sender=Message)
+def wake_webchat_long_polls(sender, instance, **kwargs):
+    """Wake WebChat long-poll requests waiting on this chat once the message is committed."""
+    if instance.platform != 'WebChat':
+        return
+    from unicom.services.webchat.notifier import notify_chat
+    chat_id = instance.chat_id
+    transaction.on_commit(lambda: notify_chat(chat_id))
+
+
+@receiver(post_save, sender=Message)
+def index_message_for_retrieval(sender, instance, created, update_fields=None, **kwargs):
+    """Add new or re-worded messages to the retrieval index (when UNICOM_RETRIEVAL_ENABLED)."""
+    if created or update_fields is None or 'text' in update_fields:
+        from unicom.services.llm.retrieval import schedule_indexing
+        schedule_indexing(instance)
+
+
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+def touch_chat_on_message_change(sender, instance, created=False, **kwargs):
+    """Bump Chat.updated_at so WebChat ETags change with any message edit or delete."""
+    if created:
+        # create_request_from_message already saved the chat (update_chat_summary)
+        return
+    Chat.objects.filter(pk=instance.chat_id).update(updated_at=timezone.now())
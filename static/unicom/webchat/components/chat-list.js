@@ -12,6 +12,7 @@ export class ChatList extends LitElement {
     chats: { type: Array },
     selectedChatId: { type: String, attribute: 'selected-chat-id' },
     loading: { type: Boolean },
+    hasMore: { type: Boolean, attribute: 'has-more' },
   };
 
   static styles = [iconStyles, css`
@@ -171,6 +172,18 @@ export class ChatList extends LitElement {
       gap: 8px;
     }
 
+    .load-more-btn {
+      display: block;
+      width: calc(100% - 32px);
+      margin: 12px 16px;
+      padding: 8px;
+      border: 1px solid var(--sidebar-border-color, var(--border-color, #dee2e6));
+      border-radius: 6px;
+      background: transparent;
+      color: inherit;
+      cursor: pointer;
+    }
+
     .empty-state {
       padding: 40px 20px;
       text-align: center;
@@ -192,6 +205,7 @@ export class ChatList extends LitElement {
     this.chats = [];
     this.selectedChatId = null;
     this.loading = false;
+    this.hasMore = false;
   }
 
   async firstUpdated() {
@@ -213,6 +227,13 @@ export class ChatList extends LitElement {
     }));
   }
 
+  _handleLoadMore() {
+    this.dispatchEvent(new CustomEvent('load-more-chats', {
+      bubbles: true,
+      composed: true,
+    }));
+  }
+
   _formatTime(timestamp) {
     if (!timestamp) return '';
     return formatRelativeTime(timestamp);
@@ -286,6 +307,12 @@ export class ChatList extends LitElement {
               </div>
             </div>
           `)}
+
+          ${this.hasMore && !this.loading ? html`
+            <button class="load-more-btn" @click=${this._handleLoadMore}>
+              Load more chats
+            </button>
+          ` : ''}
         </div>
       </div>
     `;
@@ -230,7 +230,7 @@ export class MessageItem extends LitElement {
             ${message.text && message.text !== '**Image**' ?
               html`<div class="message-caption">${message.text}</div>` : ''}
             ${message.media_url ?
-              html`<img src="${message.media_url}" alt="Image" @click=${() => this._openImageModal(message.media_url)}>` :
+              html`<img src="${message.thumbnail_url || message.media_url}" alt="Image" loading="lazy" @click=${() => this._openImageModal(message.media_url)}>` :
               html`<div style="color: red;">Image file is missing.</div>`
             }
           </div>
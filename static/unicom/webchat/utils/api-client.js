@@ -90,6 +90,35 @@ export class WebChatAPI {
     return await response.json();
   }
 
+  /**
+   * Long-poll for new messages in a chat.
+   * Resolves as soon as messages newer than `after` exist, or with an empty
+   * list when the server-side timeout expires.
+   * @param {string} chatId - Chat ID
+   * @param {string|null} after - ID of the newest message already shown
+   * @param {number|null} timeout - Seconds to wait (server caps it)
+   * @param {AbortSignal|null} signal - Cancels the pending request
+   * @returns {Promise<Object>} Response with messages, cursor and timed_out
+   */
+  async waitForMessages(chatId, after = null, timeout = null, signal = null) {
+    const params = new URLSearchParams();
+    params.append('chat_id', chatId);
+    if (after) params.append('after', after);
+    if (timeout !== null) params.append('timeout', timeout);
+    if (this.channelId) params.append('channel_id', this.channelId);
+
+    const response = await fetch(`${this.baseURL}/wait/?${params}`, {
+      credentials: 'same-origin',
+      signal,
+    });
+
+    if (!response.ok) {
+      const errorData = await response.json().catch(() => ({}));
+      throw new Error(errorData.error || 'Failed to wait for messages');
+    }
+    return await response.json();
+  }
+
   /**
    * Get list of chats with optional filtering
    * @param {Object} filters - Filter parameters
@@ -97,7 +126,8 @@ export class WebChatAPI {
    *   - {is_archived: false} - Only non-archived chats
    *   - {metadata__project_id: 123} - Chats for project 123
    *   - {metadata__department: 'sales'} - Chats for sales department
-   * @returns {Promise<Object>} Response with chats array
+   *   - {cursor: response.next_cursor} - Next page (see has_more)
+   * @returns {Promise<Object>} Response with chats array, has_more and next_cursor
    */
   async getChats(filters = {}) {
     const params = new URLSearchParams();
@@ -39,7 +39,8 @@ export class RealTimeWebChatClient {
       this.websocketOnly = false; // Allow fallback
     }
     this.pollingInterval = null;
-    this.pollingRate = 5000; // 5 seconds default
+    this.pollingRate = 5000; // 5 seconds default (retry delay after long-poll errors)
+    this.pollAbort = null; // AbortController of the pending long-poll request
 
     // Retry logic for WebSocket-only mode
     this.retryAttempt = 0;
@@ -54,6 +55,7 @@ export class RealTimeWebChatClient {
     // Event handlers
     this.onMessage = null;
     this.onMessageUpdated = null;
+    this.onMessageDelta = null; // Streamed LLM text: (messageId, offset, delta, chatId)
     this.onChatUpdate = null;
     this.onChatsUpdate = null;
     this.onConnectionChange = null;
@@ -122,10 +124,7 @@ export class RealTimeWebChatClient {
       this.ws.close();
       this.ws = null;
     }
-    if (this.pollingInterval) {
-      clearInterval(this.pollingInterval);
-      this.pollingInterval = null;
-    }
+    this._stopPolling();
     this.connected = false;
     this.isRetrying = false;
     this.retryAttempt = 0;
@@ -199,6 +198,17 @@ export class RealTimeWebChatClient {
     return response.chats;
   }
 
+  /**
+   * Get one page of chats (REST). Pass the previous page's next_cursor to continue.
+   */
+  async getChatsPage(filters = null, cursor = null) {
+    const effectiveFilters = { ...(filters || this.filters) };
+    if (cursor) {
+      effectiveFilters.cursor = cursor;
+    }
+    return await this.api.getChats(effectiveFilters);
+  }
+
   /**
    * Get messages for a chat (REST).
    */
@@ -319,6 +329,12 @@ export class RealTimeWebChatClient {
         }
         break;
 
+      case 'message_delta':
+        if (this.onMessageDelta) {
+          this.onMessageDelta(data.message_id, data.offset, data.delta, data.chat_id);
+        }
+        break;
+
       case 'chat_update':
         if (this.onChatUpdate) {
           this.onChatUpdate(data.chat);
@@ -389,40 +405,70 @@ export class RealTimeWebChatClient {
     }
   }
 
-  _startPolling() {
+  _stopPolling() {
     if (this.pollingInterval) {
-      clearInterval(this.pollingInterval);
+      clearTimeout(this.pollingInterval);
+      this.pollingInterval = null;
+    }
+    if (this.pollAbort) {
+      this.pollAbort.abort();
+      this.pollAbort = null;
     }
+  }
+
+  /**
+   * Long-poll the wait endpoint: each request is held open by the server until
+   * a new message arrives or its timeout expires, then the next one starts.
+   */
+  _startPolling() {
+    this._stopPolling();
 
     this.connected = true;
     this._notifyConnectionChange(true, 'polling');
 
-    this.pollingInterval = setInterval(async () => {
-      try {
-        if (!this.currentChatId) {
-          return;
-        }
+    const controller = new AbortController();
+    this.pollAbort = controller;
 
-        const response = await this.api.getMessages(
-          this.currentChatId,
-          50,
+    const poll = async () => {
+      if (controller.signal.aborted) {
+        return;
+      }
+      const chatId = this.currentChatId;
+      if (!chatId) {
+        this.pollingInterval = setTimeout(poll, this.pollingRate);
+        return;
+      }
+      try {
+        const response = await this.api.waitForMessages(
+          chatId,
+          this.lastMessageId,
           null,
-          this.lastMessageId
+          controller.signal
         );
-
-        if (response.messages && response.messages.length > 0) {
-          this.lastMessageId = response.messages[response.messages.length - 1].id;
-          response.messages.forEach((msg) => {
-            if (this.onMessage) {
-              this.onMessage(msg, this.currentChatId);
-            }
-          });
+        if (controller.signal.aborted || chatId !== this.currentChatId) {
+          this.pollingInterval = setTimeout(poll, 0);
+          return;
+        }
+        if (response.cursor) {
+          this.lastMessageId = response.cursor;
         }
+        (response.messages || []).forEach((msg) => {
+          if (this.onMessage) {
+            this.onMessage(msg, chatId);
+          }
+        });
+        this.pollingInterval = setTimeout(poll, 0);
       } catch (err) {
+        if (controller.signal.aborted) {
+          return;
+        }
         console.error('Polling error:', err);
         this._notifyError(err);
+        this.pollingInterval = setTimeout(poll, this.pollingRate);
       }
-    }, this.pollingRate);
+    };
+
+    poll();
   }
 
   _notifyConnectionChange(connected, transport) {
@@ -446,8 +492,7 @@ export class RealTimeWebChatClient {
 
   setPollingRate(ms) {
     this.pollingRate = ms;
-    if (this.pollingInterval && !this.useWebSocket) {
-      clearInterval(this.pollingInterval);
+    if (this.pollAbort && !this.useWebSocket) {
       this._startPolling();
     }
   }
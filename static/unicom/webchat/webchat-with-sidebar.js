@@ -34,6 +34,7 @@ export class UnicomChatWithSidebar extends LitElement {
     branchSelections: { type: Object, state: true },  // Track selected branch per group
     loading: { type: Boolean, state: true },
     loadingChats: { type: Boolean, state: true },
+    hasMoreChats: { type: Boolean, state: true },
     sending: { type: Boolean, state: true },
     sendAck: { type: Number, state: true },
     error: { type: String, state: true },
@@ -163,6 +164,8 @@ export class UnicomChatWithSidebar extends LitElement {
     this.branchSelections = {};
     this.loading = false;
     this.loadingChats = false;
+    this.hasMoreChats = false;
+    this._chatsCursor = null;
     this.sending = false;
     this.sendAck = 0;
     this.error = null;
@@ -194,6 +197,7 @@ export class UnicomChatWithSidebar extends LitElement {
     // Set up event handlers
     this.client.onMessage = (message, chatId) => this._handleNewMessage(message, chatId);
     this.client.onMessageUpdated = (message, chatId) => this._handleMessageUpdated(message, chatId);
+    this.client.onMessageDelta = (messageId, offset, delta, chatId) => this._handleMessageDelta(messageId, offset, delta, chatId);
     this.client.onChatsUpdate = (chats) => this._handleChatsUpdate(chats);
     this.client.onConnectionChange = (connected, type) => {
       this.connectionStatus = connected ? 'connected' : 'disconnected';
@@ -260,8 +264,10 @@ export class UnicomChatWithSidebar extends LitElement {
     this.loadingChats = true;
 
     try {
-      const chats = await this.client.getChats(this.filters);
-      this.chats = chats || [];
+      const page = await this.client.getChatsPage(this.filters);
+      this.chats = page.chats || [];
+      this._chatsCursor = page.has_more ? page.next_cursor : null;
+      this.hasMoreChats = Boolean(this._chatsCursor);
 
       // If no chat selected, select the first one
       if (!this.currentChatId && this.chats.length > 0) {
@@ -282,6 +288,26 @@ export class UnicomChatWithSidebar extends LitElement {
     }
   }
 
+  /**
+   * Append the next page of chats
+   */
+  async _handleLoadMoreChats() {
+    if (!this._chatsCursor || this.loadingChats) return;
+    this.loadingChats = true;
+    try {
+      const page = await this.client.getChatsPage(this.filters, this._chatsCursor);
+      const known = new Set(this.chats.map(chat => chat.id));
+      this.chats = [...this.chats, ...(page.chats || []).filter(chat => !known.has(chat.id))];
+      this._chatsCursor = page.has_more ? page.next_cursor : null;
+      this.hasMoreChats = Boolean(this._chatsCursor);
+    } catch (err) {
+      this.error = err.message;
+      console.error('Failed to load more chats:', err);
+    } finally {
+      this.loadingChats = false;
+    }
+  }
+
   /**
    * Load messages for current chat
    */
@@ -716,6 +742,27 @@ export class UnicomChatWithSidebar extends LitElement {
     this.requestUpdate();
   }
 
+  /**
+   * Apply a streamed text delta: the message text from `offset` on becomes
+   * `delta` (offset 0 replaces the placeholder). The final message_updated
+   * event carries the persisted text.
+   */
+  _handleMessageDelta(messageId, offset, delta, chatId) {
+    if (chatId !== this.currentChatId) {
+      return;
+    }
+    const index = this.messages.findIndex(m => m.id === messageId);
+    if (index < 0) {
+      return;
+    }
+    const message = this.messages[index];
+    const text = offset > 0 ? (message.text || '').slice(0, offset) : '';
+    this.messages[index] = { ...message, text: text + delta };
+    this.messages = [...this.messages];
+    this.processedMessages = this._processMessagesWithBranching(this.messages);
+    this.requestUpdate();
+  }
+
   /**
    * Handle chats update from real-time updates
    */
@@ -744,6 +791,8 @@ export class UnicomChatWithSidebar extends LitElement {
               .chats=${this.chats}
               .selectedChatId=${this.currentChatId}
               .loading=${this.loadingChats}
+              .hasMore=${this.hasMoreChats}
+              @load-more-chats=${this._handleLoadMoreChats}
               @chat-selected=${this._handleChatSelected}
               @new-chat=${this._handleNewChat}
               @delete-chat=${this._handleDeleteChat}>
@@ -4,10 +4,25 @@ Django template tags for Unicom WebChat component.
 from django import template
 from django.utils.safestring import mark_safe
 from django.templatetags.static import static
+from unicom.services.image_variants import message_thumbnail_url
 
 register = template.Library()
 
 
+@register.filter
+def thumbnail_url(message, width=480):
+    """
+    Resized variant URL for an image message, falling back to the original.
+
+    Usage in template:
+        {% load unicom_tags %}
+        <img src="{{ message|thumbnail_url:480 }}">
+    """
+    if not message.media:
+        return ''
+    return message_thumbnail_url(message.id, message.media.name, message.media_type, width) or message.media.url
+
+
 @register.simple_tag
 def webchat_component(
     api_base='/unicom/webchat',
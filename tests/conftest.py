@@ -0,0 +1,187 @@
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from django.utils import timezone
+
+_ids = itertools.count(1)
+
+
+@pytest.fixture(autouse=True)
+def _clear_resolution_caches():
+    """Process-level WebChat caches outlive the rolled-back test transaction."""
+    from unicom.services.webchat.resolution_cache import clear_resolution_caches
+
+    clear_resolution_caches()
+    yield
+    clear_resolution_caches()
+
+
+@pytest.fixture
+def webchat_channel(db):
+    from unicom.models import Channel
+
+    return Channel.objects.create(name="WebChat", platform="WebChat", config={}, active=True)
+
+
+@pytest.fixture
+def account(webchat_channel):
+    from unicom.models import Account
+
+    return Account.objects.create(
+        id=f"webchat_test_{next(_ids)}", channel=webchat_channel, platform="WebChat", name="Tester"
+    )
+
+
+@pytest.fixture
+def chat(webchat_channel, account):
+    from unicom.models import AccountChat, Chat
+
+    chat = Chat.objects.create(id=f"chat_{next(_ids)}", channel=webchat_channel, platform="WebChat")
+    AccountChat.objects.create(account=account, chat=chat)
+    return chat
+
+
+@pytest.fixture
+def user_account(client, webchat_channel):
+    """The WebChat account the logged-in test client resolves to."""
+    from django.contrib.auth.models import User
+    from unicom.services.webchat.get_or_create_account import get_or_create_account
+
+    user = User.objects.create_user(f"user{next(_ids)}", email="reader@example.com")
+    client.force_login(user)
+
+    class _Request:
+        pass
+
+    request = _Request()
+    request.user = user
+    return get_or_create_account(webchat_channel, request)
+
+
+@pytest.fixture
+def make_message(chat, account):
+    """Create outgoing messages in ``chat`` (outgoing avoids Request creation)."""
+    from unicom.models import Message
+
+    def factory(**kwargs):
+        fields = {
+            "id": f"msg_{next(_ids)}",
+            "channel": chat.channel,
+            "platform": chat.platform,
+            "chat": chat,
+            "sender": account,
+            "sender_name": account.name,
+            "is_outgoing": True,
+            "text": "hello",
+            "timestamp": timezone.now(),
+            "raw": {},
+        }
+        fields.update(kwargs)
+        return Message.objects.create(**fields)
+
+    return factory
+
+
+class FakeCompletionServer:
+    """Local OpenAI-compatible /chat/completions endpoint."""
+
+    def __init__(self):
+        self.requests = []
+        self.rate_limited = 0  # answer this many requests with 429 first
+        self.failing = []  # then answer with these HTTP error statuses, one per request
+        self.delay = 0.0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with server._lock:
+                    server.requests.append(body)
+                    limited = server.rate_limited > 0
+                    server.rate_limited -= limited
+                    failure = server.failing.pop(0) if server.failing and not limited else None
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                try:
+                    time.sleep(server.delay)
+                    if limited:
+                        self._send(429, {"error": {"message": "slow down", "type": "rate_limit"}}, {"retry-after": "0"})
+                    elif failure:
+                        self._send(failure, {"error": {"message": "try again", "type": "server_error"}}, {"retry-after": "0"})
+                    elif body.get("stream"):
+                        self._send_stream(server.completion(body))
+                    else:
+                        self._send(200, server.completion(body))
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+
+            def _send(self, status, payload, headers=()):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in dict(headers).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, completion):
+                """Server-sent events: one chunk per word, then usage and [DONE]."""
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                base = {"id": completion["id"], "object": "chat.completion.chunk", "created": 0,
+                        "model": completion["model"]}
+                words = completion["choices"][0]["message"]["content"].split(" ")
+                events = [
+                    {**base, "choices": [{"index": 0, "delta": {"content": word if not i else " " + word}}]}
+                    for i, word in enumerate(words)
+                ]
+                events.append({**base, "choices": [], "usage": completion["usage"]})
+                for event in events:
+                    self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+                self.wfile.write(b"data: [DONE]\n\n")
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/v1"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    @staticmethod
+    def completion(body):
+        return {
+            "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": body["model"],
+            "choices": [{
+                "index": 0, "finish_reason": "stop",
+                "message": {"role": "assistant", "content": f"echo: {body['messages'][-1]['content']}"},
+            }],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+        }
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def llm_server(settings):
+    """A fake completion server the LLM dispatcher is pointed at."""
+    from unicom.services.llm import dispatcher
+
+    server = FakeCompletionServer()
+    settings.OPENAI_API_KEY = "test-key"
+    settings.OPENAI_BASE_URL = server.url
+    dispatcher.reset_limits()
+    yield server
+    dispatcher.reset_limits()
+    server.close()
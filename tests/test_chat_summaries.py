@@ -0,0 +1,118 @@
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+
+from unicom.services.llm import chat_summaries
+from unicom.services.llm.context_builder import SUMMARY_PREFIX
+
+
+class StubSummarizer:
+    """Deterministic summarizer: appends the texts it was given."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, previous_summary, messages):
+        self.calls.append([m.text for m in messages])
+        return " ".join(filter(None, [previous_summary, *(m.text for m in messages)]))
+
+
+@pytest.fixture
+def summarizer(settings):
+    stub = StubSummarizer()
+    settings.UNICOM_CHAT_SUMMARIZER = stub
+    settings.UNICOM_CHAT_SUMMARY_EVERY = 3
+    settings.UNICOM_CHAT_SUMMARY_KEEP_RECENT = 2
+    settings.UNICOM_CHAT_SUMMARY_ASYNC = False
+    return stub
+
+
+@pytest.fixture
+def post(make_message, django_capture_on_commit_callbacks):
+    start = timezone.now() - timedelta(hours=1)
+    count = iter(range(1000))
+
+    def factory(text, **kwargs):
+        with django_capture_on_commit_callbacks(execute=True):
+            return make_message(text=text, timestamp=start + timedelta(seconds=next(count)), **kwargs)
+
+    return factory
+
+
+@pytest.mark.django_db
+def test_refresh_runs_every_n_messages_and_keeps_recent_tail(summarizer, post, chat):
+    messages = [post(f"m{i}") for i in range(4)]
+    chat.refresh_from_db()
+    assert summarizer.calls == []
+    assert chat.unsummarized_count == 4
+
+    messages.append(post("m4"))  # 5 = keep 2 + every 3
+    chat.refresh_from_db()
+    assert summarizer.calls == [["m0", "m1", "m2"]]
+    assert chat.summary == "m0 m1 m2"
+    assert chat.summary_marker == (messages[2].timestamp, messages[2].id)
+    assert chat.unsummarized_count == 2
+
+    for i in range(5, 8):
+        messages.append(post(f"m{i}"))
+    chat.refresh_from_db()
+    assert summarizer.calls[-1] == ["m3", "m4", "m5"]
+    assert chat.summary == "m0 m1 m2 m3 m4 m5"
+
+
+@pytest.mark.django_db
+def test_deleting_the_marker_message_does_not_resummarize(summarizer, post, chat):
+    messages = [post(f"m{i}") for i in range(5)]
+    marker = (messages[2].timestamp, messages[2].id)
+    messages[2].delete()
+    chat.refresh_from_db()
+    assert chat.summary_marker == marker
+
+    for i in range(5, 8):
+        post(f"m{i}")
+    assert summarizer.calls == [["m0", "m1", "m2"], ["m3", "m4", "m5"]]
+    chat.refresh_from_db()
+    assert chat.summary == "m0 m1 m2 m3 m4 m5"
+
+
+@pytest.mark.django_db
+def test_as_llm_chat_prepends_summary_and_sends_tail(summarizer, post):
+    messages = [post(f"m{i}") for i in range(6)]
+
+    context = messages[-1].as_llm_chat(mode="chat", system_instruction="be nice", use_summary=True)
+
+    assert context[0] == {"role": "system", "content": "be nice"}
+    assert context[1] == {"role": "system", "content": SUMMARY_PREFIX + "m0 m1 m2"}
+    assert [m["content"] for m in context[2:]] == ["m3", "m4", "m5"]
+
+    # Without use_summary, or for a message the summary already covers, the full window
+    assert len(messages[-1].as_llm_chat(mode="chat")) == 6
+    assert [m["content"] for m in messages[1].as_llm_chat(mode="chat", use_summary=True)] == ["m0", "m1"]
+
+
+@pytest.mark.django_db
+def test_tail_does_not_start_with_orphaned_tool_response(summarizer, post, chat):
+    post("question")
+    post("call", media_type="tool_call", is_outgoing=None,
+         raw={"tool_call": {"id": "c1", "name": "lookup", "arguments": {}}})
+    post("result", media_type="tool_response", is_outgoing=None,
+         raw={"tool_response": {"call_id": "c1", "result": "42"}})
+    post("answer")
+    post("thanks")
+
+    chat.refresh_from_db()
+    assert summarizer.calls == [["question", "call", "result"]]
+    assert chat.unsummarized_count == 2
+
+
+@pytest.mark.django_db
+def test_no_summarizer_means_no_refresh(settings, post, chat):
+    settings.UNICOM_CHAT_SUMMARY_EVERY = 1
+    settings.UNICOM_CHAT_SUMMARY_KEEP_RECENT = 0
+    post("hello")
+    post("again")
+
+    chat.refresh_from_db()
+    assert chat.summary == "" and chat.summary_marker is None
+    assert chat.unsummarized_count == 2
@@ -0,0 +1,40 @@
+import pytest
+from django.core.files.base import ContentFile
+
+from unicom.services.html_render_cache import RenderCache, render_cache
+
+
+def test_render_cache_evicts_least_recently_used_entries_by_size():
+    cache = RenderCache(max_bytes=10)
+    cache.set(("a", 1, "v"), "xxxx")
+    cache.set(("a", 2, "v"), "yyyy")
+    assert cache.get(("a", 1, "v")) == "xxxx"
+    cache.set(("a", 3, "v"), "zzzz")
+    assert cache.get(("a", 2, "v")) is None
+    assert cache.get(("a", 1, "v")) == "xxxx"
+    assert cache.size == 8
+
+    cache.evict_owner("a", 1)
+    assert cache.get(("a", 1, "v")) is None
+    assert cache.size == 4
+
+
+@pytest.mark.django_db
+def test_message_html_rendering_is_memoized_and_invalidated(make_message, settings, tmp_path, django_assert_num_queries):
+    from unicom.models import EmailInlineImage
+
+    settings.MEDIA_ROOT = str(tmp_path)
+    render_cache.clear()
+    message = make_message(platform="Email", html="<p>x</p>")
+    image = EmailInlineImage.objects.create(email_message=message)
+    image.file.save("a.png", ContentFile(b"first"), save=True)
+    message.html = f'<p><img src="/i/{image.get_short_id()}"></p>'
+
+    first = message.html_with_base64_images
+    assert "data:image/png;base64,Zmlyc3Q=" in first
+    # A hit only needs the image signature query, not the image rows or files.
+    with django_assert_num_queries(1):
+        assert message.html_with_base64_images == first
+
+    image.file.save("b.png", ContentFile(b"second"), save=True)
+    assert "c2Vjb25k" in message.html_with_base64_images
@@ -0,0 +1,66 @@
+import io
+
+import pytest
+from django.core.files.base import ContentFile
+from django.urls import reverse
+
+from unicom.services import image_variants
+
+PIL = pytest.importorskip("PIL.Image")
+
+
+def _png_bytes(width=1200, height=800):
+    buf = io.BytesIO()
+    PIL.new("RGBA", (width, height), (200, 30, 30, 128)).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_snap_width_rounds_up_to_configured_bucket(settings):
+    settings.UNICOM_IMAGE_VARIANT_WIDTHS = (128, 512, 1024)
+    assert image_variants.snap_width(100) == 128
+    assert image_variants.snap_width(513) == 1024
+    assert image_variants.snap_width(5000) == 1024
+    assert image_variants.snap_width("junk") == 1024
+
+
+def test_render_variant_downscales_and_flattens_alpha_for_jpeg():
+    data = image_variants.render_variant(_png_bytes(), 300, "jpeg")
+    with PIL.open(io.BytesIO(data)) as img:
+        assert img.format == "JPEG"
+        assert img.size == (300, 200)
+
+
+@pytest.mark.django_db
+def test_inline_image_variant_is_cached_and_served_with_cache_headers(client, settings, tmp_path):
+    from unicom.models import EmailInlineImage
+
+    settings.MEDIA_ROOT = str(tmp_path)
+    image = EmailInlineImage.objects.create()
+    image.file.save("photo.png", ContentFile(_png_bytes()), save=True)
+    url = image_variants.inline_image_variant_url(image, 256)
+
+    response = client.get(url, HTTP_ACCEPT="image/webp,*/*")
+    assert response.status_code == 200
+    assert response["Content-Type"] == "image/webp"
+    assert "immutable" in response["Cache-Control"]
+    name = image_variants.variant_name(image.hash, 256, "webp")
+    assert (tmp_path / name).exists()
+
+    revalidated = client.get(url, HTTP_ACCEPT="image/webp,*/*", HTTP_IF_NONE_MATCH=response["ETag"])
+    assert revalidated.status_code == 304
+
+
+@pytest.mark.django_db
+def test_message_media_variant_requires_matching_token(client):
+    url = reverse("message_media_variant", kwargs={"message_id": "missing"})
+    assert client.get(url, {"w": 128, "t": "nope"}).status_code == 404
+
+
+def test_media_token_is_keyed_with_the_secret_key(settings):
+    import hashlib
+
+    name = "media/photo.jpg"
+    token = image_variants.media_token(name)
+    assert token != hashlib.sha256(name.encode()).hexdigest()[:16]
+    settings.SECRET_KEY = "another-secret"
+    assert image_variants.media_token(name) != token
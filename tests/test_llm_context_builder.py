@@ -0,0 +1,152 @@
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+
+from unicom.services.llm import context_builder
+
+
+@pytest.fixture(autouse=True)
+def _clear_cost_cache():
+    context_builder.cost_cache.clear()
+    yield
+    context_builder.cost_cache.clear()
+
+
+def words(text):
+    """Test tokenizer: one token per word."""
+    return len(text.split())
+
+
+@pytest.fixture
+def history(make_message):
+    """Create messages one second apart, oldest first."""
+    start = timezone.now() - timedelta(hours=1)
+
+    def factory(*specs):
+        created = []
+        for i, spec in enumerate(specs):
+            if isinstance(spec, str):
+                spec = {"text": spec}
+            created.append(make_message(timestamp=start + timedelta(seconds=i), **spec))
+        return created
+
+    return factory
+
+
+def tool_call(call_id):
+    return {
+        "media_type": "tool_call", "is_outgoing": None, "text": "call",
+        "raw": {"tool_call": {"id": call_id, "name": "lookup", "arguments": {}}},
+    }
+
+
+def tool_response(call_id, result):
+    return {
+        "media_type": "tool_response", "is_outgoing": None, "text": "response",
+        "raw": {"tool_response": {"call_id": call_id, "result": result}},
+    }
+
+
+def cost(text):
+    return context_builder.MESSAGE_OVERHEAD_TOKENS + words(text)
+
+
+@pytest.mark.django_db
+def test_packs_newest_messages_into_budget(history):
+    messages = history("one two three", "huge " * 500, "four five", "six")
+
+    context = context_builder.build_llm_context(messages[-1], cost("four five") + cost("six"), tokenizer=words)
+
+    assert [m["content"] for m in context] == ["four five", "six"]
+
+
+@pytest.mark.django_db
+def test_tool_call_and_response_stay_together(history):
+    messages = history("question", tool_call("c1"), tool_response("c1", "forty two"), "answer")
+    response_cost = sum(
+        context_builder.message_token_cost(m, words) for m in messages[1:]
+    )
+
+    # Room for the response and the answer but not the call: both are dropped
+    context = context_builder.build_llm_context(messages[-1], response_cost - 1, tokenizer=words)
+    assert [m["content"] for m in context] == ["answer"]
+
+    context = context_builder.build_llm_context(messages[-1], response_cost, tokenizer=words)
+    assert [m["role"] for m in context] == ["assistant", "tool", "assistant"]
+    assert context[0]["tool_calls"][0]["id"] == context[1]["tool_call_id"] == "c1"
+
+
+@pytest.mark.django_db
+def test_summary_replaces_dropped_turns(history):
+    messages = history("old turn", "older detail", "latest")
+    summary = "user asked things"
+    summary_cost = cost(context_builder.SUMMARY_PREFIX + summary)
+
+    context = context_builder.build_llm_context(
+        messages[-1], cost("latest") + summary_cost, tokenizer=words,
+        system_instruction="be brief", summary=summary,
+    )
+    assert context[0] == {"role": "system", "content": "be brief"}
+    assert context[1]["content"].endswith(summary)
+    # The newest message is always kept, even though the system instruction overspends the budget
+    assert [m["content"] for m in context[2:]] == ["latest"]
+
+    # Nothing dropped: no summary
+    context = context_builder.build_llm_context(messages[-1], 1000, tokenizer=words, summary=summary)
+    assert [m["content"] for m in context] == ["old turn", "older detail", "latest"]
+
+
+@pytest.mark.django_db
+def test_costs_are_cached_per_message_version(history):
+    calls = []
+
+    def counting(text):
+        calls.append(text)
+        return words(text)
+
+    counting.cache_key = "counting"
+    messages = history("alpha", "beta")
+    context_builder.build_llm_context(messages[-1], 1000, tokenizer=counting)
+    context_builder.build_llm_context(messages[-1], 1000, tokenizer=counting)
+    assert calls == ["beta", "alpha"]
+
+    messages[0].text = "alpha edited"
+    messages[0].save()
+    context_builder.build_llm_context(messages[-1], 1000, tokenizer=counting)
+    assert calls == ["beta", "alpha", "alpha edited"]
+
+
+@pytest.mark.django_db
+def test_unnamed_tokenizers_bypass_the_cost_cache(history):
+    def make(cost):
+        return lambda text: cost
+
+    message = history("one two three")[-1]
+    overhead = context_builder.MESSAGE_OVERHEAD_TOKENS
+    # Each tokenizer is collected before the next one, which may reuse its id
+    assert context_builder.message_token_cost(message, make(1)) == overhead + 1
+    assert context_builder.message_token_cost(message, make(100)) == overhead + 100
+    assert context_builder.message_token_cost(message, words) == overhead + 3
+    assert len(context_builder.cost_cache) == 1
+
+
+@pytest.mark.django_db
+def test_history_is_read_only_until_budget_is_spent(history, django_assert_max_num_queries):
+    messages = history(*[f"message {i}" for i in range(250)])
+
+    with django_assert_max_num_queries(1):
+        context = context_builder.build_llm_context(messages[-1], cost("message 1") * 3, tokenizer=words)
+    assert [m["content"] for m in context] == ["message 247", "message 248", "message 249"]
+
+    context = context_builder.build_llm_context(messages[-1], 10 ** 6, tokenizer=words)
+    assert len(context) == 250
+
+
+@pytest.mark.django_db
+def test_as_llm_chat_token_budget(history):
+    messages = history("first " * 50, "second", "third")
+
+    context = messages[-1].as_llm_chat(mode="chat", token_budget=cost("second") + cost("third"), tokenizer=words)
+
+    assert [m["content"] for m in context] == ["second", "third"]
@@ -0,0 +1,141 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from asgiref.sync import async_to_sync
+from openai import DEFAULT_MAX_RETRIES, APIConnectionError, BadRequestError, RateLimitError
+
+from unicom.services.llm import dispatcher
+
+
+def test_rate_limited_requests_are_retried(llm_server):
+    llm_server.rate_limited = 2
+
+    response = dispatcher.complete("gpt-test", [{"role": "user", "content": "hi"}])
+
+    assert response.choices[0].message.content == "echo: hi"
+    assert len(llm_server.requests) == 3
+
+
+def test_gives_up_after_max_retries(settings, llm_server):
+    settings.UNICOM_LLM_MAX_RETRIES = 1
+    llm_server.rate_limited = 5
+
+    with pytest.raises(RateLimitError):
+        dispatcher.complete("gpt-test", [{"role": "user", "content": "hi"}])
+    assert len(llm_server.requests) == 2
+
+
+def test_transient_failures_are_retried_but_client_errors_are_not(llm_server):
+    llm_server.failing = [500, 503, 408]
+
+    response = dispatcher.complete("gpt-test", [{"role": "user", "content": "hi"}])
+    assert response.choices[0].message.content == "echo: hi"
+    assert len(llm_server.requests) == 4
+
+    llm_server.failing = [400]
+    with pytest.raises(BadRequestError):
+        dispatcher.complete("gpt-test", [{"role": "user", "content": "hi"}])
+    assert len(llm_server.requests) == 5
+
+
+def test_connection_errors_are_retried(settings, llm_server, monkeypatch):
+    settings.UNICOM_LLM_MAX_RETRIES = 2
+    settings.OPENAI_BASE_URL = "http://127.0.0.1:9/v1"  # nothing listens on the discard port
+    retries = []
+    monkeypatch.setattr(dispatcher, "_retry_delay", lambda exc, attempt: retries.append(exc) or 0)
+
+    with pytest.raises(APIConnectionError):
+        dispatcher.complete("gpt-test", [{"role": "user", "content": "hi"}])
+    assert len(retries) == 2
+
+
+def test_get_openai_client_keeps_sdk_retries(llm_server):
+    from unicom.models.message import get_openai_client
+
+    assert get_openai_client().max_retries == DEFAULT_MAX_RETRIES
+    assert dispatcher.get_client().max_retries == 0
+
+
+def test_streams_hold_a_slot_and_retry_rate_limits(settings, llm_server):
+    settings.UNICOM_LLM_MAX_CONCURRENCY = 1
+    settings.UNICOM_LLM_TOKENS_PER_MINUTE = 100000
+    llm_server.rate_limited = 1
+
+    stream = dispatcher.stream_complete(
+        "gpt-test", [{"role": "user", "content": "hi there"}], stream_options={"include_usage": True})
+    first = next(stream)
+    slot = dispatcher._slots_for("gpt-test")[0]
+    assert slot.in_use == 1
+    text = first.choices[0].delta.content + "".join(c.choices[0].delta.content for c in stream if c.choices)
+
+    assert text == "echo: hi there"
+    assert len(llm_server.requests) == 2 and llm_server.requests[-1]["stream"] is True
+    assert slot.in_use == 0
+    # The reservation was settled with the reported usage (15 tokens)
+    bucket = dispatcher._buckets_for("gpt-test")[0]
+    assert bucket.available > 100000 - 100
+
+
+def test_async_requests_respect_concurrency_limits(settings, llm_server):
+    settings.UNICOM_LLM_MAX_CONCURRENCY = 3
+    settings.UNICOM_LLM_MODEL_CONCURRENCY = {"slow-model": 2}
+    llm_server.delay = 0.1
+
+    async def burst(model):
+        return await asyncio.gather(*(
+            dispatcher.acomplete(model, [{"role": "user", "content": str(i)}]) for i in range(6)
+        ))
+
+    responses = async_to_sync(burst)("slow-model")
+    assert sorted(r.choices[0].message.content for r in responses) == [f"echo: {i}" for i in range(6)]
+    assert llm_server.max_in_flight == 2
+
+    llm_server.max_in_flight = 0
+    async_to_sync(burst)("other-model")
+    assert llm_server.max_in_flight == 3
+
+
+def test_sync_and_async_callers_share_slots():
+    slots = dispatcher._Slots(1)
+    slots.acquire()
+    order = []
+
+    async def waiter():
+        await slots.aacquire()
+        order.append("async")
+        slots.release()
+
+    thread = threading.Thread(target=async_to_sync(waiter))
+    thread.start()
+    time.sleep(0.05)
+    assert order == []
+    slots.release()
+    thread.join(2)
+    assert order == ["async"]
+    assert slots.in_use == 0
+
+
+def test_token_bucket_delays_requests_over_budget(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(dispatcher.time, "monotonic", lambda: now[0])
+    bucket = dispatcher._TokenBucket(600)  # 10 tokens per second
+
+    assert bucket.reserve(500) == 0
+    assert bucket.reserve(300) == 0  # still 100 left; now 200 in deficit
+    assert bucket.reserve(100) == pytest.approx(20)
+    now[0] += 30
+    bucket.adjust(-100)  # the last request used 100 fewer tokens than reserved
+    assert bucket.reserve(10) == 0
+
+
+@pytest.mark.django_db
+def test_areply_using_llm(llm_server, make_message):
+    prompt = make_message(text="question")
+
+    reply = async_to_sync(prompt.areply_using_llm)("gpt-test", depth=1)
+
+    assert reply.text == "echo: question"
+    assert reply.reply_to_message_id == prompt.id
+    assert llm_server.requests[0]["messages"] == [{"role": "assistant", "content": "question"}]
@@ -0,0 +1,92 @@
+import pytest
+from django.core.files.base import ContentFile
+
+from unicom.services.llm import media_cache
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(settings, tmp_path):
+    settings.UNICOM_LLM_MEDIA_CACHE_DIR = str(tmp_path / "llm-media")
+    media_cache.clear_media_cache()
+    yield settings.UNICOM_LLM_MEDIA_CACHE_DIR
+    media_cache.clear_media_cache()
+
+
+class FakeFile:
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    calls = []
+
+    def fake_file_bytes(field_file):
+        calls.append(field_file.name)
+        return field_file.data
+
+    monkeypatch.setattr(media_cache, "_file_bytes", fake_file_bytes)
+    return calls
+
+
+def test_conversion_runs_once_per_content_and_format(reads):
+    conversions = []
+
+    def convert(data):
+        conversions.append(data)
+        return data.upper()
+
+    first = media_cache.media_payload(FakeFile("a.wav", b"abc"), "mp3", convert)
+    second = media_cache.media_payload(FakeFile("a.wav", b"abc"), "mp3", convert)
+    # Same content under another name shares the entry
+    third = media_cache.media_payload(FakeFile("copy.wav", b"abc"), "mp3", convert)
+
+    assert first == second == third == "QUJD"
+    assert conversions == [b"abc"]
+    assert reads == ["a.wav", "copy.wav"]
+
+    # A new target format converts again, reading the source only once more
+    assert media_cache.media_payload(FakeFile("a.wav", b"abc"), "image", lambda data: data) == "YWJj"
+    assert reads == ["a.wav", "copy.wav", "a.wav"]
+
+
+def test_failed_conversion_is_not_cached(reads):
+    def broken(data):
+        raise ValueError("bad audio")
+
+    with pytest.raises(ValueError):
+        media_cache.media_payload(FakeFile("a.ogg", b"x"), "mp3", broken)
+    assert media_cache.media_payload(FakeFile("a.ogg", b"x"), "mp3", lambda data: data) == "eA=="
+
+
+def test_least_recently_used_entries_are_evicted(settings, reads, cache_dir):
+    import os
+    import time
+
+    settings.UNICOM_LLM_MEDIA_CACHE_MAX_BYTES = 10  # two 4-byte entries fit
+    media_cache.media_payload(FakeFile("1", b"one"), "image", lambda data: data)
+    time.sleep(0.01)
+    media_cache.media_payload(FakeFile("2", b"two"), "image", lambda data: data)
+    time.sleep(0.01)
+    media_cache.media_payload(FakeFile("1", b"one"), "image", lambda data: data)  # refresh "1"
+    time.sleep(0.01)
+    media_cache.media_payload(FakeFile("3", b"six"), "image", lambda data: data)
+
+    stored = sorted(name.split(".")[0] for _, _, files in os.walk(cache_dir) for name in files)
+    digests = {key: media_cache._hash_by_name[key] for key in ("1", "2", "3")}
+    assert stored == sorted([digests["1"], digests["3"]])
+
+
+@pytest.mark.django_db
+def test_as_llm_chat_images_use_cache(settings, tmp_path, make_message, monkeypatch):
+    settings.MEDIA_ROOT = str(tmp_path / "media")
+    message = make_message(text="look", media_type="image")
+    message.media.save("pic.png", ContentFile(b"\x89PNG fake"), save=True)
+
+    first = message.as_llm_chat(depth=1, mode="chat", multimodal=True)
+    monkeypatch.setattr(media_cache, "_file_bytes", lambda field_file: pytest.fail("storage read"))
+    second = message.as_llm_chat(depth=1, mode="chat", multimodal=True)
+
+    assert first == second
+    assert "data:image/png;base64," in str(first)
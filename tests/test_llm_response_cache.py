@@ -0,0 +1,69 @@
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+
+from unicom.services.llm import dispatcher, response_cache
+
+MESSAGES = [{"role": "user", "content": "classify: refund please"}]
+
+
+@pytest.fixture
+def cached_llm(settings, llm_server):
+    settings.UNICOM_LLM_RESPONSE_CACHE = True
+    cache.clear()
+    yield llm_server
+    cache.clear()
+
+
+def test_deterministic_requests_are_served_from_cache(cached_llm):
+    first = dispatcher.complete("gpt-test", MESSAGES, temperature=0)
+    second = dispatcher.complete("gpt-test", MESSAGES, temperature=0, timeout=30)
+    third = async_to_sync(dispatcher.acomplete)("gpt-test", MESSAGES, temperature=0)
+
+    assert len(cached_llm.requests) == 1
+    assert first.choices[0].message.content == second.choices[0].message.content == "echo: classify: refund please"
+    assert third.model_dump() == first.model_dump()
+    stats = response_cache.get_response_cache_stats()
+    assert (stats["hit"], stats["miss"], stats["store"]) == (2, 1, 1)
+    assert stats["hit_rate"] == pytest.approx(2 / 3, abs=1e-4)
+
+
+def test_key_covers_model_messages_tools_and_params(cached_llm):
+    dispatcher.complete("gpt-test", MESSAGES, temperature=0)
+    dispatcher.complete("gpt-other", MESSAGES, temperature=0)
+    dispatcher.complete("gpt-test", MESSAGES, temperature=0, max_tokens=5)
+    dispatcher.complete("gpt-test", MESSAGES, temperature=0, tools=[{
+        "type": "function", "function": {"name": "lookup", "parameters": {"type": "object"}},
+    }])
+    dispatcher.complete("gpt-test", [{"role": "user", "content": "something else"}], temperature=0)
+
+    assert len(cached_llm.requests) == 5
+
+
+def test_nondeterministic_requests_bypass_cache(cached_llm):
+    dispatcher.complete("gpt-test", MESSAGES)
+    dispatcher.complete("gpt-test", MESSAGES)
+    dispatcher.complete("gpt-test", MESSAGES, temperature=0, n=2)
+
+    assert len(cached_llm.requests) == 3
+    assert response_cache.get_response_cache_stats()["uncacheable"] == 3
+
+
+def test_cache_is_opt_in(settings, cached_llm):
+    settings.UNICOM_LLM_RESPONSE_CACHE = False
+    dispatcher.complete("gpt-test", MESSAGES, temperature=0)
+    dispatcher.complete("gpt-test", MESSAGES, temperature=0)
+    assert len(cached_llm.requests) == 2
+
+    dispatcher.complete("gpt-test", MESSAGES, temperature=0, cache=True)
+    dispatcher.complete("gpt-test", MESSAGES, temperature=0, cache=True)
+    assert len(cached_llm.requests) == 3
+
+
+def test_oversized_responses_are_not_stored(settings, cached_llm):
+    settings.UNICOM_LLM_RESPONSE_CACHE_MAX_ENTRY_BYTES = 10
+    dispatcher.complete("gpt-test", MESSAGES, temperature=0)
+    dispatcher.complete("gpt-test", MESSAGES, temperature=0)
+
+    assert len(cached_llm.requests) == 2
+    assert response_cache.get_response_cache_stats()["store"] == 0
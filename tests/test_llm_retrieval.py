@@ -0,0 +1,153 @@
+import itertools
+from datetime import timedelta
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+
+np = pytest.importorskip("numpy")
+
+from unicom.services.llm import retrieval  # noqa: E402
+
+_ids = itertools.count(1)
+
+
+@pytest.fixture
+def enabled(settings, tmp_path):
+    settings.UNICOM_RETRIEVAL_ENABLED = True
+    settings.UNICOM_RETRIEVAL_DIR = str(tmp_path)
+    settings.UNICOM_RETRIEVAL_ASYNC = False
+    retrieval.clear_loaded_indexes()
+    yield settings
+    retrieval.clear_loaded_indexes()
+
+
+@pytest.fixture
+def other_chat(webchat_channel, account):
+    from unicom.models import AccountChat, Chat
+
+    chat = Chat.objects.create(id=f"retrieval_chat_{next(_ids)}", channel=webchat_channel, platform="WebChat")
+    AccountChat.objects.create(account=account, chat=chat)
+    return chat
+
+
+def say(chat, account, text, days_ago=0, **fields):
+    from unicom.models import Message
+
+    return Message.objects.create(
+        id=f"retrieval_msg_{next(_ids)}", channel=chat.channel, platform=chat.platform, chat=chat,
+        sender=account, sender_name=account.name, is_outgoing=fields.pop("is_outgoing", False), text=text,
+        timestamp=timezone.now() - timedelta(days=days_ago), raw={}, **fields,
+    )
+
+
+def test_hashing_encoder_ranks_shared_words_higher(settings):
+    settings.UNICOM_RETRIEVAL_DIMENSIONS = 256
+    query, near, far = retrieval.hashing_encoder(
+        ["refund for my broken blender", "the blender arrived broken", "what are your opening hours"]
+    )
+    assert query.shape == (256,) and np.isclose(np.linalg.norm(query), 1.0)
+    assert query @ near > query @ far
+
+
+def test_encoders_without_a_stable_name_need_a_cache_key():
+    def local_encoder(texts):
+        return retrieval.hashing_encoder(texts)
+
+    assert retrieval._encoder_key(retrieval.hashing_encoder).startswith("hashing:")
+    with pytest.raises(ValueError):
+        retrieval._encoder_key(local_encoder)
+    local_encoder.cache_key = "my-model:v1"
+    assert retrieval._encoder_key(local_encoder) == "my-model:v1"
+
+
+@pytest.mark.django_db
+def test_as_llm_chat_injects_related_messages_from_the_senders_other_chats(
+    enabled, chat, other_chat, account, django_capture_on_commit_callbacks
+):
+    from unicom.models import Account, AccountChat, Chat
+
+    stranger = Account.objects.create(id=f"stranger_{next(_ids)}", channel=chat.channel, platform="WebChat", name="X")
+    stranger_chat = Chat.objects.create(id=f"stranger_chat_{next(_ids)}", channel=chat.channel, platform="WebChat")
+    AccountChat.objects.create(account=stranger, chat=stranger_chat)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        old = say(other_chat, account, "My blender order 1234 arrived with a cracked jar", days_ago=30)
+        say(other_chat, account, "What are your opening hours?", days_ago=29)
+        say(stranger_chat, stranger, "My blender jar is cracked too", days_ago=10)
+        say(chat, account, "Hello again", days_ago=0)
+        current = say(chat, account, "Any news about the cracked blender jar?")
+
+    context = current.as_llm_chat(depth=2, retrieve=3)
+
+    assert context[0]["role"] == "system"
+    assert context[0]["content"].startswith(retrieval.RETRIEVAL_PREFIX)
+    assert old.text in context[0]["content"]
+    assert "cracked too" not in context[0]["content"]
+    assert "opening hours" not in context[0]["content"]
+    assert [m["content"] for m in context[1:]] == ["Hello again", current.text]
+    assert current.as_llm_chat(depth=2) == context[1:]
+
+
+@pytest.mark.django_db
+def test_outgoing_messages_do_not_reach_other_customers_through_the_bot_account(
+    enabled, chat, other_chat, account, django_capture_on_commit_callbacks
+):
+    from unicom.models import Account, AccountChat, Chat
+
+    bot = Account.objects.create(id=f"bot_{next(_ids)}", channel=chat.channel, platform="WebChat", name="Bot", is_bot=True)
+    stranger = Account.objects.create(id=f"stranger_{next(_ids)}", channel=chat.channel, platform="WebChat", name="X")
+    stranger_chat = Chat.objects.create(id=f"stranger_chat_{next(_ids)}", channel=chat.channel, platform="WebChat")
+    AccountChat.objects.bulk_create([
+        AccountChat(account=stranger, chat=stranger_chat),
+        AccountChat(account=bot, chat=stranger_chat),
+        AccountChat(account=bot, chat=chat),
+    ])
+
+    with django_capture_on_commit_callbacks(execute=True):
+        say(stranger_chat, stranger, "My blender jar is cracked, order 9999", days_ago=10)
+        own = say(other_chat, account, "The blender jar I got is cracked", days_ago=20)
+        reply = say(chat, bot, "Sorry to hear the blender jar is cracked", is_outgoing=True)
+
+    related = retrieval.retrieve_related(reply, k=5)
+
+    assert related == [own]
+    assert retrieval.customer_chat_ids(reply) == {chat.id, other_chat.id}
+
+
+@pytest.mark.django_db
+def test_segments_are_compacted_and_edits_replace_vectors(enabled, chat, account, django_capture_on_commit_callbacks):
+    enabled.UNICOM_RETRIEVAL_MAX_SEGMENTS = 3
+    with django_capture_on_commit_callbacks(execute=True):
+        messages = [say(chat, account, f"note {n} about topic{n}", days_ago=1) for n in range(5)]
+    index = retrieval.get_index(chat.channel_id)
+    assert len(index.segment_paths()) <= 3
+    assert sorted(index.ids) == sorted(m.id for m in messages)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        messages[0].text = "completely different wording"
+        messages[0].save(update_fields=["text"])
+        messages[1].text = "also reworded"
+        messages[1].save()
+    hits = [message_id for message_id, _ in index.search(retrieval.hashing_encoder(["topic0 topic1"])[0], 5)]
+    assert messages[0].id not in hits and messages[1].id not in hits
+
+    # Another process sees the same index from disk
+    retrieval.clear_loaded_indexes()
+    fresh = retrieval.get_index(chat.channel_id)
+    fresh.refresh()
+    assert sorted(fresh.ids) == sorted(index.ids)
+
+
+@pytest.mark.django_db
+def test_build_retrieval_index_command(enabled, chat, account):
+    enabled.UNICOM_RETRIEVAL_ENABLED = False
+    say(chat, account, "indexed later by the command", days_ago=1)
+    enabled.UNICOM_RETRIEVAL_ENABLED = True
+    assert not retrieval.get_index(chat.channel_id).segment_paths()
+
+    call_command("build_retrieval_index", channel=[chat.channel_id])
+
+    index = retrieval.get_index(chat.channel_id)
+    index.refresh()
+    assert len(index.ids) == 1 and len(index.segment_paths()) == 1
@@ -0,0 +1,200 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from asgiref.sync import async_to_sync
+
+from unicom.services.llm import streaming
+
+
+class FakeStreamingClient:
+    """Mimics ``client.chat.completions.create(stream=True)`` with canned chunks."""
+
+    def __init__(self, pieces, fail_after=None):
+        self.pieces = pieces
+        self.fail_after = fail_after
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        return self._stream()
+
+    def _stream(self):
+        for i, piece in enumerate(self.pieces):
+            if self.fail_after is not None and i == self.fail_after:
+                raise RuntimeError("connection reset")
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))])
+
+
+@pytest.fixture
+def chat_group(settings, chat):
+    pytest.importorskip("channels")
+    from channels.layers import get_channel_layer
+
+    settings.CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+    layer = get_channel_layer()
+    channel_name = async_to_sync(layer.new_channel)()
+    async_to_sync(layer.group_add)(f"webchat_chat_{chat.id}", channel_name)
+    return layer, channel_name
+
+
+def _deltas(layer, channel_name):
+    async def drain():
+        events = []
+        while True:
+            try:
+                events.append(await asyncio.wait_for(layer.receive(channel_name), 0.05))
+            except asyncio.TimeoutError:
+                return events
+
+    return [e for e in async_to_sync(drain)() if e["type"] == "webchat.message_delta"]
+
+
+@pytest.mark.django_db
+def test_stream_pushes_deltas_and_persists_once(settings, chat_group, make_message):
+    settings.UNICOM_LLM_STREAM_PUSH_INTERVAL = 0
+    settings.UNICOM_LLM_STREAM_SAVE_INTERVAL = 3600
+    layer, channel_name = chat_group
+    prompt = make_message(text="question")
+    client = FakeStreamingClient(["Hel", "lo", "", " world"])
+
+    reply = streaming.stream_llm_reply(prompt, "gpt-test", [{"role": "user", "content": "question"}], client)
+
+    assert client.calls[0]["stream"] is True
+    deltas = _deltas(layer, channel_name)
+    assert [(d["offset"], d["delta"]) for d in deltas] == [(0, "Hel"), (3, "lo"), (5, " world")]
+    assert {d["message_id"] for d in deltas} == {reply.id}
+
+    reply.refresh_from_db()
+    assert reply.text == "Hello world"
+    assert reply.reply_to_message_id == prompt.id
+    stats = reply.raw["llm_stream"]
+    assert stats["chunks"] == 3
+    assert stats["ttft_ms"] is not None and stats["ttft_ms"] <= stats["duration_ms"]
+
+
+@pytest.mark.django_db
+def test_partial_text_is_saved_when_stream_fails(settings, chat_group, make_message):
+    settings.UNICOM_LLM_STREAM_SAVE_INTERVAL = 0
+    prompt = make_message(text="question")
+    client = FakeStreamingClient(["partial ", "answer", "never"], fail_after=2)
+
+    with pytest.raises(RuntimeError):
+        streaming.stream_llm_reply(prompt, "gpt-test", [], client)
+
+    from unicom.models import Message
+
+    reply = Message.objects.get(reply_to_message=prompt)
+    assert reply.text == "partial answer"
+    assert reply.raw["llm_stream"]["error"] == "connection reset"
+
+
+@pytest.mark.django_db
+def test_streamed_reply_is_retried_when_rate_limited(chat_group, llm_server, make_message):
+    llm_server.rate_limited = 1
+    prompt = make_message(text="question")
+
+    reply = streaming.stream_llm_reply(prompt, "gpt-test", [{"role": "user", "content": "question"}])
+
+    reply.refresh_from_db()
+    assert reply.text == "echo: question"
+    assert len(llm_server.requests) == 2
+
+
+@pytest.mark.django_db
+def test_reply_using_llm_streams_for_webchat(settings, chat_group, make_message, monkeypatch):
+    from unicom.services.llm import dispatcher
+
+    client = FakeStreamingClient(["streamed"])
+    monkeypatch.setattr(dispatcher, "get_client", lambda max_retries=0: client)
+    prompt = make_message(text="question")
+    monkeypatch.setattr(type(prompt), "as_llm_chat", lambda self, **kwargs: [{"role": "user", "content": "question"}])
+
+    reply = prompt.reply_using_llm("gpt-test", stream=True)
+
+    assert reply.text == "streamed"
+    assert client.calls[0]["stream"] is True
+
+
+@pytest.fixture
+def telegram_edits(monkeypatch):
+    """Record edit_telegram_message calls; ``results`` lists return values to hand out."""
+    calls, results = [], []
+
+    def fake_edit(channel, message, params):
+        calls.append(params)
+        return results.pop(0) if results else True
+
+    monkeypatch.setattr(streaming, "edit_telegram_message", fake_edit)
+    return calls, results
+
+
+@pytest.fixture
+def telegram_prompt(make_message, monkeypatch):
+    prompt = make_message(text="question", platform="Telegram")
+    placeholder = make_message(
+        text=streaming.PLACEHOLDER_TEXT, platform="Telegram", reply_to_message=prompt,
+        raw={"message_id": 42, "chat": {"id": 7}},
+    )
+    monkeypatch.setattr(prompt, "reply_with", lambda msg: placeholder)
+    return prompt
+
+
+@pytest.mark.django_db
+def test_telegram_edits_are_coalesced(settings, telegram_prompt, telegram_edits):
+    settings.UNICOM_TELEGRAM_STREAM_EDIT_INTERVAL = 3600
+    calls, _ = telegram_edits
+
+    reply = streaming.stream_llm_reply(telegram_prompt, "gpt-test", [], FakeStreamingClient(["*Bold*", " answer"]))
+
+    # Only the final Markdown edit; intermediate edits fall inside the interval
+    assert calls == [{"text": "*Bold* answer", "parse_mode": "Markdown"}]
+    reply.refresh_from_db()
+    assert reply.text == "*Bold* answer"
+    assert reply.raw["message_id"] == 42
+    assert reply.raw["llm_stream"]["chunks"] == 2
+
+
+@pytest.mark.django_db
+def test_telegram_intermediate_edits_are_plain_and_final_falls_back(settings, telegram_prompt, telegram_edits):
+    settings.UNICOM_TELEGRAM_STREAM_EDIT_INTERVAL = 0
+    calls, results = telegram_edits
+    results.extend([True, True, False, False])
+
+    streaming.stream_llm_reply(telegram_prompt, "gpt-test", [], FakeStreamingClient(["a_b", " c"]))
+
+    assert calls == [
+        {"text": "a_b", "parse_mode": None},
+        {"text": "a_b c", "parse_mode": None},
+        {"text": "a_b c", "parse_mode": "Markdown"},
+        {"text": "a\\_b c", "parse_mode": "Markdown"},
+    ]
+
+
+@pytest.mark.django_db
+def test_stream_failing_before_any_text_replaces_the_placeholder(settings, chat_group, make_message):
+    settings.UNICOM_LLM_STREAM_ERROR_TEXT = "No reply, sorry."
+    layer, channel_name = chat_group
+    prompt = make_message(text="question")
+
+    with pytest.raises(RuntimeError):
+        streaming.stream_llm_reply(prompt, "gpt-test", [], FakeStreamingClient(["never"], fail_after=0))
+
+    from unicom.models import Message
+
+    reply = Message.objects.get(reply_to_message=prompt)
+    assert reply.text == "No reply, sorry."
+    assert reply.raw["llm_stream"]["ttft_ms"] is None
+    assert [d["delta"] for d in _deltas(layer, channel_name)] == ["No reply, sorry."]
+
+
+@pytest.mark.django_db
+def test_telegram_placeholder_is_edited_when_stream_fails_at_once(settings, telegram_prompt, telegram_edits):
+    settings.UNICOM_LLM_STREAM_ERROR_TEXT = "No reply, sorry."
+    calls, _ = telegram_edits
+
+    with pytest.raises(RuntimeError):
+        streaming.stream_llm_reply(telegram_prompt, "gpt-test", [], FakeStreamingClient(["never"], fail_after=0))
+
+    assert calls == [{"text": "No reply, sorry.", "parse_mode": "Markdown"}]
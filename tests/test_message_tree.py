@@ -0,0 +1,183 @@
+import time
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from unicom.services.message_tree import ancestor_chain, ancestor_depths
+
+
+def _bulk_thread(chat, account, count, branch_every=50):
+    """A linear reply chain of ``count`` messages, with a sibling edit every ``branch_every``."""
+    from unicom.models import Message
+
+    start = timezone.now() - timezone.timedelta(days=1)
+    rows = []
+    previous = None
+    for i in range(count):
+        parent = previous
+        if i and i % branch_every == 0:
+            rows.append(Message(
+                id=f"bench_{i}_edit", channel=chat.channel, platform=chat.platform, chat=chat,
+                sender=account, sender_name="b", is_outgoing=False, text="edit", raw={},
+                timestamp=start + timezone.timedelta(seconds=i, milliseconds=500),
+                reply_to_message_id=parent,
+            ))
+        rows.append(Message(
+            id=f"bench_{i}", channel=chat.channel, platform=chat.platform, chat=chat,
+            sender=account, sender_name="b", is_outgoing=i % 2 == 0, text=str(i), raw={},
+            timestamp=start + timezone.timedelta(seconds=i), reply_to_message_id=parent,
+        ))
+        previous = f"bench_{i}"
+    Message.objects.bulk_create(rows, batch_size=2000)
+
+
+@pytest.mark.django_db
+def test_ancestor_depths_follows_reply_chain(chat, account, make_message):
+    root = make_message(id="root")
+    child = make_message(id="child", reply_to_message=root)
+    leaf = make_message(id="leaf", reply_to_message=child)
+    other = make_message(id="other", reply_to_message=root)
+
+    assert ancestor_chain(leaf.id, 10) == ["leaf", "child", "root"]
+    assert ancestor_chain(leaf.id, 2) == ["leaf", "child"]
+    assert ancestor_depths([leaf.id, other.id], 10) == {"leaf": 0, "other": 0, "child": 1, "root": 1}
+
+
+@pytest.mark.django_db
+def test_latest_branch_and_thread_context_on_10k_message_chat(chat, account):
+    from unicom.models import Message
+    from unicom.views.webchat_views import _get_latest_branch_messages
+
+    _bulk_thread(chat, account, 10000)
+
+    started = time.perf_counter()
+    with CaptureQueriesContext(connection) as ctx:
+        messages = _get_latest_branch_messages(chat, 200)
+    elapsed = time.perf_counter() - started
+    # Newest page, ancestor CTE, chain rows – independent of chat size and depth.
+    assert len(ctx.captured_queries) == 3
+    assert messages[0].id == "bench_9999"
+    # 200 newest rows plus up to 19 ancestors of the oldest of them.
+    assert 200 <= len(messages) <= 219
+    assert elapsed < 2, f"latest branch took {elapsed:.3f}s"
+
+    leaf = Message.objects.get(id="bench_9999")
+    with CaptureQueriesContext(connection) as ctx:
+        context = leaf.as_llm_chat(depth=129, mode="thread")
+    assert len(ctx.captured_queries) == 2
+    assert len(context) == 129
+    assert context[-1]["content"] == "9999"
+
+
+@pytest.mark.django_db
+def test_chat_mode_window_is_one_keyset_query(chat, account):
+    from unicom.models import Message
+
+    def timed_window(message_id):
+        message = Message.objects.get(id=message_id)
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as ctx:
+            context = message.as_llm_chat(depth=129, mode="chat")
+        return context, ctx.captured_queries, time.perf_counter() - started
+
+    _bulk_thread(chat, account, 500)
+    small, small_queries, small_elapsed = timed_window("bench_499")
+    Message.objects.filter(chat=chat).delete()
+    _bulk_thread(chat, account, 10000)
+    large, large_queries, large_elapsed = timed_window("bench_9999")
+
+    assert len(small_queries) == len(large_queries) == 1
+    assert "LIMIT 129" in large_queries[0]["sql"]
+    assert len(small) == len(large) == 129
+    assert [m["content"] for m in large[-3:]] == ["9997", "9998", "9999"]
+    # Same work regardless of chat size (generous bound for noisy CI machines)
+    assert large_elapsed < max(small_elapsed * 5, 0.5), (small_elapsed, large_elapsed)
+
+    # The sibling edit saved half a second after bench_5000 is not part of its window
+    middle, _, _ = timed_window("bench_5000")
+    assert [m["content"] for m in middle[-2:]] == ["4999", "5000"]
+    assert [m["content"] for m in middle].count("edit") == 2
+
+
+@pytest.mark.django_db
+def test_chat_mode_window_breaks_timestamp_ties_on_id(make_message):
+    now = timezone.now()
+    first = make_message(id="tie_a", text="a", timestamp=now)
+    make_message(id="tie_b", text="b", timestamp=now)
+
+    assert [m["content"] for m in first.as_llm_chat(mode="chat")] == ["a"]
+
+
+@pytest.mark.django_db
+def test_save_materializes_path_and_tree_queries(make_message, settings):
+    settings.UNICOM_MESSAGE_PATH_MAX_DEPTH = 3
+    root = make_message(id="r")
+    a = make_message(id="a", reply_to_message=root)
+    b = make_message(id="b", reply_to_message=a)
+    c = make_message(id="c", reply_to_message=b)
+    d = make_message(id="d", reply_to_message=c)
+    edit = make_message(id="a2", reply_to_message=root)
+
+    assert (root.ancestor_ids, root.thread_depth) == ([], 0)
+    assert (c.ancestor_ids, c.thread_depth) == (["r", "a", "b"], 3)
+    assert (d.ancestor_ids, d.thread_depth) == (["a", "b", "c"], 4)
+    assert set(b.get_ancestors().values_list("id", flat=True)) == {"r", "a"}
+    assert set(a.get_descendants().values_list("id", flat=True)) == {"b", "c", "d"}
+    assert list(a.get_siblings().values_list("id", flat=True)) == [edit.id]
+
+    # Nearest ancestors come from the path; deeper walks fall back to the CTE.
+    from unicom.services.message_tree import thread_chain_ids
+    assert thread_chain_ids(d, 3) == ["d", "c", "b"]
+    assert thread_chain_ids(d, 10) == ["d", "c", "b", "a", "r"]
+
+
+@pytest.mark.django_db
+def test_reparenting_rewrites_descendant_paths(make_message, settings):
+    from unicom.models import Message
+
+    settings.UNICOM_MESSAGE_PATH_MAX_DEPTH = 4
+    root = make_message(id="r")
+    other = make_message(id="o", reply_to_message=root)
+    deep = make_message(id="o2", reply_to_message=other)
+    a = make_message(id="a", reply_to_message=root)
+    b = make_message(id="b", reply_to_message=a)
+    make_message(id="c", reply_to_message=b)
+    make_message(id="u", reply_to_message=root)
+
+    a.reply_to_message = deep
+    with CaptureQueriesContext(connection) as ctx:
+        a.save(update_fields=["reply_to_message"])
+    # One statement rewrites all descendants, however many there are
+    assert sum("array_position" in q["sql"] for q in ctx.captured_queries) == 1
+
+    paths = dict(Message.objects.values_list("id", "ancestor_ids"))
+    depths = dict(Message.objects.values_list("id", "thread_depth"))
+    assert (paths["a"], depths["a"]) == (["r", "o", "o2"], 3)
+    assert (paths["b"], depths["b"]) == (["r", "o", "o2", "a"], 4)
+    assert (paths["c"], depths["c"]) == (["o", "o2", "a", "b"], 5)
+    assert (paths["u"], depths["u"]) == (["r"], 1)
+    assert set(deep.get_descendants().values_list("id", flat=True)) == {"a", "b", "c"}
+
+
+@pytest.mark.django_db
+def test_backfill_then_latest_branch_skips_the_cte(chat, account):
+    from django.core.management import call_command
+
+    from unicom.models import Message
+    from unicom.views.webchat_views import _get_latest_branch_messages
+
+    _bulk_thread(chat, account, 500)
+    assert Message.objects.filter(thread_depth__isnull=True).count() == 509
+    call_command("backfill_message_paths")
+    assert not Message.objects.filter(thread_depth__isnull=True).exists()
+    leaf = Message.objects.get(id="bench_499")
+    assert leaf.thread_depth == 499
+    assert leaf.ancestor_ids[-2:] == ["bench_497", "bench_498"]
+    assert Message.objects.get(id="bench_100_edit").ancestor_ids[-1] == "bench_99"
+
+    with CaptureQueriesContext(connection) as ctx:
+        messages = _get_latest_branch_messages(chat, 200)
+    assert len(ctx.captured_queries) == 2
+    assert messages[0].id == "bench_499"
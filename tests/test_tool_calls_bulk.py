@@ -0,0 +1,52 @@
+import pytest
+
+from unicom.services.llm.tool_calls import save_tool_calls
+
+
+@pytest.mark.django_db
+def test_save_tool_calls_applies_signal_effects_once(chat, make_message, django_capture_on_commit_callbacks, monkeypatch):
+    from unicom.services.webchat import notifier
+
+    notified = []
+    monkeypatch.setattr(notifier, "notify_chat", notified.append)
+    prompt = make_message(text="go")
+    chat.refresh_from_db()
+    before = chat.unsummarized_count
+
+    with django_capture_on_commit_callbacks(execute=True):
+        messages = save_tool_calls(
+            chat, [{"name": "search", "arguments": {"q": n}, "id": f"c{n}"} for n in range(3)],
+            reply_to_message=prompt,
+        )
+
+    assert [m.raw["tool_call"]["id"] for m in chat.messages.filter(media_type="tool_call").order_by("timestamp", "id")] == ["c0", "c1", "c2"]
+    assert {m.sender_id for m in messages} == {f"tool_search_{chat.channel_id}"}
+    assert all(m.ancestor_ids == [prompt.id] and m.thread_depth == 1 for m in messages)
+    assert list(prompt.get_descendants().order_by("timestamp")) == messages
+    chat.refresh_from_db()
+    assert chat.last_message_id == messages[-1].id
+    assert chat.unsummarized_count == before + 3
+    assert notified == [chat.id]
+
+
+@pytest.mark.django_db
+def test_submit_tool_calls_query_count_does_not_grow_with_batch(make_message):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from unicom.models import Request
+
+    def submit(n):
+        request = Request.objects.get(message=make_message(text="please", is_outgoing=False))
+        with CaptureQueriesContext(connection) as queries:
+            request.submit_tool_calls([{"name": "search", "arguments": {"n": i}} for i in range(n)])
+        return request, len(queries)
+
+    submit(1)  # creates the tool's system account
+    _, single = submit(1)
+    request, batch = submit(10)
+    assert batch == single
+
+    calls = list(request.tool_calls.select_related("tool_call_message").order_by("tool_call_message__timestamp"))
+    assert [c.arguments["n"] for c in calls] == list(range(10))
+    assert all(c.tool_call_message.raw["tool_call"]["id"] == c.call_id for c in calls)
+    assert request.pending_tool_calls == 10
@@ -0,0 +1,139 @@
+import importlib
+import threading
+import time
+
+import pytest
+from django.apps import apps
+
+from unicom.services.llm import tool_worker
+from unicom.services.llm.tool_fanout import run_tool_calls
+
+
+@pytest.fixture
+def handlers(settings):
+    settings.UNICOM_TOOL_HANDLERS = {}
+    yield settings.UNICOM_TOOL_HANDLERS
+    tool_worker._registry.clear()
+
+
+@pytest.fixture
+def make_request(make_message):
+    from unicom.models import Request
+
+    def make():
+        return Request.objects.get(message=make_message(text="please", is_outgoing=False))
+
+    return make
+
+
+def slow_echo(call):
+    time.sleep(0.2)
+    return {"echo": call.arguments["n"]}
+
+
+@pytest.mark.django_db
+def test_fan_out_runs_calls_in_parallel_and_creates_one_child(handlers, make_request):
+    handlers["echo"] = slow_echo
+    request = make_request()
+
+    started = time.monotonic()
+    child = run_tool_calls(request, [{"name": "echo", "arguments": {"n": n}} for n in range(3)])
+    elapsed = time.monotonic() - started
+
+    assert elapsed < 0.45
+    assert child is not None and child.parent_request == request
+    assert list(request.child_requests.all()) == [child]
+    request.refresh_from_db()
+    assert request.pending_tool_calls == 0
+    assert set(request.tool_calls.values_list("status", flat=True)) == {"COMPLETED"}
+    assert set(request.tool_calls.values_list("leased_by", flat=True)) == {""}
+
+
+@pytest.mark.django_db
+def test_fan_out_leaves_unhandled_calls_pending(handlers, make_request):
+    def broken(call):
+        raise RuntimeError("backend down")
+
+    handlers["broken"] = broken
+    request = make_request()
+
+    assert run_tool_calls(request, [{"name": "broken", "arguments": {}}, {"name": "manual", "arguments": {}}]) is None
+
+    failed = request.tool_calls.get(tool_name="broken")
+    manual = request.tool_calls.get(tool_name="manual")
+    assert (failed.status, failed.result_status) == ("COMPLETED", "ERROR")
+    assert manual.status == "PENDING"
+    request.refresh_from_db()
+    assert request.pending_tool_calls == 1
+
+    _, child = manual.respond("done by hand")
+    assert child is not None
+
+
+@pytest.mark.django_db
+def test_counter_tracks_calls_leaving_pending(make_request):
+    request = make_request()
+    calls = request.submit_tool_calls([{"name": "t", "arguments": {"n": n}} for n in range(4)])
+    assert request.pending_tool_calls == 4
+
+    calls[0].start_processing()
+    calls[0].start_processing()  # already left PENDING; no second decrement
+    calls[1].mark_error("boom")
+    calls[2].mark_active()
+    request.refresh_from_db()
+    assert request.pending_tool_calls == 1
+
+    assert calls[2].respond("tick")[1] is None
+    _, child = calls[3].respond("last pending")
+    assert child is not None  # IN_PROGRESS and ACTIVE calls do not hold back the fan-in
+    request.refresh_from_db()
+    assert request.pending_tool_calls == 0
+
+
+@pytest.mark.django_db
+def test_backfill_counts_pending_calls(make_request):
+    from unicom.models import Request
+
+    request = make_request()
+    calls = request.submit_tool_calls([{"name": "t", "arguments": {}} for _ in range(3)])
+    calls[0].respond("done")
+    Request.objects.update(pending_tool_calls=0)
+
+    migration = importlib.import_module("unicom.migrations.0033_request_pending_tool_calls")
+    migration.backfill_pending_tool_calls(apps, None)
+
+    request.refresh_from_db()
+    assert request.pending_tool_calls == 2
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_final_responses_create_exactly_one_child(make_request):
+    from django.db import connection
+    from unicom.models import Request, ToolCall
+
+    for _ in range(3):
+        request = make_request()
+        calls = request.submit_tool_calls([{"name": "t", "arguments": {"n": n}} for n in range(4)])
+        barrier = threading.Barrier(len(calls))
+        errors = []
+
+        def respond(pk):
+            try:
+                call = ToolCall.objects.get(pk=pk)
+                barrier.wait(5)
+                call.respond({"call_id": call.call_id})
+            except Exception as exc:  # pragma: no cover - reported below
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=respond, args=(call.pk,)) for call in calls]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        assert Request.objects.filter(parent_request=request).count() == 1
+        request.refresh_from_db()
+        assert request.pending_tool_calls == 0
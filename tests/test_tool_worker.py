@@ -0,0 +1,202 @@
+import threading
+import time
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+
+from unicom.services.llm import tool_worker
+
+
+@pytest.fixture
+def handlers(settings):
+    settings.UNICOM_TOOL_HANDLERS = {}
+    yield settings.UNICOM_TOOL_HANDLERS
+    tool_worker._registry.clear()
+
+
+@pytest.fixture
+def submit_calls(make_message):
+    from unicom.models import Request
+
+    def submit(*names):
+        prompt = make_message(text="please", is_outgoing=False)
+        request = Request.objects.get(message=prompt)
+        return request, request.submit_tool_calls([{"name": name, "arguments": {"n": i}} for i, name in enumerate(names)])
+
+    return submit
+
+
+def run_until_idle(worker, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not worker.run_once() and not worker.running:
+            return
+        time.sleep(0.01)
+    raise AssertionError("worker did not go idle")
+
+
+@pytest.mark.django_db
+def test_worker_runs_handlers_and_fans_in_once(handlers, submit_calls):
+    tool_worker.register_tool_handler("double", lambda call: {"value": call.arguments["n"] * 2})
+    request, calls = submit_calls("double", "double", "double")
+    worker = tool_worker.ToolWorker(threads=4)
+
+    run_until_idle(worker)
+
+    for call in calls:
+        call.refresh_from_db()
+        assert call.status == "COMPLETED"
+        assert call.leased_by == "" and call.lease_expires_at is None and call.attempts == 1
+    assert request.child_requests.count() == 1
+    assert worker.stats["completed"] == 3
+    worker.shutdown()
+
+
+@pytest.mark.django_db
+def test_errors_and_timeouts_are_reported_to_the_llm(handlers, submit_calls):
+    release = threading.Event()
+
+    def broken(call):
+        raise RuntimeError("backend down")
+
+    tool_worker.register_tool_handler("broken", broken)
+    tool_worker.register_tool_handler("slow", lambda call: release.wait(5) and "late", timeout=0.1)
+    request, (failed, slow) = submit_calls("broken", "slow")
+    worker = tool_worker.ToolWorker(threads=2)
+
+    run_until_idle(worker)
+    release.set()
+
+    failed.refresh_from_db()
+    slow.refresh_from_db()
+    assert (failed.status, failed.result_status) == ("COMPLETED", "ERROR")
+    assert (slow.status, slow.result_status) == ("COMPLETED", "ERROR")
+    responses = {m.raw["tool_response"]["call_id"]: m.raw["tool_response"]["result"]
+                 for m in request.message.chat.messages.filter(media_type="tool_response")}
+    assert responses[failed.call_id]["error"] == "backend down"
+    assert "timed out" in responses[slow.call_id]["error"]
+    worker.shutdown()
+
+
+@pytest.mark.django_db
+def test_deferred_calls_stay_in_progress(handlers, submit_calls):
+    handlers["remind_later"] = lambda call: None
+    _, (call,) = submit_calls("remind_later")
+
+    run_until_idle(tool_worker.ToolWorker(threads=1))
+
+    call.refresh_from_db()
+    assert call.status == "IN_PROGRESS"
+    assert call.lease_expires_at is None
+
+
+@pytest.mark.django_db
+def test_leases_block_other_workers_until_expired(settings, handlers, submit_calls):
+    handlers["search"] = lambda call: "found"
+    _, (call,) = submit_calls("search")
+    first, second = tool_worker.ToolWorker(worker_id="a"), tool_worker.ToolWorker(worker_id="b")
+
+    assert [c.pk for c in first.claim("search", 5)] == [call.pk]
+    assert second.claim("search", 5) == []
+
+    # Worker "a" died: once the lease expires the call is claimable again
+    type(call).objects.filter(pk=call.pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+    reclaimed = second.claim("search", 5)
+    assert [(c.leased_by, c.attempts) for c in reclaimed] == [("b", 2)]
+
+
+@pytest.mark.django_db
+def test_calls_over_max_attempts_are_abandoned(settings, handlers, submit_calls):
+    settings.UNICOM_TOOL_WORKER_MAX_ATTEMPTS = 1
+    handlers["search"] = lambda call: pytest.fail("should not run")
+    _, (call,) = submit_calls("search")
+    type(call).objects.filter(pk=call.pk).update(attempts=1)
+
+    run_until_idle(tool_worker.ToolWorker(threads=1))
+
+    call.refresh_from_db()
+    assert (call.status, call.result_status) == ("COMPLETED", "ERROR")
+
+
+@pytest.mark.django_db
+def test_per_tool_concurrency_cap(handlers, submit_calls):
+    release = threading.Event()
+    tool_worker.register_tool_handler("exclusive", lambda call: release.wait(5) and "done", concurrency=1)
+    tool_worker.register_tool_handler("free", lambda call: "ok")
+    submit_calls("exclusive", "exclusive", "exclusive", "free")
+    worker = tool_worker.ToolWorker(threads=4)
+
+    assert worker.run_once() == 2  # one "exclusive" plus "free"
+    assert worker.run_once() == 0
+    release.set()
+    run_until_idle(worker)
+    assert worker.stats["completed"] == 4
+    worker.shutdown()
+
+
+@pytest.mark.django_db
+def test_hung_handler_keeps_its_slot_until_it_returns(handlers, submit_calls):
+    release = threading.Event()
+    tool_worker.register_tool_handler("hang", lambda call: release.wait(5) and "late", timeout=0.1)
+    tool_worker.register_tool_handler("quick", lambda call: "ok")
+    submit_calls("hang")
+    worker = tool_worker.ToolWorker(threads=1)
+    run_until_idle(worker)
+    assert worker.stats["timed_out"] == 1
+
+    _, (quick,) = submit_calls("quick")
+    assert worker.run_once() == 0  # the only thread is still busy with "hang"
+    release.set()
+    worker.abandoned[0].future.result(timeout=5)
+    run_until_idle(worker)
+
+    quick.refresh_from_db()
+    assert (quick.status, quick.result_status) == ("COMPLETED", "SUCCESS")
+    worker.shutdown()
+
+
+@pytest.mark.django_db
+def test_timeout_starts_when_the_handler_starts(handlers, submit_calls):
+    tool_worker.register_tool_handler("steady", lambda call: time.sleep(0.15) or "done", timeout=0.25)
+    _, calls = submit_calls("steady", "steady")
+    worker = tool_worker.ToolWorker(threads=1)
+    # Queue both on the single thread: the second waits 0.15s before it starts
+    for call in worker.claim("steady", 2):
+        worker._submit(call, worker.handlers()["steady"])
+
+    run_until_idle(worker)
+
+    assert worker.stats["timed_out"] == 0
+    assert {c.result_status for c in type(calls[0]).objects.filter(pk__in=[c.pk for c in calls])} == {"SUCCESS"}
+    worker.shutdown()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_claims_skip_locked_rows(handlers, submit_calls):
+    from django.db import connection, transaction
+    from unicom.models import ToolCall
+
+    handlers["search"] = lambda call: "found"
+    _, calls = submit_calls("search", "search")
+    oldest = min(calls, key=lambda c: c.created_at)
+    locked = threading.Event()
+    done = threading.Event()
+
+    def hold_lock():
+        with transaction.atomic():
+            ToolCall.objects.select_for_update().get(pk=oldest.pk)
+            locked.set()
+            done.wait(5)
+        connection.close()
+
+    holder = threading.Thread(target=hold_lock)
+    holder.start()
+    locked.wait(5)
+    try:
+        claimed = tool_worker.ToolWorker(worker_id="b").claim("search", 5)
+    finally:
+        done.set()
+        holder.join()
+
+    assert [c.pk for c in claimed] == [c.pk for c in calls if c.pk != oldest.pk]
@@ -0,0 +1,67 @@
+import json
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+
+@pytest.fixture
+def many_chats(user_account):
+    """25 chats: 20 with a last message (two sharing a timestamp) and 5 empty ones."""
+    from unicom.models import AccountChat, Chat, Message
+
+    channel = user_account.channel
+    now = timezone.now()
+    chats = []
+    for i in range(25):
+        chat = Chat.objects.create(id=f"list_{i:02d}", channel=channel, platform="WebChat", name=f"Chat {i}")
+        AccountChat.objects.create(account=user_account, chat=chat)
+        if i < 20:
+            ts = now - timezone.timedelta(minutes=min(i, 10))
+            msg = Message.objects.create(
+                id=f"last_{i}", channel=channel, platform="WebChat", chat=chat, sender=user_account,
+                sender_name="u", is_outgoing=True, text=f"hi {i}", timestamp=ts, raw={},
+            )
+            Chat.objects.filter(pk=chat.pk).update(last_message=msg)
+        chats.append(chat)
+    return chats
+
+
+def _page(client, **params):
+    with CaptureQueriesContext(connection) as ctx:
+        response = client.get(reverse("webchat_chats"), params)
+    assert response.status_code == 200, response.content
+    return json.loads(response.content), len(ctx.captured_queries)
+
+
+@pytest.mark.django_db
+def test_chats_are_keyset_paginated_newest_first(client, many_chats):
+    seen, cursor, counts = [], None, set()
+    _page(client, limit=1)  # warm the channel/account resolution cache
+    while True:
+        params = {"limit": 7}
+        if cursor:
+            params["cursor"] = cursor
+        data, queries = _page(client, **params)
+        counts.add(queries)
+        seen.extend(data["chats"])
+        if not data["has_more"]:
+            assert data["next_cursor"] is None
+            break
+        cursor = data["next_cursor"]
+
+    assert len(seen) == 25
+    assert len({c["id"] for c in seen}) == 25
+    stamps = [c["last_message"]["timestamp"] for c in seen if c["last_message"]]
+    assert stamps == sorted(stamps, reverse=True)
+    assert all(c["last_message"] is None for c in seen[20:])
+    # One query for the page regardless of page contents (no per-chat last_message loads).
+    assert len(counts) == 1
+
+
+@pytest.mark.django_db
+def test_invalid_chats_cursor_is_rejected(client, user_account):
+    response = client.get(reverse("webchat_chats"), {"cursor": "not-a-cursor"})
+    assert response.status_code == 400
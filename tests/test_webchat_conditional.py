@@ -0,0 +1,67 @@
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+
+from unicom.services.webchat.conditional import get_conditional_stats
+
+
+@pytest.fixture
+def user_chat(user_account, chat):
+    from unicom.models import AccountChat
+
+    AccountChat.objects.create(account=user_account, chat=chat)
+    return chat
+
+
+@pytest.mark.django_db
+def test_messages_api_answers_matching_etag_with_304(client, user_chat, make_message, django_assert_max_num_queries):
+    cache.clear()
+    make_message(text="first")
+    url = reverse("webchat_messages")
+    params = {"chat_id": user_chat.id}
+
+    response = client.get(url, params)
+    assert response.status_code == 200
+    assert response["Cache-Control"] == "private, no-cache"
+    etag = response["ETag"]
+
+    with django_assert_max_num_queries(8):
+        revalidated = client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+    assert revalidated.status_code == 304
+    assert client.get(url, {**params, "limit": 5}, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+    make_message(text="second")
+    assert client.get(url, params, HTTP_IF_NONE_MATCH=etag).status_code == 200
+    assert get_conditional_stats()["messages"] == {"304": 1, "200": 3}
+
+
+@pytest.mark.django_db
+def test_chat_list_etag_changes_when_a_chat_changes(client, user_chat):
+    cache.clear()
+    url = reverse("webchat_chats")
+    etag = client.get(url)["ETag"]
+    assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+    user_chat.name = "Renamed"
+    user_chat.save(update_fields=["name"])
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+    assert get_conditional_stats()["chats"] == {"304": 1, "200": 2}
+
+
+@pytest.mark.django_db
+def test_message_insert_writes_the_chat_row_once(chat, make_message):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    from unicom.models import Chat
+
+    with CaptureQueriesContext(connection) as ctx:
+        message = make_message(text="hello")
+    assert sum(q["sql"].startswith('UPDATE "unicom_chat"') for q in ctx.captured_queries) == 1
+
+    before = Chat.objects.get(pk=chat.pk).updated_at
+    message.text = "edited"
+    message.save(update_fields=["text"])
+    assert Chat.objects.get(pk=chat.pk).updated_at > before
@@ -0,0 +1,24 @@
+import pytest
+
+pytest.importorskip("channels")
+
+from unicom.services.webchat.loadtest import run_load_test  # noqa: E402
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize("mode", ["push", "poll"])
+def test_load_test_delivers_to_every_client(mode):
+    from unicom.models import Channel, Message
+
+    report = run_load_test(clients=4, chats=2, rate=20, duration=0.3, mode=mode).as_dict()
+
+    assert report["connect_failures"] == 0
+    assert report["messages_sent"] > 0
+    assert report["deliveries"] == report["deliveries_expected"] == report["messages_sent"] * 2
+    assert report["latency_ms"]["p50"] <= report["latency_ms"]["p99"]
+    assert report["queries_per_second"]["injection"] > 0
+    if mode == "push":
+        # Pushed delivery costs no queries once sockets are connected
+        assert report["queries_per_second"]["delivery"] == 0
+    assert not Channel.objects.exists()
+    assert not Message.objects.exists()
@@ -0,0 +1,86 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+from django.urls import reverse
+
+from unicom.services.webchat.notifier import chat_notifier
+
+
+@pytest.fixture(autouse=True)
+def local_notifications(settings):
+    # Keep wake-ups in-process; the LISTEN thread would hold a test DB connection.
+    settings.UNICOM_WEBCHAT_PG_NOTIFY = False
+
+
+@pytest.fixture
+def user_chat(user_account, chat):
+    from unicom.models import AccountChat
+
+    AccountChat.objects.create(account=user_account, chat=chat)
+    return chat
+
+
+def _wait(client, chat, **params):
+    started = time.monotonic()
+    response = client.get(reverse("webchat_wait"), {"chat_id": chat.id, **params})
+    assert response.status_code == 200
+    return json.loads(response.content), time.monotonic() - started
+
+
+@pytest.mark.django_db
+def test_wait_returns_pending_messages_immediately(client, user_chat, make_message):
+    first = make_message(text="first")
+    second = make_message(text="second")
+    third = make_message(text="third")
+
+    data, elapsed = _wait(client, user_chat, after=first.id, timeout=5)
+
+    assert elapsed < 2
+    assert data["timed_out"] is False
+    assert [m["id"] for m in data["messages"]] == [second.id, third.id]
+    assert data["cursor"] == third.id
+
+
+@pytest.mark.django_db
+def test_wait_times_out_without_new_messages(client, user_chat, make_message):
+    latest = make_message(text="seen")
+
+    data, _ = _wait(client, user_chat, after=latest.id, timeout=0.2)
+
+    assert data == {"messages": [], "success": True, "chat_id": user_chat.id, "cursor": latest.id, "timed_out": True}
+    assert chat_notifier.waiter_count(user_chat.id) == 0
+
+
+@pytest.mark.django_db
+def test_wait_wakes_on_notification(client, user_chat):
+    timer = threading.Timer(0.3, chat_notifier.notify_local, args=[user_chat.id])
+    timer.start()
+    try:
+        data, elapsed = _wait(client, user_chat, timeout=10)
+    finally:
+        timer.cancel()
+
+    assert data["timed_out"] is False
+    assert elapsed < 5
+
+
+@pytest.mark.django_db
+def test_wait_denies_foreign_chat(client, user_account, chat):
+    response = client.get(reverse("webchat_wait"), {"chat_id": chat.id, "timeout": 0})
+    assert response.status_code == 404
+
+
+@pytest.mark.django_db
+def test_committed_message_wakes_waiters(chat, make_message, django_capture_on_commit_callbacks):
+    loop = asyncio.new_event_loop()
+    try:
+        waiter = chat_notifier.subscribe(chat.id, loop=loop)
+        with django_capture_on_commit_callbacks(execute=True):
+            make_message(text="new")
+        assert loop.run_until_complete(waiter.wait(1)) is True
+        assert chat_notifier.waiter_count(chat.id) == 0
+    finally:
+        loop.close()
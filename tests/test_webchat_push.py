@@ -0,0 +1,128 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("channels")
+
+from asgiref.sync import async_to_sync  # noqa: E402
+from channels.layers import get_channel_layer  # noqa: E402
+
+from unicom.consumers.webchat_consumer import ChatPollRegistry, WebChatConsumer, _ChatPoller  # noqa: E402
+
+
+@pytest.fixture
+def in_memory_layer(settings):
+    settings.CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+    return get_channel_layer()
+
+
+@pytest.mark.django_db
+def test_saved_webchat_message_is_published_to_chat_group(in_memory_layer, chat, make_message, django_capture_on_commit_callbacks):
+    async def subscribe():
+        channel_name = await in_memory_layer.new_channel()
+        await in_memory_layer.group_add(f"webchat_chat_{chat.id}", channel_name)
+        return channel_name
+
+    async def receive(channel_name):
+        return await in_memory_layer.receive(channel_name)
+
+    channel_name = async_to_sync(subscribe)()
+    with django_capture_on_commit_callbacks(execute=True):
+        message = make_message(text="pushed")
+    event = async_to_sync(receive)(channel_name)
+    assert event["type"] == "webchat.new_message"
+    assert event["message"]["id"] == message.id
+    assert event["message"]["text"] == "pushed"
+
+    with django_capture_on_commit_callbacks(execute=True):
+        message.text = "edited"
+        message.save()
+    event = async_to_sync(receive)(channel_name)
+    assert event["type"] == "webchat.message_updated"
+
+
+def test_consumer_forwards_pushed_messages_once():
+    consumer = WebChatConsumer()
+    consumer.chat_id = "chat_1"
+    sent = []
+
+    async def send_json(content, close=False):
+        sent.append(content)
+
+    consumer.send_json = send_json
+    event = {"type": "webchat.new_message", "chat_id": "chat_1", "message": {"id": "m1"}}
+    async_to_sync(consumer.webchat_new_message)(event)
+    async_to_sync(consumer.webchat_new_message)(event)
+    assert sent == [{"type": "new_message", "chat_id": "chat_1", "message": {"id": "m1"}}]
+
+
+@pytest.mark.django_db
+def test_polling_fallback_reads_only_rows_after_cursor(chat, make_message, django_assert_num_queries):
+    from django.utils import timezone
+
+    # Call the wrapped sync functions; database_sync_to_async would close the test connection.
+    latest_cursor = vars(_ChatPoller)["_get_latest_cursor"].func
+    poll = vars(_ChatPoller)["_get_messages_after_cursor"].func
+    now = timezone.now()
+    make_message(id="a", timestamp=now)
+    poller = _ChatPoller(chat.id, chat.channel)
+    poller.cursor = latest_cursor(poller)
+    assert poller.cursor == (now, "a")
+
+    make_message(id="b", timestamp=now, text="same instant")
+    make_message(id="c", timestamp=now + timezone.timedelta(seconds=1))
+    with django_assert_num_queries(1):
+        fresh = poll(poller)
+    assert [item.message_id for item in fresh] == ["b", "c"]
+    assert fresh[0].payload["text"] == "same instant"
+    assert poll(poller) == ()
+
+
+@pytest.mark.django_db
+def test_polling_fallback_delivers_messages_that_commit_late(chat, make_message):
+    from django.utils import timezone
+
+    latest_cursor = vars(_ChatPoller)["_get_latest_cursor"].func
+    poll = vars(_ChatPoller)["_get_messages_after_cursor"].func
+    now = timezone.now()
+    make_message(id="old", timestamp=now - timezone.timedelta(seconds=3))
+    poller = _ChatPoller(chat.id, chat.channel)
+    poller.cursor = latest_cursor(poller)
+
+    make_message(id="newer", timestamp=now)
+    assert [item.message_id for item in poll(poller)] == ["newer"]
+    # Stamped before "newer" but committed after it was polled
+    make_message(id="slow", timestamp=now - timezone.timedelta(seconds=2))
+    assert [item.message_id for item in poll(poller)] == ["slow"]
+    assert poll(poller) == ()
+    assert poller.cursor == (now, "newer")
+
+
+class _Subscriber:
+    def __init__(self, chat_id):
+        self.channel = SimpleNamespace(pk=1)
+        self.chat_id = chat_id
+
+
+def test_chat_poll_registry_shares_one_poller_per_chat():
+    registry = ChatPollRegistry()
+    first, second, other = _Subscriber("c1"), _Subscriber("c1"), _Subscriber("c2")
+
+    async def scenario():
+        registry.subscribe(first)
+        registry.subscribe(second)
+        registry.subscribe(other)
+        assert registry.active_chats == 2
+        assert registry.subscriber_count(1, "c1") == 2
+        task = registry._pollers[(1, "c1")].task
+
+        registry.unsubscribe(first)
+        assert not task.cancelled()
+        registry.unsubscribe(second)
+        registry.unsubscribe(other)
+        assert registry.active_chats == 0
+        await asyncio.sleep(0)
+        assert task.cancelled()
+
+    async_to_sync(scenario)()
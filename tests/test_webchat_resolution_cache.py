@@ -0,0 +1,45 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+LOOKUP_TABLES = ('"unicom_channel"', '"unicom_account"', '"unicom_member"')
+
+
+def _lookup_queries(ctx):
+    return [q["sql"] for q in ctx.captured_queries if any(table in q["sql"] for table in LOOKUP_TABLES)]
+
+
+@pytest.mark.django_db
+def test_warm_requests_skip_channel_and_account_lookups(client, user_account, chat):
+    from unicom.models import AccountChat
+
+    AccountChat.objects.create(account=user_account, chat=chat)
+    client.get(reverse("webchat_chats"))
+
+    for name, params in (("webchat_chats", {}), ("webchat_messages", {"chat_id": chat.id})):
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(reverse(name), params)
+        assert response.status_code == 200
+        assert _lookup_queries(ctx) == []
+
+
+@pytest.mark.django_db
+def test_blocking_an_account_evicts_it(client, user_account):
+    client.get(reverse("webchat_chats"))
+
+    user_account.blocked = True
+    user_account.save(update_fields=["blocked"])
+
+    response = client.post(reverse("webchat_send"), {"text": "hi"})
+    assert response.status_code == 403
+
+
+@pytest.mark.django_db
+def test_deactivating_the_channel_evicts_it(client, user_account, webchat_channel):
+    assert client.get(reverse("webchat_chats")).status_code == 200
+
+    webchat_channel.active = False
+    webchat_channel.save(update_fields=["active"])
+
+    assert client.get(reverse("webchat_chats")).status_code == 400
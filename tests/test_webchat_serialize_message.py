@@ -0,0 +1,59 @@
+import json
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from unicom.services.webchat import serialize_message as serializer
+
+
+@pytest.fixture
+def user_chat(user_account, chat):
+    from unicom.models import AccountChat
+
+    AccountChat.objects.create(account=user_account, chat=chat)
+    return chat
+
+
+def _fetch(client, chat):
+    with CaptureQueriesContext(connection) as ctx:
+        response = client.get(reverse("webchat_messages"), {"chat_id": chat.id, "branch": "all"})
+    assert response.status_code == 200
+    return json.loads(response.content), len(ctx.captured_queries)
+
+
+@pytest.mark.django_db
+def test_messages_api_query_count_does_not_grow_with_messages(client, user_chat, make_message):
+    parent = make_message(text="root")
+    make_message(text="reply", reply_to_message=parent)
+    _fetch(client, user_chat)  # warm the channel/account resolution cache
+    _, small = _fetch(client, user_chat)
+
+    for i in range(15):
+        make_message(text=f"m{i}", reply_to_message=parent, raw={"interactive_buttons": [{"text": "ok"}]})
+    data, large = _fetch(client, user_chat)
+
+    assert large == small
+    assert len(data["messages"]) == 17
+    assert data["messages"][1]["reply_to_message_id"] == parent.id
+    assert data["messages"][-1]["interactive_buttons"] == [{"text": "ok"}]
+
+
+@pytest.mark.django_db
+def test_payloads_are_cached_per_message_version(make_message):
+    from unicom.models import Message
+
+    serializer.clear_payload_cache()
+    message = make_message(text="v1")
+    first = serializer.serialize_message(message)
+    row = Message.objects.values(*serializer.MESSAGE_PAYLOAD_FIELDS).get(pk=message.pk)
+    assert serializer.serialize_message_row(row) is first
+
+    message.text = "v2"
+    message.save(update_fields=["text"])
+    message.refresh_from_db()
+    updated = serializer.serialize_message(message)
+    assert updated is not first
+    assert updated.payload["text"] == "v2"
+    assert json.loads(updated.encoded) == updated.payload
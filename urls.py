@@ -5,10 +5,12 @@ from unicom.views.email_tracking import tracking_pixel, link_click
 from .views.message_template import MessageTemplateListView, populate_message_template
 from unicom.views.inline_image import serve_inline_image
 from unicom.views.inline_image import serve_template_inline_image
+from unicom.views.inline_image import serve_message_media_variant
 from unicom.views.chat_history_view import message_as_llm_chat
 from unicom.views.webchat_views import (
     send_webchat_message_api,
     get_webchat_messages_api,
+    wait_for_webchat_messages_api,
     list_webchat_chats_api,
     update_webchat_chat_api,
     delete_webchat_chat_api,
@@ -26,9 +28,11 @@ urlpatterns = [
     path('api/message/<str:message_id>/as_llm_chat/', message_as_llm_chat, name='message_as_llm_chat'),
     path('i/<str:shortid>/', serve_inline_image, name='inline_image'),
     path('t/<str:shortid>/', serve_template_inline_image, name='template_inline_image'),
+    path('m/<path:message_id>/', serve_message_media_variant, name='message_media_variant'),
     # WebChat API endpoints
     path('webchat/send/', send_webchat_message_api, name='webchat_send'),
     path('webchat/messages/', get_webchat_messages_api, name='webchat_messages'),
+    path('webchat/wait/', wait_for_webchat_messages_api, name='webchat_wait'),
     path('webchat/chats/', list_webchat_chats_api, name='webchat_chats'),
     path('webchat/chat/<str:chat_id>/', update_webchat_chat_api, name='webchat_update_chat'),
     path('webchat/chat/<str:chat_id>/delete/', delete_webchat_chat_api, name='webchat_delete_chat'),
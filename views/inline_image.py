@@ -1,6 +1,11 @@
-from django.http import HttpResponse, Http404
-from unicom.models import EmailInlineImage
+from django.core.files.storage import default_storage
+from django.http import HttpResponse, HttpResponseNotModified, HttpResponseRedirect, Http404
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_vary_headers
+from django.utils.crypto import constant_time_compare
+from unicom.models import EmailInlineImage, Message
 from unicom.models.message_template import MessageTemplateInlineImage
+from unicom.services import image_variants
 import string
 
 def base62_decode(s):
@@ -10,6 +15,30 @@ def base62_decode(s):
         n = n * 62 + chars.index(c)
     return n
 
+def _serve_variant(request, file_field, source_hash):
+    """
+    Serve a resized variant of ``file_field`` for the ``w`` query parameter.
+    Returns None when no variant can be produced so callers can fall back to
+    the original file.
+    """
+    width = image_variants.snap_width(request.GET.get('w'))
+    fmt = image_variants.choose_variant_format(request.META.get('HTTP_ACCEPT', ''))
+    etag = f'"{source_hash[:32]}-{width}-{fmt}"'
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = HttpResponseNotModified()
+    else:
+        name = image_variants.get_or_create_variant(file_field, source_hash, width, fmt)
+        if not name:
+            return None
+        with default_storage.open(name, 'rb') as f:
+            response = HttpResponse(f.read(), content_type=image_variants.VARIANT_CONTENT_TYPES[fmt])
+        response['Content-Disposition'] = f'inline; filename="{name.split("/")[-1]}"'
+    # Variants are keyed by content hash, so they never change once rendered.
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response['ETag'] = etag
+    patch_vary_headers(response, ['Accept'])
+    return response
+
 def serve_inline_image(request, shortid):
     try:
         pk = base62_decode(shortid)
@@ -17,6 +46,11 @@ def serve_inline_image(request, shortid):
             image = EmailInlineImage.objects.get(pk=pk)
         except EmailInlineImage.DoesNotExist:
             image = MessageTemplateInlineImage.objects.get(pk=pk)
+        if request.GET.get('w'):
+            source_hash = image_variants.source_hash_for(image.file, image.hash)
+            response = _serve_variant(request, image.file, source_hash)
+            if response is not None:
+                return response
         response = HttpResponse(image.file, content_type='image/*')
         filename = image.file.name.split('/')[-1]
         response['Content-Disposition'] = f'inline; filename="{filename}"'
@@ -28,9 +62,35 @@ def serve_template_inline_image(request, shortid):
     try:
         pk = base62_decode(shortid)
         image = MessageTemplateInlineImage.objects.get(pk=pk)
+        if request.GET.get('w'):
+            source_hash = image_variants.source_hash_for(image.file, image.hash)
+            response = _serve_variant(request, image.file, source_hash)
+            if response is not None:
+                return response
         response = HttpResponse(image.file, content_type='image/*')
         filename = image.file.name.split('/')[-1]
         response['Content-Disposition'] = f'inline; filename="{filename}"'
         return response
     except (MessageTemplateInlineImage.DoesNotExist, ValueError, IndexError):
-        raise Http404('Image not found') 
\ No newline at end of file
+        raise Http404('Image not found')
+
+def serve_message_media_variant(request, message_id):
+    """
+    Resized variant of an image ``Message.media``.
+
+    GET /unicom/m/<message_id>/?w=<width>&t=<token>
+
+    ``t`` must match ``image_variants.media_token(message.media.name)``; it is
+    included in URLs built by ``image_variants.message_media_variant_url``.
+    Without Pillow (or for non-raster media) this redirects to the original file.
+    """
+    message = get_object_or_404(Message.objects.only('id', 'media', 'media_type'), id=message_id)
+    if not message.media or message.media_type != 'image':
+        raise Http404('Image not found')
+    if not constant_time_compare(request.GET.get('t', ''), image_variants.media_token(message.media.name)):
+        raise Http404('Image not found')
+    source_hash = image_variants.source_hash_for(message.media)
+    response = _serve_variant(request, message.media, source_hash)
+    if response is None:
+        return HttpResponseRedirect(message.media.url)
+    return response
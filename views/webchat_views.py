@@ -2,13 +2,30 @@
 WebChat API views.
 Handles REST API endpoints for WebChat functionality.
 """
+import base64
+import json
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Count, F, Max, Q
 from django.http import JsonResponse
+from django.utils.dateparse import parse_datetime
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.sessions.middleware import SessionMiddleware
-from unicom.models import Channel, Message, Chat, AccountChat
+from unicom.models import Message, Chat, AccountChat
 from unicom.services.webchat.save_webchat_message import save_webchat_message
 from unicom.services.webchat.get_or_create_account import get_or_create_account
+from unicom.services.webchat.resolution_cache import get_webchat_channel
+from unicom.services.message_tree import branch_context_ids
+from unicom.services.webchat.notifier import chat_notifier
+from unicom.services.webchat.conditional import compute_etag, finalize_response, not_modified_response
+from unicom.services.webchat.serialize_message import (
+    MESSAGE_PAYLOAD_FIELDS,
+    message_payload,
+    messages_json_response,
+    serialize_message,
+    serialize_message_row,
+)
 from unicom.models import CallbackExecution
 from unicom.signals import interactive_button_clicked
 
@@ -16,14 +33,9 @@ from unicom.signals import interactive_button_clicked
 def _get_webchat_channel(channel_id=None):
     """
     Get the requested active WebChat channel (if provided) or the first active one.
+    Cached briefly per process, see ``resolution_cache``.
     """
-    qs = Channel.objects.filter(platform='WebChat', active=True)
-    if channel_id:
-        qs = qs.filter(id=channel_id)
-    channel = qs.first()
-    if not channel:
-        raise ValueError("No active WebChat channel found")
-    return channel
+    return get_webchat_channel(channel_id)
 
 
 def _ensure_session(request):
@@ -134,16 +146,7 @@ def send_webchat_message_api(request):
         return JsonResponse({
             'success': True,
             'chat_id': message.chat_id,
-            'message': {
-                'id': message.id,
-                'text': message.text,
-                'timestamp': message.timestamp.isoformat(),
-                'chat_id': message.chat_id,
-                'media_type': message.media_type,
-                'media_url': message.media.url if message.media else None,
-                'is_outgoing': message.is_outgoing,
-                'sender_name': message.sender_name,
-            }
+            'message': {**message_payload(message), 'chat_id': message.chat_id},
         })
 
     except ValueError as e:
@@ -180,16 +183,10 @@ def _get_latest_branch_messages(chat, limit, before=None, after=None):
     
     # If we have messages, ensure we include the context chain
     if latest_messages and not after:
-        # Start from the latest message and follow reply_to_message chain
-        context_messages = set()
-        for msg in latest_messages:
-            current = msg
-            depth = 0
-            while current and depth < 20:  # Prevent infinite loops
-                context_messages.add(current.id)
-                current = current.reply_to_message
-                depth += 1
-        
+        # Each message's reply_to_message chain (up to 20 messages), from the
+        # materialized path or, for rows without one, a single recursive query
+        context_messages = branch_context_ids(latest_messages, max_depth=20)
+
         # Get all messages in the context chain
         chain_messages = Message.objects.filter(
             id__in=context_messages,
@@ -209,10 +206,10 @@ def _get_branch_messages(chat, branch_message_id, limit):
         branch_msg = Message.objects.get(id=branch_message_id, chat=chat)
         
         # Get all messages that share the same reply_to_message (siblings in branch)
-        if branch_msg.reply_to_message:
+        if branch_msg.reply_to_message_id:
             siblings = Message.objects.filter(
                 chat=chat,
-                reply_to_message=branch_msg.reply_to_message
+                reply_to_message_id=branch_msg.reply_to_message_id
             ).order_by('-timestamp')[:limit]
         else:
             # Root level messages
@@ -286,6 +283,12 @@ def get_webchat_messages_api(request):
         except (Chat.DoesNotExist, AccountChat.DoesNotExist):
             return JsonResponse({'error': 'Chat not found or access denied'}, status=404)
 
+        # Any message change bumps chat.updated_at, so it versions the whole history
+        etag = compute_etag('messages', account.id, chat.id, chat.updated_at, request.GET.urlencode())
+        not_modified = not_modified_response(request, 'messages', etag, chat.updated_at)
+        if not_modified:
+            return not_modified
+
         # Build query based on branch mode
         if branch_mode == 'latest':
             # Default: Only show latest branch (performance optimized)
@@ -346,30 +349,15 @@ def get_webchat_messages_api(request):
         # Reverse to get chronological order for display
         messages_list.reverse()
 
-        # Serialize messages
-        messages_data = [{
-            'id': msg.id,
-            'text': msg.text,
-            'html': msg.html,
-            'is_outgoing': msg.is_outgoing,
-            'sender_name': msg.sender_name,
-            'timestamp': msg.timestamp.isoformat(),
-            'media_type': msg.media_type,
-            'media_url': msg.media.url if msg.media else None,
-            'reply_to_message_id': msg.reply_to_message_id if msg.reply_to_message else None,
-            'interactive_buttons': msg.raw.get('interactive_buttons') if msg.raw else None,
-            'progress_updates_for_user': (msg.raw or {}).get('tool_call', {}).get('arguments', {}).get('progress_updates_for_user') if msg.media_type == 'tool_call' else None,
-            'result_status': (msg.raw or {}).get('tool_response', {}).get('result', {}).get('status') if msg.media_type == 'tool_response' else None,
-        } for msg in messages_list]
-
-        return JsonResponse({
+        # Serialize messages (cached per message version, encoded once)
+        response = messages_json_response({
             'success': True,
             'chat_id': chat_id,
-            'messages': messages_data,
             'has_more': has_more,
             'next_cursor': messages_list[0].id if messages_list and has_more else None,
             'branch_mode': branch_mode
-        })
+        }, [serialize_message(msg) for msg in messages_list])
+        return finalize_response('messages', response, etag, chat.updated_at)
 
     except ValueError as e:
         return JsonResponse({'error': str(e)}, status=400)
@@ -379,6 +367,125 @@ def get_webchat_messages_api(request):
         return JsonResponse({'error': f'Internal server error: {str(e)}'}, status=500)
 
 
+def _longpoll_timeout(request):
+    maximum = getattr(settings, 'UNICOM_WEBCHAT_LONGPOLL_TIMEOUT', 25)
+    try:
+        requested = float(request.GET.get('timeout', maximum))
+    except ValueError:
+        raise ValueError("timeout must be a number of seconds")
+    return max(0.0, min(requested, maximum))
+
+
+def _resolve_wait_request(request):
+    """Access check for the wait endpoint. Returns (chat, cursor)."""
+    _ensure_session(request)
+    channel = _get_webchat_channel(request.GET.get('channel_id'))
+    account = get_or_create_account(channel, request)
+    chat_id = request.GET.get('chat_id')
+    if not chat_id:
+        raise ValueError("chat_id is required")
+    chat = Chat.objects.filter(
+        id=chat_id, platform='WebChat', channel=channel, accountchat__account=account
+    ).first()
+    if chat is None:
+        return None, None
+    messages = Message.objects.filter(chat=chat)
+    after = request.GET.get('after')
+    cursor = None
+    if after:
+        cursor = messages.filter(id=after).values_list('timestamp', 'id').first()
+    if cursor is None:
+        # No usable cursor: wait for messages newer than the current latest one
+        cursor = messages.order_by('-timestamp', '-id').values_list('timestamp', 'id').first()
+    return chat, cursor
+
+
+def _messages_after_cursor(chat, cursor, limit):
+    """Serialized messages newer than a (timestamp, id) cursor, oldest first."""
+    messages = Message.objects.filter(chat=chat)
+    if cursor is not None:
+        timestamp, message_id = cursor
+        messages = messages.filter(
+            Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=message_id)
+        )
+    rows = messages.order_by('timestamp', 'id').values(*MESSAGE_PAYLOAD_FIELDS)[:limit]
+    return [serialize_message_row(row) for row in rows]
+
+
+@require_http_methods(["GET"])
+async def wait_for_webchat_messages_api(request):
+    """
+    Long-poll for new messages in a chat (for clients without WebSockets).
+
+    GET /unicom/webchat/wait/
+
+    Query parameters:
+        - chat_id: Chat ID (required)
+        - after: ID of the newest message the client has; defaults to the
+          chat's current latest message
+        - timeout: Seconds to hold the request open (default and max:
+          UNICOM_WEBCHAT_LONGPOLL_TIMEOUT, 25)
+        - limit: Max messages to return (default: 50, max: 200)
+
+    Returns immediately when messages newer than ``after`` exist, otherwise
+    when a new message is committed to the chat or the timeout expires. The
+    wait is parked on the chat notifier, not a database loop, and the view is
+    async so a waiting request holds no worker thread under ASGI.
+
+    Returns:
+        JSON with ``messages`` (oldest first), ``cursor`` (ID to pass as
+        ``after`` next time) and ``timed_out``
+    """
+    try:
+        timeout = _longpoll_timeout(request)
+        limit = min(int(request.GET.get('limit', 50)), 200)
+        chat, cursor = await sync_to_async(_resolve_wait_request)(request)
+        if chat is None:
+            return JsonResponse({'error': 'Chat not found or access denied'}, status=404)
+
+        waiter = chat_notifier.subscribe(chat.id)
+        try:
+            messages = await sync_to_async(_messages_after_cursor)(chat, cursor, limit)
+            timed_out = False
+            if not messages:
+                timed_out = not await waiter.wait(timeout)
+                if not timed_out:
+                    messages = await sync_to_async(_messages_after_cursor)(chat, cursor, limit)
+        finally:
+            chat_notifier.unsubscribe(waiter)
+
+        return messages_json_response({
+            'success': True,
+            'chat_id': chat.id,
+            'cursor': messages[-1].message_id if messages else (cursor[1] if cursor else None),
+            'timed_out': timed_out,
+        }, messages)
+
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return JsonResponse({'error': f'Internal server error: {str(e)}'}, status=500)
+
+
+def _encode_chat_cursor(timestamp, chat_id):
+    raw = json.dumps([timestamp.isoformat() if timestamp else None, chat_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _decode_chat_cursor(value):
+    """Return (timestamp or None, chat id) from a chats cursor, or None."""
+    if not value:
+        return None
+    try:
+        padded = value + '=' * (-len(value) % 4)
+        timestamp, chat_id = json.loads(base64.urlsafe_b64decode(padded))
+        return (parse_datetime(timestamp) if timestamp else None, str(chat_id))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+
 @require_http_methods(["GET"])
 def list_webchat_chats_api(request):
     """
@@ -388,6 +495,8 @@ def list_webchat_chats_api(request):
 
     Query parameters:
         - channel_id: Filter by channel (optional)
+        - limit: Page size (default: UNICOM_WEBCHAT_CHATS_PAGE_SIZE or 50, max: 200)
+        - cursor: Opaque ``next_cursor`` from the previous page
         - Any Chat model field for filtering (e.g., is_archived=false)
         - metadata__<key>: Filter by metadata fields (e.g., metadata__project_id=123)
         - metadata__<key>__<lookup>: Advanced lookups (e.g., metadata__priority__gte=5)
@@ -398,8 +507,11 @@ def list_webchat_chats_api(request):
         - ?metadata__department=sales - Chats for sales department
         - ?metadata__priority__gte=5 - Chats with priority >= 5
 
+    Chats are ordered by last message time (newest first, chats without
+    messages last) and paginated by keyset on (last message timestamp, id).
+
     Returns:
-        JSON with list of chats
+        JSON with list of chats, has_more and next_cursor
     """
     try:
         _ensure_session(request)
@@ -411,6 +523,10 @@ def list_webchat_chats_api(request):
         # Get account
         account = get_or_create_account(channel, request)
 
+        default_limit = getattr(settings, 'UNICOM_WEBCHAT_CHATS_PAGE_SIZE', 50)
+        limit = max(1, min(int(request.GET.get('limit', default_limit)), 200))
+        cursor = _decode_chat_cursor(request.GET.get('cursor'))
+
         # Build query for chats where user is a participant
         chats = Chat.objects.filter(
             platform='WebChat',
@@ -420,7 +536,7 @@ def list_webchat_chats_api(request):
 
         # Apply standard Chat model field filters and metadata filters
         filter_params = {}
-        reserved_params = {'channel_id', 'limit', 'offset', 'ordering'}
+        reserved_params = {'channel_id', 'limit', 'offset', 'ordering', 'cursor'}
 
         for key, value in request.GET.items():
             if key in reserved_params:
@@ -449,12 +565,36 @@ def list_webchat_chats_api(request):
         if filter_params:
             chats = chats.filter(**filter_params)
 
-        # Order by most recent
-        chats = chats.order_by('-last_message__timestamp')
+        # Version token: membership count and newest chat change (message saves bump chats)
+        version = chats.aggregate(count=Count('id'), latest=Max('updated_at'))
+        etag = compute_etag('chats', account.id, version['count'], version['latest'], request.GET.urlencode())
+        not_modified = not_modified_response(request, 'chats', etag, version['latest'])
+        if not_modified:
+            return not_modified
+
+        # Order by most recent; keyset pagination on (last message timestamp, id)
+        if cursor is not None:
+            last_ts, last_id = cursor
+            if last_ts is None:
+                chats = chats.filter(last_message__timestamp__isnull=True, id__lt=last_id)
+            else:
+                chats = chats.filter(
+                    Q(last_message__timestamp__lt=last_ts)
+                    | Q(last_message__timestamp=last_ts, id__lt=last_id)
+                    | Q(last_message__timestamp__isnull=True)
+                )
+        chats = chats.select_related('last_message').only(
+            'id', 'name', 'platform', 'channel_id', 'is_archived', 'metadata',
+            'last_message__text', 'last_message__timestamp',
+        ).order_by(F('last_message__timestamp').desc(nulls_last=True), '-id')
+
+        page = list(chats[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
 
         # Serialize chats
         chats_data = []
-        for chat in chats:
+        for chat in page:
             last_msg = chat.last_message
             chat_data = {
                 'id': chat.id,
@@ -470,10 +610,20 @@ def list_webchat_chats_api(request):
             }
             chats_data.append(chat_data)
 
-        return JsonResponse({
+        next_cursor = None
+        if has_more:
+            tail = page[-1]
+            next_cursor = _encode_chat_cursor(
+                tail.last_message.timestamp if tail.last_message else None, tail.id
+            )
+
+        response = JsonResponse({
             'success': True,
-            'chats': chats_data
+            'chats': chats_data,
+            'has_more': has_more,
+            'next_cursor': next_cursor,
         })
+        return finalize_response('chats', response, etag, version['latest'])
 
     except ValueError as e:
         return JsonResponse({'error': str(e)}, status=400)